@@ -1,4 +1,5 @@
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
 
 class CookieJWTAuthentication(JWTAuthentication):
     """JWT authentication that falls back to an access token stored in cookies.
@@ -16,4 +17,15 @@ class CookieJWTAuthentication(JWTAuthentication):
             if token:
                 # Return the header bytes as JWTAuthentication expects.
                 return f'Bearer {token}'.encode()
-        return header
\ No newline at end of file
+        return header
+
+class CookieJWTStatelessAuthentication(CookieJWTAuthentication):
+    """Cookie JWT authentication that trusts the token without loading the user.
+
+    The user is built from the token claims (see simplejwt's
+    JWTStatelessUserAuthentication), so no database query is made. Use it for
+    read-only endpoints that only need to know that the client is logged in.
+    """
+
+    def get_user(self, validated_token):
+        return api_settings.TOKEN_USER_CLASS(validated_token)
@@ -14,6 +14,12 @@ Classes:
         Extends TokenObtainPairSerializer to authenticate using an email
         instead of a username.
 
+    CookieTokenRefreshSerializer, CookieTokenBlacklistSerializer:
+        Refresh and revoke tokens checked against the Redis blacklist.
+
+    ProvisionUsersSerializer:
+        Validates a list of users to create in bulk.
+
     PasswordResetSerializer:
         Validates the email during a password reset request.
 
@@ -21,12 +27,15 @@ Classes:
         Validates new password input including confirmation matching.
 """
 
-import re
-
+from django.conf import settings
 from django.contrib.auth.models import User
 
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenBlacklistSerializer, TokenObtainPairSerializer,\
+    TokenRefreshSerializer
+
+from auth_app.tokens import BlacklistRefreshToken
+from auth_app.utils import username_from_email
 
 class RegisterSerializer(serializers.ModelSerializer):
     """
@@ -81,8 +90,7 @@ class RegisterSerializer(serializers.ModelSerializer):
         
         validated_data.pop('confirmed_password')
         email = validated_data['email']
-        base_username = re.sub(r'[^.\w@+-]', '_', email)
-        username = base_username
+        username = username_from_email(email)
 
         validated_data['username'] = username
         validated_data['is_active'] = False
@@ -95,6 +103,7 @@ class EmailLoginTokenObtainPairSerializer(TokenObtainPairSerializer):
     Authenticate users via email instead of username.
     """
 
+    token_class = BlacklistRefreshToken
     email = serializers.EmailField()
     password = serializers.CharField(write_only=True)
 
@@ -126,6 +135,33 @@ class EmailLoginTokenObtainPairSerializer(TokenObtainPairSerializer):
         })
     
 
+class CookieTokenRefreshSerializer(TokenRefreshSerializer):
+    """Issue a new access token for a refresh token that is not blacklisted."""
+    token_class = BlacklistRefreshToken
+
+
+class CookieTokenBlacklistSerializer(TokenBlacklistSerializer):
+    """Add a refresh token to the Redis blacklist."""
+    token_class = BlacklistRefreshToken
+
+
+class ProvisionUserSerializer(serializers.Serializer):
+    """Validate one user of a bulk provisioning request; the password is optional."""
+    email = serializers.EmailField()
+    password = serializers.CharField(write_only=True, required=False, allow_blank=True)
+
+
+class ProvisionUsersSerializer(serializers.Serializer):
+    """Validate a bulk provisioning request of up to PROVISION_API_MAX_USERS users."""
+    users = serializers.ListField(child=ProvisionUserSerializer(), min_length=1)
+    send_mail = serializers.BooleanField(default=True)
+
+    def validate_users(self, value):
+        if len(value) > settings.PROVISION_API_MAX_USERS:
+            raise serializers.ValidationError(f"At most {settings.PROVISION_API_MAX_USERS} users per request.")
+        return value
+
+
 class PasswordResetSerializer(serializers.Serializer):
     """Validate email for password reset request."""
     email = serializers.EmailField()
@@ -0,0 +1,156 @@
+"""
+Redis token-bucket throttles for the CPU-heavy authentication endpoints.
+
+Login, registration and password reset hash passwords or send emails, so
+bursts against them can occupy every worker. These throttles run in DRF's
+check_throttles(), before the view parses credentials, touches the database
+or hashes anything.
+
+Each request is checked against a bucket per client IP (DRF's get_ident(),
+which only trusts the X-Forwarded-For entries added by the NUM_PROXIES
+reverse proxies) and, if the request names an account (e.g. by email), a bucket per account. Both buckets are
+checked and consumed atomically by a Lua script in a single round trip.
+The rates are configured in REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"] under
+"<scope>" (per IP) and "<scope>_account" (per account).
+"""
+
+import hashlib
+import logging
+import math
+import time
+
+from django_redis import get_redis_connection
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+BUCKET_KEY = "videoflix:throttle:{scope}:{kind}:{ident}"
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# KEYS: bucket keys. ARGV[1]: current time, then capacity and refill rate
+# (tokens per second) for every key. Returns "0" if a token was taken from
+# every bucket, otherwise the seconds until the request would be allowed.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local wait = 0
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local rate = tonumber(ARGV[i * 2 + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'updated')
+    local available = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    available = math.min(capacity, available + math.max(0, now - updated) * rate)
+    if available < 1 then
+        wait = math.max(wait, (1 - available) / rate)
+    end
+    tokens[i] = available
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local rate = tonumber(ARGV[i * 2 + 1])
+    redis.call('HSET', key, 'tokens', tokens[i] - 1, 'updated', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / rate))
+end
+return '0'
+"""
+
+_token_bucket_script = None
+
+
+def get_token_bucket_script():
+    """ Register the Lua script once per process; redis-py then calls it via EVALSHA. """
+    global _token_bucket_script
+    if _token_bucket_script is None:
+        _token_bucket_script = get_redis_connection("default").register_script(TOKEN_BUCKET_SCRIPT)
+    return _token_bucket_script
+
+
+def parse_rate(rate: str):
+    """
+    Parse a DRF-style rate such as "10/min".
+
+    Returns:
+        tuple: The bucket capacity and its refill rate in tokens per second.
+    """
+    num, period = rate.split("/")
+    capacity = int(num)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttle requests with Redis token buckets per client IP and per account.
+
+    Subclasses set the rate `scope` and optionally the `account_field` of the
+    request data that names the account. If Redis is unavailable, requests are
+    allowed so an outage does not lock users out.
+    """
+
+    scope = None
+    account_field = None
+
+    def __init__(self):
+        self.retry_after = None
+
+    def get_buckets(self, request):
+        """ Return (key, capacity, refill rate) for every bucket the request has to pass. """
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        buckets = []
+
+        if rates.get(self.scope):
+            key = BUCKET_KEY.format(scope=self.scope, kind="ip", ident=self.get_ident(request))
+            buckets.append((key, *parse_rate(rates[self.scope])))
+
+        account_rate = rates.get(f"{self.scope}_account")
+        data = request.data if hasattr(request.data, "get") else {}
+        account = data.get(self.account_field) if self.account_field else None
+        if account_rate and isinstance(account, str) and account:
+            ident = hashlib.sha256(account.strip().lower().encode()).hexdigest()[:32]
+            key = BUCKET_KEY.format(scope=self.scope, kind="account", ident=ident)
+            buckets.append((key, *parse_rate(account_rate)))
+
+        return buckets
+
+    def allow_request(self, request, view):
+        buckets = self.get_buckets(request)
+        if not buckets:
+            return True
+
+        args = [time.time()]
+        for _, capacity, rate in buckets:
+            args += [capacity, rate]
+
+        try:
+            wait = float(get_token_bucket_script()(keys=[key for key, _, _ in buckets], args=args))
+        except Exception as error:
+            logger.warning("Throttle check for %s failed, allowing request: %s", self.scope, error)
+            return True
+
+        if wait > 0:
+            self.retry_after = wait
+            return False
+        return True
+
+    def wait(self):
+        return math.ceil(self.retry_after) if self.retry_after else None
+
+
+class LoginRateThrottle(TokenBucketThrottle):
+    scope = "login"
+    account_field = "email"
+
+
+class RegisterRateThrottle(TokenBucketThrottle):
+    scope = "register"
+    account_field = "email"
+
+
+class PasswordResetRateThrottle(TokenBucketThrottle):
+    scope = "password_reset"
+    account_field = "email"
@@ -5,12 +5,14 @@ This module defines the following public routes:
 - Registration and account activation
 - Email-based JWT authentication (login, refresh, logout)
 - Password reset request and confirmation
+- Bulk user provisioning for admins
 """
 
 from django.urls import path
 
 from .views import RegisterAPIView, ActivationAPIView, LoginTokenObtainPairView,\
-AccessTokenRefreshView, LogoutTokenBlacklistView, PasswordResetAPIView, PasswordResetConfirmAPIView
+AccessTokenRefreshView, LogoutTokenBlacklistView, PasswordResetAPIView, PasswordResetConfirmAPIView,\
+ProvisionUsersAPIView
 
 urlpatterns = [
     path('register/', RegisterAPIView.as_view(), name="register"),
@@ -19,5 +21,6 @@ urlpatterns = [
     path('token/refresh/', AccessTokenRefreshView.as_view(), name='token_refresh'),
     path('logout/', LogoutTokenBlacklistView.as_view(), name='logout'),
     path('password_reset/', PasswordResetAPIView.as_view(), name='password_reset'),
-    path('password_confirm/<str:uidb64>/<str:token>/', PasswordResetConfirmAPIView.as_view(), name='password_confirm')
+    path('password_confirm/<str:uidb64>/<str:token>/', PasswordResetConfirmAPIView.as_view(), name='password_confirm'),
+    path('users/provision/', ProvisionUsersAPIView.as_view(), name='provision_users')
 ]
\ No newline at end of file
@@ -6,17 +6,19 @@ This module provides:
 - Email-based login using JWT
 - Token refresh and logout
 - Password reset request and confirmation
+- Bulk user provisioning for admins
 """
 
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_decode
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.middleware.csrf import get_token
 
 from rest_framework.response import Response
 from rest_framework.generics import CreateAPIView
 from rest_framework.views import APIView
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -24,19 +26,23 @@ from rest_framework_simplejwt.views import (
 )
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework import status
-from rest_framework_simplejwt.serializers import TokenBlacklistSerializer
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.decorators import api_view
 
 from auth_app.api.serializers import PasswordResetConfirmSerializer, RegisterSerializer,\
-    EmailLoginTokenObtainPairSerializer, PasswordResetSerializer
+    EmailLoginTokenObtainPairSerializer, PasswordResetSerializer, CookieTokenRefreshSerializer,\
+    CookieTokenBlacklistSerializer, ProvisionUsersSerializer
+from auth_app.api.throttles import LoginRateThrottle, PasswordResetRateThrottle, RegisterRateThrottle
+from auth_app.provisioning import PROVISION_TASK, stash_entries
 from auth_app.utils import send_mail, create_uidb64_and_token
+from content_app.outbox import OUTBOX_JOB_ID, add_jobs
 
 class RegisterAPIView(CreateAPIView):
     """"Register a new user and trigger activation email."""
     serializer_class = RegisterSerializer
     permission_classes = [AllowAny]
     authentication_classes = []
+    throttle_classes = [RegisterRateThrottle]
 
 
 User = get_user_model()
@@ -76,6 +82,8 @@ class LoginTokenObtainPairView(TokenObtainPairView):
     """
 
     permission_classes = [AllowAny]
+    authentication_classes = []
+    throttle_classes = [LoginRateThrottle]
     serializer_class = EmailLoginTokenObtainPairSerializer
     
     def post(self, request, *args, **kwargs):
@@ -129,9 +137,11 @@ class AccessTokenRefreshView(TokenRefreshView):
     Returns:
         - New access token
     Errors:
-        - 401 if refresh token missing or invalid
+        - 401 if refresh token missing, invalid or blacklisted
     """
 
+    serializer_class = CookieTokenRefreshSerializer
+
     def post(self, request, *args, **kwargs):
         """Get refresh token from cookie, validate it, set new access cookie."""
         refresh_token = request.COOKIES.get('refresh_token')
@@ -163,7 +173,7 @@ class AccessTokenRefreshView(TokenRefreshView):
 
 class LogoutTokenBlacklistView(TokenBlacklistView):
     """
-    Log out the user by blacklisting the current refresh token.
+    Log out the user by blacklisting the current refresh token in Redis.
     Removes cookies and prevents further authenticated access.
     """
 
@@ -173,7 +183,7 @@ class LogoutTokenBlacklistView(TokenBlacklistView):
         if refresh_token is None:
             raise AuthenticationFailed("Not authenticated.")
         kwargs['data'] = {'refresh': refresh_token}
-        return TokenBlacklistSerializer(*args, **kwargs)
+        return CookieTokenBlacklistSerializer(*args, **kwargs)
 
 
     def post(self, request, *args, **kwargs):
@@ -191,6 +201,8 @@ class PasswordResetAPIView(APIView):
     Always returns success to prevent email enumeration.
     """
     permission_classes = [AllowAny]
+    authentication_classes = []
+    throttle_classes = [PasswordResetRateThrottle]
     serializer_class = PasswordResetSerializer
 
     def post(self, request, *args, **kwargs):
@@ -249,6 +261,36 @@ class PasswordResetConfirmAPIView(APIView):
         return Response({"detail": "Password has been reset successfully."}, status=status.HTTP_200_OK)
     
 
+class ProvisionUsersAPIView(APIView):
+    """
+    Create many inactive users at once and queue their activation emails (admins only).
+
+    The users are created by a background job, which hashes the passwords
+    in parallel and inserts them in batches (see auth_app.provisioning). The
+    job is written to the outbox and gets the users by an opaque reference.
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        """
+        Queue the provisioning of the submitted users.
+        Returns:
+            - 202 with the RQ job id and the number of submitted users
+            - 400 for invalid users
+            - 403 for non-admin users
+        """
+        serializer = ProvisionUsersSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        users = serializer.validated_data["users"]
+
+        token = stash_entries(users)
+        with transaction.atomic():
+            job, = add_jobs(PROVISION_TASK, [(token, serializer.validated_data["send_mail"])])
+        return Response(
+            {"job_id": OUTBOX_JOB_ID.format(id=job.id), "users": len(users)}, status=status.HTTP_202_ACCEPTED
+        )
+
+
 @api_view(['GET'])
 def csrf(request):
     """
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from auth_app.tokens import blacklist_jti
+
+OUTSTANDING_TABLE = "token_blacklist_outstandingtoken"
+BLACKLISTED_TABLE = "token_blacklist_blacklistedtoken"
+
+REVOKED_TOKENS_QUERY = f"""
+    SELECT outstanding.jti, EXTRACT(EPOCH FROM outstanding.expires_at)
+    FROM {BLACKLISTED_TABLE} blacklisted
+    JOIN {OUTSTANDING_TABLE} outstanding ON outstanding.id = blacklisted.token_id
+    WHERE outstanding.expires_at > now()
+"""
+
+
+class Command(BaseCommand):
+    """
+    Copy the revoked refresh tokens of simplejwt's token_blacklist tables to the Redis blacklist.
+
+    The tables are read with plain SQL, as the token_blacklist app is no
+    longer installed. Only tokens that have not expired yet are copied, each
+    with its remaining lifetime as TTL. Running the command again is
+    harmless; with --drop the tables and their migration records are removed
+    afterwards. Without the tables the command does nothing.
+    """
+
+    help = "Copy revoked JWTs from the token_blacklist tables to Redis and optionally drop the tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--drop", action="store_true", help="Drop the token_blacklist tables after the import.")
+
+    def handle(self, *args, **options):
+        tables = set(connection.introspection.table_names())
+        if not {OUTSTANDING_TABLE, BLACKLISTED_TABLE} <= tables:
+            self.stdout.write("No token_blacklist tables found, nothing to import.")
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute(REVOKED_TOKENS_QUERY)
+            revoked = cursor.fetchall()
+        imported = sum(blacklist_jti(jti, int(exp)) for jti, exp in revoked)
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} revoked tokens into Redis."))
+
+        if options["drop"]:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE {BLACKLISTED_TABLE}, {OUTSTANDING_TABLE}")
+                cursor.execute("DELETE FROM django_migrations WHERE app = 'token_blacklist'")
+            self.stdout.write(self.style.SUCCESS("Dropped the token_blacklist tables."))
@@ -0,0 +1,61 @@
+import csv
+import json
+import time
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+
+from auth_app.provisioning import provision_users
+
+
+def read_users(path: Path):
+    """
+    Read the users to provision, a CSV file with a header row or a JSON list of objects.
+
+    Every entry needs an "email"; "password" is optional.
+
+    Raises:
+        CommandError: If an entry has no valid email address.
+    """
+    with path.open(newline="", encoding="utf-8") as users_file:
+        entries = json.load(users_file) if path.suffix == ".json" else list(csv.DictReader(users_file))
+
+    for number, entry in enumerate(entries, start=1):
+        try:
+            validate_email(entry.get("email"))
+        except ValidationError:
+            raise CommandError(f"User entry {number} has no valid email address.")
+    return entries
+
+
+class Command(BaseCommand):
+    """
+    Create inactive users from a CSV or JSON file and queue their activation emails.
+
+    Passwords are hashed in parallel by a process pool and the users are
+    inserted with bulk_create in batches (see auth_app.provisioning). Users
+    whose email already exists are skipped, so the command can be run again
+    after an interruption. Users whose username is taken by another user are
+    skipped and logged.
+    """
+
+    help = "Provision users in bulk from a CSV or JSON file (columns: email, password)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("users", type=Path, help="CSV or JSON file with the users.")
+        parser.add_argument("--workers", type=int, help="Processes hashing passwords (default: PROVISION_WORKERS).")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Users inserted per batch.")
+        parser.add_argument("--no-email", action="store_true", help="Do not send activation emails.")
+
+    def handle(self, *args, **options):
+        entries = read_users(options["users"])
+        start = time.perf_counter()
+        result = provision_users(
+            entries, send_mail=not options["no_email"], workers=options["workers"], batch_size=options["batch_size"]
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created']} users, skipped {result['skipped']} existing and "
+            f"{result['conflicts']} with a taken username in {time.perf_counter() - start:.1f} s."
+        ))
@@ -0,0 +1,145 @@
+"""
+Bulk provisioning of user accounts, e.g. from a partner's user list.
+
+Registering users one by one costs a password hash (PBKDF2 with several
+hundred thousand iterations), an existence query and a synchronous
+activation email per user. provision_users() instead:
+
+- checks the emails and usernames of a batch with one query each,
+- hashes the passwords of a batch in parallel across a process pool,
+- inserts the batch with bulk_create (no post_save signal, so no email),
+- writes the activation emails of the batch as RQ jobs of
+  PROVISION_MAIL_BATCH_SIZE users to the outbox, in the same transaction.
+  Each job sends its emails over one mail server connection.
+
+Users without a password get an unusable one and can set one through the
+password reset after activating their account.
+
+Users submitted through the API are handed to the background job by
+reference: stash_entries() stores them in Redis for PROVISION_PAYLOAD_TTL
+seconds, the job reads them with load_entries() and removes them with
+delete_entries() once all batches are committed. A failed job can therefore
+be retried until the payload expires, and the plain passwords never end up
+in job arguments, the outbox table or a failed job, which RQ keeps for a
+year.
+"""
+
+import json
+import logging
+import secrets
+
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from content_app.outbox import add_jobs
+from core.utils import batched
+
+from .utils import username_from_email
+
+ACTIVATION_MAIL_TASK = "auth_app.tasks.send_activation_mail_batch"
+PROVISION_TASK = "auth_app.tasks.provision_users_job"
+
+PAYLOAD_KEY = "videoflix:provision:{token}"
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+def stash_entries(entries):
+    """ Store user entries for a provisioning job and return the opaque token referencing them. """
+    token = secrets.token_urlsafe(24)
+    get_redis_connection("default").set(
+        PAYLOAD_KEY.format(token=token), json.dumps(entries), ex=settings.PROVISION_PAYLOAD_TTL
+    )
+    return token
+
+
+def load_entries(token: str):
+    """
+    Read the user entries stored under `token` from Redis.
+
+    Returns:
+        list | None: The entries, or None if they expired or were processed already.
+    """
+    payload = get_redis_connection("default").get(PAYLOAD_KEY.format(token=token))
+    return json.loads(payload) if payload is not None else None
+
+
+def delete_entries(token: str):
+    """ Remove the user entries stored under `token` once their job succeeded. """
+    get_redis_connection("default").delete(PAYLOAD_KEY.format(token=token))
+
+
+def hash_passwords(passwords, executor: ProcessPoolExecutor, workers: int):
+    """ Hash the passwords in the `workers` processes of `executor`; None yields an unusable password. """
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(executor.map(make_password, passwords, chunksize=chunksize))
+
+
+def provision_users(entries, send_mail: bool = True, workers: int = None, batch_size: int = 1000):
+    """
+    Create inactive users for `entries` and queue their activation emails.
+
+    Args:
+        entries: Dicts with "email" and optionally "password".
+        send_mail: Queue activation emails for the created users.
+        workers: Processes hashing passwords (defaults to PROVISION_WORKERS).
+        batch_size: Users checked, hashed and inserted per transaction.
+
+    Returns:
+        dict: The number of users "created", "skipped" (existing or
+        duplicate emails) and in "conflict" (the username derived from the
+        email is taken by another user).
+    """
+    workers = workers or settings.PROVISION_WORKERS
+    seen_emails, seen_usernames = set(), set()
+    created = skipped = conflicts = 0
+
+    # django.setup() lets pool processes started with "spawn" (e.g. on macOS) load the settings.
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+        for batch in batched(entries, batch_size):
+            usernames = [username_from_email(entry["email"]) for entry in batch]
+            existing_emails = set(
+                User.objects.filter(email__in=[entry["email"] for entry in batch]).values_list("email", flat=True)
+            )
+            # A conflicting username would abort the bulk insert of the whole batch
+            existing_usernames = set(User.objects.filter(username__in=usernames).values_list("username", flat=True))
+            new_entries = []
+            for entry, username in zip(batch, usernames):
+                email = entry["email"]
+                if email in existing_emails or email in seen_emails:
+                    skipped += 1
+                    continue
+                seen_emails.add(email)
+                if username in existing_usernames or username in seen_usernames:
+                    logger.warning("Not provisioning %s: the username %s is taken", email, username)
+                    conflicts += 1
+                    continue
+                seen_usernames.add(username)
+                new_entries.append((entry, username))
+
+            passwords = hash_passwords(
+                [entry.get("password") or None for entry, _ in new_entries], executor, workers
+            )
+            users = [
+                User(username=username, email=entry["email"], password=password, is_active=False)
+                for (entry, username), password in zip(new_entries, passwords)
+            ]
+
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                if send_mail:
+                    add_jobs(ACTIVATION_MAIL_TASK, [
+                        ([user.id for user in mail_batch],)
+                        for mail_batch in batched(users, settings.PROVISION_MAIL_BATCH_SIZE)
+                    ])
+            created += len(users)
+
+    return {"created": created, "skipped": skipped, "conflicts": conflicts}
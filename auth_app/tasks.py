@@ -0,0 +1,49 @@
+import logging
+
+from django.contrib.auth import get_user_model
+
+from core.metrics import track_job
+
+from .provisioning import delete_entries, load_entries, provision_users
+from .utils import send_activation_mails
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+
+@track_job
+def send_activation_mail_batch(user_ids):
+    """
+    Send the activation emails of provisioned users that are not active yet.
+
+    This function is intended to run as a background task using RQ, queued
+    by provisioning.provision_users in batches of PROVISION_MAIL_BATCH_SIZE.
+
+    Returns:
+        int: The number of emails sent.
+    """
+    return send_activation_mails(User.objects.filter(id__in=user_ids, is_active=False))
+
+
+@track_job
+def provision_users_job(token, send_mail=True):
+    """
+    Provision users submitted through the admin API.
+
+    This function is intended to run as a background task using RQ. The
+    users are passed by the token of provisioning.stash_entries(), so the
+    job arguments hold no passwords. A retry skips the users created by the
+    failed attempt.
+
+    Returns:
+        dict: The counts reported by provisioning.provision_users.
+    """
+    entries = load_entries(token)
+    if entries is None:
+        logger.warning("Provisioning payload %s expired or was already processed", token)
+        return {"created": 0, "skipped": 0, "conflicts": 0}
+    # Kept until all batches are committed, so a retry of a failed job finds the users
+    result = provision_users(entries, send_mail=send_mail)
+    delete_entries(token)
+    return result
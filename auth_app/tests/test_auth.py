@@ -1,4 +1,8 @@
+import shutil
+import tempfile
 import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
 
 from django.urls import reverse
 from django.contrib.auth import get_user_model
@@ -6,10 +10,23 @@ from django.test import override_settings
 from django.core import mail
 from django.utils.http import urlsafe_base64_encode
 from django.contrib.auth.tokens import default_token_generator
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.conf import settings
+from django_redis import get_redis_connection
 
 from rest_framework.test import APITestCase
 from rest_framework import status
 
+from auth_app.api.throttles import BUCKET_KEY
+from auth_app.provisioning import (
+    ACTIVATION_MAIL_TASK, PROVISION_TASK, load_entries, provision_users, stash_entries
+)
+from auth_app.tasks import provision_users_job, send_activation_mail_batch
+from auth_app.tokens import BlacklistRefreshToken, is_blacklisted
+from content_app.models import OutboxJob
+from content_app.outbox import OUTBOX_JOB_ID
+
 User = get_user_model()
 
 class RegisterTests(APITestCase):
@@ -234,6 +251,38 @@ class LogoutTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+    def test_refresh_token_is_blacklisted_in_redis(self):
+        """The refresh token of a logged-out client cannot be used again, without any database row."""
+        self.client.post(self.login_url, {'email': self.email, 'password': self.password}, format='json')
+        refresh_token = self.client.cookies['refresh_token'].value
+
+        with self.assertNumQueries(0):
+            self.client.post(self.logout_url, format='json')
+
+        self.client.cookies['refresh_token'] = refresh_token
+        response = self.client.post(reverse('token_refresh'), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+    def test_revoked_tokens_are_imported_from_the_token_blacklist_tables(self):
+        token = BlacklistRefreshToken.for_user(self.user)
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                CREATE TABLE token_blacklist_outstandingtoken (id serial PRIMARY KEY, jti varchar(255), expires_at timestamptz);
+                CREATE TABLE token_blacklist_blacklistedtoken (id serial PRIMARY KEY, token_id integer);
+                INSERT INTO token_blacklist_outstandingtoken (jti, expires_at)
+                    VALUES (%s, now() + interval '1 hour'), ('expired', now() - interval '1 hour');
+                INSERT INTO token_blacklist_blacklistedtoken (token_id) SELECT id FROM token_blacklist_outstandingtoken;
+            """, [token['jti']])
+
+        call_command('import_token_blacklist', '--drop', stdout=MagicMock())
+
+        self.assertTrue(is_blacklisted(token['jti']))
+        self.assertFalse(is_blacklisted('expired'))
+        self.assertNotIn('token_blacklist_outstandingtoken', connection.introspection.table_names())
+
+
 class PasswordResetTests(APITestCase):
     def setUp(self):
         self.username = 'test_user'
@@ -310,4 +359,148 @@ class PasswordResetConfirmTests(APITestCase):
         
         response = self.client.post(self.url, data, format='json')
 
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(REST_FRAMEWORK={
+    **settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'login': '30/min', 'login_account': '10/min'},
+})
+class AuthThrottleTests(APITestCase):
+    def setUp(self):
+        self.url = reverse('login')
+        self.data = {'email': 'user@example.com', 'password': 'Test123$'}
+
+
+    @patch("auth_app.api.throttles.get_token_bucket_script")
+    def test_throttled_login_is_rejected_before_db_access(self, mock_script):
+        mock_script.return_value.return_value = b"1.5"
+
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url, self.data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '2')
+        keys = mock_script.return_value.call_args.kwargs['keys']
+        self.assertEqual(len(keys), 2)
+
+
+    @patch("auth_app.api.throttles.get_token_bucket_script")
+    def test_login_allowed_when_redis_unavailable(self, mock_script):
+        mock_script.return_value.side_effect = ConnectionError("Redis down")
+
+        response = self.client.post(self.url, self.data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+    def test_spoofed_forwarded_for_does_not_escape_the_ip_bucket(self):
+        ip_bucket = BUCKET_KEY.format(scope="login", kind="ip", ident="127.0.0.1")
+        get_redis_connection("default").delete(ip_bucket)
+        self.addCleanup(get_redis_connection("default").delete, ip_bucket)
+        rest_framework = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'login': '2/min'}}
+
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            responses = [
+                self.client.post(
+                    self.url, {'email': f'user{index}@example.com', 'password': 'x'}, format='json',
+                    HTTP_X_FORWARDED_FOR=f'10.0.0.{index}',
+                )
+                for index in range(3)
+            ]
+
+        self.assertNotEqual(responses[1].status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(responses[2].status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+class ProvisionUsersTests(APITestCase):
+    def setUp(self):
+        self.existing = User.objects.create_user(username='existing', password='Test123$', email='existing@example.com')
+        self.url = reverse('provision_users')
+
+
+    @override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend", PROVISION_MAIL_BATCH_SIZE=1)
+    def test_command_creates_inactive_users_and_queues_activation_mails(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        users_file = Path(directory) / "users.csv"
+        users_file.write_text(
+            "email,password\nnew@example.com,Secret123$\nexisting@example.com,x\n"
+            "new@example.com,again\nnopassword@example.com,\n"
+        )
+
+        with self.captureOnCommitCallbacks():
+            call_command('provision_users', users_file, '--workers', '2', stdout=MagicMock())
+
+        new_user = User.objects.get(email='new@example.com')
+        self.assertFalse(new_user.is_active)
+        self.assertTrue(new_user.check_password('Secret123$'))
+        self.assertFalse(User.objects.get(email='nopassword@example.com').has_usable_password())
+        self.assertEqual(User.objects.filter(email='existing@example.com').count(), 1)
+
+        jobs = OutboxJob.objects.filter(task=ACTIVATION_MAIL_TASK)
+        self.assertEqual(jobs.count(), 2)
+        mail.outbox = []
+        for job in jobs:
+            send_activation_mail_batch(*job.args)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['new@example.com', 'nopassword@example.com'])
+
+
+    def test_taken_usernames_are_reported_instead_of_aborting_the_batch(self):
+        User.objects.create_user(username='taken@example.com', password='Test123$', email='other@example.com')
+        entries = [
+            {'email': 'taken@example.com'},
+            {'email': 'a b@example.com'},
+            {'email': 'a_b@example.com'},
+            {'email': 'fine@example.com'},
+        ]
+
+        with self.assertLogs('auth_app.provisioning', 'WARNING'):
+            result = provision_users(entries, send_mail=False, workers=1)
+
+        self.assertEqual(result, {'created': 2, 'skipped': 0, 'conflicts': 2})
+        self.assertTrue(User.objects.filter(email='a b@example.com').exists())
+        self.assertTrue(User.objects.filter(email='fine@example.com').exists())
+
+
+    def test_api_is_admin_only_and_enqueues_a_job_without_passwords(self):
+        data = {'users': [{'email': 'partner@example.com', 'password': 'Secret123$'}]}
+
+        self.client.force_authenticate(self.existing)
+        self.assertEqual(self.client.post(self.url, data, format='json').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.existing.is_staff = True
+        self.existing.save()
+        response = self.client.post(self.url, data, format='json')
+
+        job = OutboxJob.objects.get(task=PROVISION_TASK)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data, {'job_id': OUTBOX_JOB_ID.format(id=job.id), 'users': 1})
+        self.assertNotIn('Secret123$', str(job.args))
+
+        self.assertEqual(provision_users_job(*job.args), {'created': 1, 'skipped': 0, 'conflicts': 0})
+        self.assertTrue(User.objects.get(email='partner@example.com').check_password('Secret123$'))
+        # The payload is removed with the first run.
+        self.assertEqual(provision_users_job(*job.args), {'created': 0, 'skipped': 0, 'conflicts': 0})
+
+
+    def test_payload_is_kept_for_a_retry_when_the_job_fails(self):
+        token = stash_entries([{'email': 'retry@example.com', 'password': 'Secret123$'}])
+
+        with patch('auth_app.tasks.provision_users', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                provision_users_job(token, send_mail=False)
+
+        self.assertEqual(provision_users_job(token, send_mail=False), {'created': 1, 'skipped': 0, 'conflicts': 0})
+        self.assertIsNone(load_entries(token))
+
+
+class EnsureSuperuserTests(APITestCase):
+
+    @patch.dict('os.environ', {'DJANGO_SUPERUSER_USERNAME': 'root', 'DJANGO_SUPERUSER_PASSWORD': 'Root123$'})
+    def test_superuser_is_created_once(self):
+        call_command('ensure_superuser', stdout=MagicMock())
+        call_command('ensure_superuser', stdout=MagicMock())
+
+        superuser = User.objects.get(username='root')
+        self.assertTrue(superuser.is_superuser)
+        self.assertTrue(superuser.check_password('Root123$'))
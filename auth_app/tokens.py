@@ -0,0 +1,63 @@
+"""
+Refresh token blacklist in Redis.
+
+A revoked refresh token is stored by its JTI under BLACKLIST_KEY with a TTL
+equal to the token's remaining lifetime, so entries disappear once the token
+would have expired anyway. Checking a token is one EXISTS call; issuing a
+token writes nothing.
+
+This replaces simplejwt's token_blacklist app, which stored an
+OutstandingToken row for every login and a BlacklistedToken row for every
+logout. Revocations still stored in its tables are copied to Redis by the
+import_token_blacklist command.
+"""
+
+import time
+
+from django_redis import get_redis_connection
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+BLACKLIST_KEY = "videoflix:jwt:blacklist:{jti}"
+
+
+def blacklist_jti(jti: str, exp: int):
+    """
+    Revoke the token `jti` until its expiry time `exp` (seconds since the epoch).
+
+    Returns:
+        bool: False if the token has already expired and nothing was stored.
+    """
+    ttl = int(exp - time.time())
+    if ttl <= 0:
+        return False
+    get_redis_connection("default").set(BLACKLIST_KEY.format(jti=jti), 1, ex=ttl)
+    return True
+
+
+def is_blacklisted(jti: str):
+    return bool(get_redis_connection("default").exists(BLACKLIST_KEY.format(jti=jti)))
+
+
+class BlacklistRefreshToken(RefreshToken):
+    """ Refresh token that is checked against and revoked in the Redis blacklist. """
+
+    def verify(self, *args, **kwargs):
+        self.check_blacklist()
+        super().verify(*args, **kwargs)
+
+    def check_blacklist(self):
+        """
+        Raises:
+            TokenError: If the token was revoked.
+        """
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError("Token is blacklisted")
+
+    def blacklist(self):
+        blacklist_jti(self.payload[api_settings.JTI_CLAIM], self.payload["exp"])
+
+    def outstand(self):
+        # Issued tokens are not tracked, only revoked ones (called on rotation).
+        return None
@@ -1,8 +1,9 @@
 import os
+import re
 
 from django.conf import settings
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode
 
@@ -29,6 +30,11 @@ def get_content(uidb64, token, instance, content_type):
             return (subject, text_content, html_content)
 
 
+def username_from_email(email):
+    """ Derive the username of a new user from the email address. """
+    return re.sub(r'[^.\w@+-]', '_', email)
+
+
 def create_uidb64_and_token(instance):
     """ Generate a base64-encoded user ID and a secure token for email links. """
     uidb64 = urlsafe_base64_encode(str(instance.pk).encode('utf-8'))
@@ -36,11 +42,27 @@ def create_uidb64_and_token(instance):
     return (uidb64, token)
 
 
-def send_mail(uidb64, token, instance, content_type):
-    """ Send an email (HTML + text fallback) with activation or password reset content. """
+def build_mail(uidb64, token, instance, content_type):
+    """ Build an email (HTML + text fallback) with activation or password reset content. """
     subject, text_content, html_content = get_content(uidb64, token, instance, content_type)
     from_email = os.getenv("DEFAULT_FROM_EMAIL", "team@videoflix.com")
     to = instance.email
     msg = EmailMultiAlternatives(subject, text_content, from_email, [to])
     msg.attach_alternative(html_content, "text/html")
-    msg.send()
\ No newline at end of file
+    return msg
+
+
+def send_mail(uidb64, token, instance, content_type):
+    """ Send an email (HTML + text fallback) with activation or password reset content. """
+    build_mail(uidb64, token, instance, content_type).send()
+
+
+def send_activation_mails(users):
+    """
+    Send the activation emails of many users over a single mail server connection.
+
+    Returns:
+        int: The number of emails sent.
+    """
+    messages = [build_mail(*create_uidb64_and_token(user), user, 'activate_account') for user in users]
+    return get_connection().send_messages(messages) or 0
\ No newline at end of file
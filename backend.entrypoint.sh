@@ -2,6 +2,15 @@
 
 set -e
 
+# Role of this container:
+#   release    one-time tasks of a deployment (see the release command), then exit
+#   web        gunicorn only
+#   worker     RQ worker of the default queue only
+#   scheduler  periodic jobs and the RQ worker executing them
+#   serve      web, worker and scheduler in one container, without the release tasks
+#   all        release, then serve (default, for local development)
+ROLE="${1:-all}"
+
 echo "Warte auf PostgreSQL auf $DB_HOST:$DB_PORT..."
 
 # -q für "quiet" (keine Ausgabe außer Fehlern)
@@ -13,31 +22,43 @@ done
 
 echo "PostgreSQL ist bereit - fahre fort..."
 
-# Deine originalen Befehle (ohne wait_for_db)
-python manage.py collectstatic --noinput
-python manage.py makemigrations
-python manage.py migrate
-
-# Create a superuser using environment variables
-# (Dein Superuser-Erstellungs-Code bleibt gleich)
-python manage.py shell <<EOF
-import os
-from django.contrib.auth import get_user_model
-
-User = get_user_model()
-username = os.environ.get('DJANGO_SUPERUSER_USERNAME', 'admin')
-email = os.environ.get('DJANGO_SUPERUSER_EMAIL', 'admin@example.com')
-password = os.environ.get('DJANGO_SUPERUSER_PASSWORD', 'adminpassword')
-
-if not User.objects.filter(username=username).exists():
-    print(f"Creating superuser '{username}'...")
-    # Korrekter Aufruf: username hier übergeben
-    User.objects.create_superuser(username=username, email=email, password=password)
-    print(f"Superuser '{username}' created.")
-else:
-    print(f"Superuser '{username}' already exists.")
-EOF
-
-python manage.py rqworker default &
+# Prometheus metrics of all gunicorn and RQ worker processes are collected in
+# this directory and aggregated by /metrics. It is a volume shared by all
+# containers of a deployment (see docker-compose.yml), so only the release
+# tasks, which run before any other process starts, remove the stale files of
+# the previous run.
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/videoflix-metrics}"
+if [ "$ROLE" = "release" ] || [ "$ROLE" = "all" ]; then
+  find "$PROMETHEUS_MULTIPROC_DIR" -mindepth 1 -delete 2>/dev/null || true
+fi
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
 
-exec gunicorn core.wsgi:application --bind 0.0.0.0:8000 --reload
+case "$ROLE" in
+  release)
+    exec python manage.py release
+    ;;
+  web)
+    exec gunicorn core.wsgi:application --bind 0.0.0.0:8000
+    ;;
+  worker)
+    exec python manage.py rqworker default
+    ;;
+  scheduler)
+    python manage.py rqworker periodic &
+    exec python manage.py run_periodic_jobs
+    ;;
+  serve|all)
+    # "all" (the default) runs the release tasks first, "serve" only boots the processes
+    if [ "$ROLE" = "all" ]; then
+      python manage.py release
+    fi
+    python manage.py rqworker default &
+    python manage.py rqworker periodic &
+    python manage.py run_periodic_jobs &
+    exec gunicorn core.wsgi:application --bind 0.0.0.0:8000
+    ;;
+  *)
+    echo "Unbekannte Rolle: $ROLE (release, web, worker, scheduler, serve oder all)"
+    exit 1
+    ;;
+esac
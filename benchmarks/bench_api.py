@@ -0,0 +1,181 @@
+"""
+Load benchmarks of the API endpoints against a live server.
+
+The suite seeds BENCH_USERS users and BENCH_VIDEOS videos, each with a
+synthetic HLS tree, starts Django's threaded live server on the test
+database and drives login, catalog listing, playlist and segment requests
+through benchmarks.loadgen. It reports p50/p99 latency and requests per
+second per scenario and fails if a scenario regressed against
+benchmarks/baseline.json by more than BENCH_TOLERANCE.
+
+Run it with (the file name pattern keeps it out of the functional tests):
+
+    python manage.py test benchmarks --pattern="bench_*.py"
+
+Set BENCH_UPDATE_BASELINE=True to store the results as the new baseline.
+Baselines are only compared when they were recorded with the same settings.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import urllib.request
+from http.cookies import SimpleCookie
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.test import LiveServerTestCase, override_settings
+from django.urls import reverse
+
+from content_app.models import Video
+
+from .loadgen import compare, load_baseline, run_load, save_baseline, send, summarize
+
+User = get_user_model()
+
+BASELINE_PATH = Path(os.environ.get("BENCH_BASELINE") or Path(__file__).resolve().parent / "baseline.json")
+PASSWORD = "Bench123$"
+RESOLUTION = "720p"
+
+CONFIG = {
+    "users": int(os.environ.get("BENCH_USERS", default=50)),
+    "videos": int(os.environ.get("BENCH_VIDEOS", default=100)),
+    "segments": int(os.environ.get("BENCH_SEGMENTS", default=10)),
+    "segment_kb": int(os.environ.get("BENCH_SEGMENT_KB", default=512)),
+    "requests": int(os.environ.get("BENCH_REQUESTS", default=400)),
+    "login_requests": int(os.environ.get("BENCH_LOGIN_REQUESTS", default=40)),
+    "concurrency": int(os.environ.get("BENCH_CONCURRENCY", default=8)),
+}
+TOLERANCE = float(os.environ.get("BENCH_TOLERANCE", default="0.5"))
+UPDATE_BASELINE = os.environ.get("BENCH_UPDATE_BASELINE", default="False") == "True"
+
+# The throttles stay in the request path, but with rates the benchmark cannot exhaust.
+UNLIMITED_RATES = {
+    scope: "1000000/s"
+    for scope in ("login", "login_account", "register", "register_account", "password_reset", "password_reset_account")
+}
+
+
+def write_hls_tree(media_root: Path, video_ids, segments: int, segment_kb: int):
+    """
+    Write a master playlist, a media playlist and `segments` segments per video.
+
+    All segments are hard links of one file of random bytes, so seeding a
+    large catalog costs little disk space.
+    """
+    template = media_root / "segment.ts"
+    template.write_bytes(os.urandom(segment_kb * 1024))
+    media_playlist = "#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:3\n#EXT-X-PLAYLIST-TYPE:VOD\n" + "".join(
+        f"#EXTINF:3.000000,\nindex{number}.ts\n" for number in range(segments)
+    ) + "#EXT-X-ENDLIST\n"
+
+    for video_id in video_ids:
+        out_dir = media_root / f"video/{video_id}/{RESOLUTION}"
+        out_dir.mkdir(parents=True)
+        (out_dir.parent / "index.m3u8").write_text(
+            f"#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=1280x720\n{RESOLUTION}/index.m3u8"
+        )
+        (out_dir / "index.m3u8").write_text(media_playlist)
+        for number in range(segments):
+            os.link(template, out_dir / f"index{number}.ts")
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": UNLIMITED_RATES})
+class APIBenchmark(LiveServerTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = Path(tempfile.mkdtemp(prefix="videoflix-bench-"))
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+        super().setUpClass()
+
+
+    def setUp(self):
+        password = make_password(PASSWORD)
+        User.objects.bulk_create([
+            User(username=f"bench{index}", email=f"bench{index}@example.com", password=password)
+            for index in range(CONFIG["users"])
+        ])
+        videos = Video.objects.bulk_create([
+            Video(
+                title=f"Benchmark Video {index}",
+                description="Synthetic video for the benchmark suite.",
+                thumbnail_url="video/thumbnails/bench.jpg",
+                category=f"Category {index % 10}",
+                original_file="video/originals/bench.mp4",
+                status="ready",
+            )
+            for index in range(CONFIG["videos"])
+        ])
+        self.video_ids = [video.id for video in videos]
+        write_hls_tree(self.media_root, self.video_ids, CONFIG["segments"], CONFIG["segment_kb"])
+        self.cookie = self.login(0)
+
+
+    def login_request(self, index: int):
+        body = json.dumps({"email": f"bench{index % CONFIG['users']}@example.com", "password": PASSWORD}).encode()
+        return urllib.request.Request(
+            self.live_server_url + reverse("login"), data=body, headers={"Content-Type": "application/json"}
+        )
+
+
+    def login(self, index: int):
+        """ Log in once and return the Cookie header carrying the access token. """
+        with urllib.request.urlopen(self.login_request(index)) as response:
+            cookies = SimpleCookie()
+            for header in response.headers.get_all("Set-Cookie"):
+                cookies.load(header)
+        return f"access_token={cookies['access_token'].value}"
+
+
+    def get_request(self, path: str):
+        return urllib.request.Request(self.live_server_url + path, headers={"Cookie": self.cookie})
+
+
+    def scenarios(self):
+        """ Return (name, request factory, number of requests) for every benchmarked endpoint. """
+        videos = self.video_ids
+        segments = CONFIG["segments"]
+        return [
+            ("login", self.login_request, CONFIG["login_requests"]),
+            ("video_list", lambda index: self.get_request(reverse("video-list")), CONFIG["requests"]),
+            ("playlist", lambda index: self.get_request(
+                reverse("video-playlist", args=[videos[index % len(videos)], RESOLUTION])
+            ), CONFIG["requests"]),
+            ("segment", lambda index: self.get_request(
+                reverse("video-segment", args=[
+                    videos[index // segments % len(videos)], RESOLUTION, f"index{index % segments}.ts"
+                ])
+            ), CONFIG["requests"]),
+        ]
+
+
+    def test_api_benchmark(self):
+        results = {}
+        for name, make_request, total in self.scenarios():
+            # One warm-up request so connection setup and imports are not measured
+            send(make_request(0))
+            results[name] = summarize(run_load(make_request, total, CONFIG["concurrency"]))
+
+        print(f"\n{'scenario':<12} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9} {'errors':>7}")
+        for name, result in results.items():
+            print(f"{name:<12} {result['p50_ms']:>9} {result['p99_ms']:>9} {result['rps']:>9} {result['errors']:>7}")
+
+        for name, result in results.items():
+            self.assertEqual(result["errors"], 0, f"{name}: {result['errors']} requests failed")
+
+        if UPDATE_BASELINE:
+            save_baseline(BASELINE_PATH, results, CONFIG)
+            print(f"Baseline written to {BASELINE_PATH}")
+            return
+
+        if BASELINE_PATH.exists() and json.loads(BASELINE_PATH.read_text())["config"] != CONFIG:
+            print("Baseline was recorded with other BENCH_* settings, skipping the comparison.")
+            return
+
+        regressions = compare(results, load_baseline(BASELINE_PATH), TOLERANCE)
+        self.assertFalse(regressions, "Performance regressions:\n" + "\n".join(regressions))
@@ -0,0 +1,86 @@
+"""
+Latency saved per request by persistent database and pooled Redis connections.
+
+Every iteration simulates the connection handling of one request: Django's
+request_started/request_finished handlers (close_old_connections) around one
+query, and one Redis command. It is run once with a new connection per
+request (CONN_MAX_AGE=0, a new Redis client) and once with the production
+profile (CONN_MAX_AGE with health checks, the shared Redis pool).
+
+Run it with:
+
+    python manage.py test benchmarks.bench_connections --pattern="bench_*.py"
+"""
+
+import os
+import time
+
+import redis
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.test import TransactionTestCase
+from django_redis import get_redis_connection
+
+from .loadgen import percentile
+
+ITERATIONS = int(os.environ.get("BENCH_CONNECTION_ITERATIONS", default=300))
+
+
+def measure(request):
+    """ Return the p50 and p99 latency in milliseconds of ITERATIONS calls of `request`. """
+    latencies = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        request()
+        latencies.append(time.perf_counter() - start)
+    return round(percentile(latencies, 0.5) * 1000, 3), round(percentile(latencies, 0.99) * 1000, 3)
+
+
+class ConnectionBenchmark(TransactionTestCase):
+
+    def setUp(self):
+        self.conn_max_age = connection.settings_dict["CONN_MAX_AGE"]
+
+
+    def tearDown(self):
+        connection.settings_dict["CONN_MAX_AGE"] = self.conn_max_age
+        connection.close()
+
+
+    def database_request(self):
+        close_old_connections()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        close_old_connections()
+
+
+    def test_connection_reuse(self):
+        connection.settings_dict["CONN_MAX_AGE"] = 0
+        connection.close()
+        db_new = measure(self.database_request)
+        connection.settings_dict["CONN_MAX_AGE"] = 600
+        connection.close()
+        db_persistent = measure(self.database_request)
+
+        location = settings.CACHES["default"]["LOCATION"]
+
+        def redis_request():
+            client = redis.Redis.from_url(location, single_connection_client=True)
+            client.ping()
+            client.close()
+
+        redis_new = measure(redis_request)
+        pooled = get_redis_connection("default")
+        redis_pooled = measure(pooled.ping)
+
+        print(f"\n{'connection':<22} {'p50 ms':>9} {'p99 ms':>9}")
+        for name, (p50, p99) in (
+            ("postgres new", db_new), ("postgres persistent", db_persistent),
+            ("redis new", redis_new), ("redis pooled", redis_pooled),
+        ):
+            print(f"{name:<22} {p50:>9} {p99:>9}")
+        print(f"saved per request: postgres {round(db_new[0] - db_persistent[0], 3)} ms, "
+              f"redis {round(redis_new[0] - redis_pooled[0], 3)} ms")
+
+        self.assertLess(db_persistent[0], db_new[0])
+        self.assertLess(redis_pooled[0], redis_new[0])
@@ -0,0 +1,116 @@
+"""
+Cold-start-to-first-request time of a web process.
+
+Every run starts a new interpreter that loads the WSGI application the way
+a gunicorn worker does (core.wsgi, including the warm-up of all views) and
+answers one request to the video list without credentials. It reports:
+
+    boot           importing core.wsgi, i.e. Django setup and warm-up
+    first_request  handling the first request after the boot
+    cold_start     from spawning the process until the response is returned
+
+as p50/p99 over BENCH_STARTUP_RUNS runs, and fails if a scenario regressed
+against benchmarks/startup_baseline.json by more than BENCH_TOLERANCE.
+
+Run it with:
+
+    python manage.py test benchmarks.bench_startup --pattern="bench_*.py"
+
+Set BENCH_UPDATE_BASELINE=True to store the results as the new baseline.
+The import time per module of a slow boot is reported by the
+profile_startup command.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from .loadgen import compare, load_baseline, save_baseline, summarize
+
+BASELINE_PATH = Path(
+    os.environ.get("BENCH_STARTUP_BASELINE") or Path(__file__).resolve().parent / "startup_baseline.json"
+)
+
+CONFIG = {
+    "runs": int(os.environ.get("BENCH_STARTUP_RUNS", default=5)),
+}
+TOLERANCE = float(os.environ.get("BENCH_TOLERANCE", default="0.5"))
+UPDATE_BASELINE = os.environ.get("BENCH_UPDATE_BASELINE", default="False") == "True"
+
+# Run in the new interpreter: boot the WSGI application and send it one request.
+FIRST_REQUEST_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from core.wsgi import application
+booted = time.perf_counter()
+
+from wsgiref.util import setup_testing_defaults
+environ = {"PATH_INFO": sys.argv[1], "REMOTE_ADDR": "127.0.0.1"}
+setup_testing_defaults(environ)
+statuses = []
+body = b"".join(application(environ, lambda status, headers: statuses.append(status)))
+answered = time.perf_counter()
+
+print(json.dumps({"boot": booted - start, "first_request": answered - booted, "status": statuses[0]}), flush=True)
+"""
+
+
+def start_and_request(path: str):
+    """
+    Boot a web process, send it one request to `path` and return its timings in seconds.
+
+    Returns:
+        dict: "boot", "first_request" and "cold_start" (spawn to response) in
+        seconds, and the "status" line of the response.
+    """
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": "core.settings"}
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", FIRST_REQUEST_SCRIPT, path],
+        stdout=subprocess.PIPE, text=True, env=env, cwd=settings.BASE_DIR,
+    )
+    line = process.stdout.readline()
+    cold_start = time.perf_counter() - start
+    process.communicate()
+    if process.returncode != 0 or not line:
+        raise RuntimeError(f"Web process exited with code {process.returncode}")
+    return {**json.loads(line), "cold_start": cold_start}
+
+
+class StartupBenchmark(SimpleTestCase):
+
+    def test_startup_benchmark(self):
+        path = reverse("video-list")
+        runs = [start_and_request(path) for _ in range(CONFIG["runs"])]
+
+        results = {}
+        for name in ("boot", "first_request", "cold_start"):
+            latencies = [run[name] for run in runs]
+            errors = sum(not run["status"].startswith("401") for run in runs)
+            results[name] = summarize({"latencies": latencies, "wall": sum(latencies), "errors": errors})
+
+        print(f"\n{'scenario':<14} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for name, result in results.items():
+            print(f"{name:<14} {result['p50_ms']:>9} {result['p99_ms']:>9} {result['errors']:>7}")
+
+        for name, result in results.items():
+            self.assertEqual(result["errors"], 0, f"{name}: unexpected responses to {path}")
+
+        if UPDATE_BASELINE:
+            save_baseline(BASELINE_PATH, results, CONFIG)
+            print(f"Baseline written to {BASELINE_PATH}")
+            return
+
+        if BASELINE_PATH.exists() and json.loads(BASELINE_PATH.read_text())["config"] != CONFIG:
+            print("Baseline was recorded with other BENCH_* settings, skipping the comparison.")
+            return
+
+        regressions = compare(results, load_baseline(BASELINE_PATH), TOLERANCE)
+        self.assertFalse(regressions, "Performance regressions:\n" + "\n".join(regressions))
@@ -0,0 +1,102 @@
+"""
+A small closed-loop load generator for the benchmark suite.
+
+Every worker thread sends its next request as soon as the previous one
+finished, so the measured requests per second are the throughput the server
+sustains at the given concurrency.
+"""
+
+import json
+import math
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def send(request: urllib.request.Request):
+    """
+    Send one request and read the whole response body.
+
+    Returns:
+        tuple: The status code and the latency in seconds.
+    """
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as error:
+        error.read()
+        status = error.code
+    return status, time.perf_counter() - start
+
+
+def run_load(make_request, total: int, concurrency: int):
+    """
+    Send `total` requests built by `make_request(index)` from `concurrency` threads.
+
+    Returns:
+        dict: The latencies of all requests, the wall-clock duration and the
+        number of responses that were not 2xx.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda index: send(make_request(index)), range(total)))
+    wall = time.perf_counter() - start
+
+    return {
+        "latencies": [latency for _, latency in results],
+        "wall": wall,
+        "errors": sum(1 for status, _ in results if not 200 <= status < 300),
+    }
+
+
+def percentile(values, fraction: float):
+    """ Return the nearest-rank percentile of `values`, e.g. fraction 0.99 for p99. """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(run):
+    """ Reduce a run to p50/p99 latency in milliseconds and requests per second. """
+    return {
+        "p50_ms": round(percentile(run["latencies"], 0.5) * 1000, 2),
+        "p99_ms": round(percentile(run["latencies"], 0.99) * 1000, 2),
+        "rps": round(len(run["latencies"]) / run["wall"], 1),
+        "requests": len(run["latencies"]),
+        "errors": run["errors"],
+    }
+
+
+def compare(results, baseline, tolerance: float):
+    """
+    Compare benchmark results with a baseline.
+
+    A scenario regressed if its p50 or p99 latency grew, or its requests per
+    second dropped, by more than `tolerance` (e.g. 0.5 for 50%).
+
+    Returns:
+        list[str]: A description of every regression, empty if there is none.
+    """
+    regressions = []
+    for scenario, current in results.items():
+        previous = baseline.get(scenario)
+        if previous is None:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            if current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{scenario}: {metric} {previous[metric]} -> {current[metric]}")
+        if current["rps"] < previous["rps"] / (1 + tolerance):
+            regressions.append(f"{scenario}: rps {previous['rps']} -> {current['rps']}")
+    return regressions
+
+
+def load_baseline(path):
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())["scenarios"]
+
+
+def save_baseline(path, results, config):
+    path.write_text(json.dumps({"config": config, "scenarios": results}, indent=2) + "\n")
@@ -1,11 +1,138 @@
-from django.contrib import admin
+from functools import partial
+
+import django_rq
+from django.contrib import admin, messages
+from django.contrib.postgres.search import SearchQuery
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.utils.functional import cached_property
+from rq.command import send_stop_job_command
+from rq.exceptions import InvalidJobOperation, NoSuchJobError
+
+from core.utils import batched
+
+from .models import SEARCH_CONFIG, Video
+from .outbox import TRANSCODE_TASK, add_jobs
+
+# Videos updated and enqueued per transaction by the bulk actions.
+ACTION_BATCH_SIZE = 500
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that takes the row count of an unfiltered changelist from the table statistics.
+
+    COUNT(*) scans the whole table in Postgres; the planner's estimate is
+    good enough for the page links. Filtered changelists are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if not query.where:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s", [query.model._meta.db_table])
+                row = cursor.fetchone()
+            # reltuples is -1 until the table was first analysed.
+            if row and row[0] >= 0:
+                return int(row[0])
+        return super().count
+
+
+def enqueue_transcodes(queryset, statuses, **fields):
+    """
+    Reset the videos of `queryset` with one of `statuses` to "pending" and enqueue their transcoding.
+
+    Videos are updated in batches of ACTION_BATCH_SIZE. The jobs of a batch
+    are written to the outbox in its transaction and enqueued with one
+    pipelined Redis call after the commit.
+
+    Args:
+        fields: Further fields to reset on the videos.
+
+    Returns:
+        int: The number of videos enqueued.
+    """
+    ids = list(queryset.filter(status__in=statuses).values_list("id", flat=True))
+    enqueued = 0
+    for batch in batched(ids, ACTION_BATCH_SIZE):
+        with transaction.atomic():
+            # The status is checked again under the row lock; rows locked elsewhere are skipped.
+            batch = list(
+                Video.objects.select_for_update(skip_locked=True)
+                .filter(id__in=batch, status__in=statuses)
+                .values_list("id", flat=True)
+            )
+            Video.objects.filter(id__in=batch).update(status="pending", transcode_attempts=0, **fields)
+            add_jobs(TRANSCODE_TASK, [(video_id,) for video_id in batch])
+        enqueued += len(batch)
+    return enqueued
+
+
+def stop_transcode_jobs(job_ids):
+    """ Stop the given transcode jobs on the workers running them. """
+    redis = django_rq.get_connection("default")
+    for job_id in job_ids:
+        try:
+            send_stop_job_command(redis, job_id)
+        except (NoSuchJobError, InvalidJobOperation):
+            # Finished or not started yet; a queued job skips videos that are not pending.
+            pass
 
-from .models import Video
 
 @admin.register(Video)
 class VideoAdmin(admin.ModelAdmin):
-    list_display = ("id", "title", "status", "created_at")
-    list_filter = ("status", "created_at")
+    list_display = ("id", "title", "status", "playable", "storage_bytes", "created_at")
+    list_filter = ("status", "playable", "created_at", "encode_extra_codecs")
     search_fields = ("title", "description")
+    # Video has no foreign keys; nothing to join.
+    list_select_related = False
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    actions = ("retranscode", "retry_failed", "cancel")
+
+    readonly_fields = ("status", "playable", "storage_bytes", "import_key")
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer("search_vector", "encoding_profile")
+
+    def get_search_results(self, request, queryset, search_term):
+        """ Search with the full-text index instead of a LIKE scan over title and description. """
+        if not search_term:
+            return queryset, False
+        query = SearchQuery(search_term, search_type="websearch", config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=query), False
+
+    @admin.action(description="Re-transcode selected videos with the current encoding settings")
+    def retranscode(self, request, queryset):
+        """
+        Transcode ready and failed videos again, including the per-title analysis.
+
+        Renditions whose encode command and source did not change are kept
+        (see utils.get_encode_fingerprint).
+        """
+        count = enqueue_transcodes(queryset, ["ready", "failed"], encoding_profile={})
+        self.message_user(request, f"Enqueued {count} videos for transcoding.", messages.SUCCESS)
+
+    @admin.action(description="Retry failed videos")
+    def retry_failed(self, request, queryset):
+        count = enqueue_transcodes(queryset, ["failed"])
+        self.message_user(request, f"Enqueued {count} failed videos again.", messages.SUCCESS)
 
-    readonly_fields = ("status",)
\ No newline at end of file
+    @admin.action(description="Cancel transcoding of selected videos")
+    def cancel(self, request, queryset):
+        """ Mark pending and processing videos as failed and stop their running jobs. """
+        count = 0
+        ids = list(queryset.filter(status__in=["pending", "processing"]).values_list("id", flat=True))
+        for batch in batched(ids, ACTION_BATCH_SIZE):
+            with transaction.atomic():
+                videos = list(
+                    Video.objects.select_for_update()
+                    .filter(id__in=batch, status__in=["pending", "processing"])
+                    .values_list("id", "status", "transcode_job_id")
+                )
+                Video.objects.filter(id__in=[video_id for video_id, _, _ in videos]).update(status="failed")
+                job_ids = [job_id for _, status, job_id in videos if status == "processing" and job_id]
+                transaction.on_commit(partial(stop_transcode_jobs, job_ids), robust=True)
+            count += len(videos)
+        self.message_user(request, f"Cancelled {count} videos.", messages.SUCCESS)
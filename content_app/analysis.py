@@ -0,0 +1,190 @@
+import re
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .utils import DEFAULT_CODEC, RESOLUTIONS, VIDEO_CODECS
+
+QUALITY_PATTERNS = {
+    "ssim": re.compile(r"All:([\d.]+)"),
+    "vmaf": re.compile(r"VMAF score: ([\d.]+)"),
+}
+
+# Valid quality targets per metric (exclusive minimum, inclusive maximum). SSIM
+# scores range from 0 to 1 and VMAF from 0 to 100, but a VMAF target of 1 or
+# less is refused, as it is an SSIM target left over after switching metrics.
+QUALITY_SCALES = {"ssim": (0.0, 1.0), "vmaf": (1.0, 100.0)}
+
+
+def get_duration(input_path: str):
+    """ Return the duration of a media file in seconds using ffprobe. """
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", input_path],
+        check=True, capture_output=True, text=True
+    )
+    return float(result.stdout.strip())
+
+
+def get_sample_offsets(duration: float, count: int, seconds: float):
+    """ Spread `count` sample windows of `seconds` length evenly across the video. """
+    if duration <= seconds:
+        return [0.0]
+    return [
+        round(min(max(duration * (index + 0.5) / count - seconds / 2, 0.0), duration - seconds), 3)
+        for index in range(count)
+    ]
+
+
+def encode_sample(input_path: str, offset: float, seconds: float, size: str, crf: int, output_path: Path,
+                  maxrate=None):
+    """
+    Trial-encode one sample window at the given CRF, capped at `maxrate` bit/s if given.
+
+    The cap is applied like in the final encode (see utils.get_rate_control).
+
+    Returns:
+        float: The bitrate of the encoded sample in bits per second.
+    """
+    cmd = [
+        "ffmpeg", "-v", "error", "-y",
+        "-ss", str(offset), "-t", str(seconds),
+        "-i", input_path,
+        "-an",
+        "-vf", f"scale={size}",
+        "-pix_fmt", "yuv420p",
+        *VIDEO_CODECS[DEFAULT_CODEC]["args"],
+        "-crf", str(crf),
+        *(["-maxrate", str(maxrate), "-bufsize", str(maxrate * 2)] if maxrate else []),
+        str(output_path)
+    ]
+    subprocess.run(cmd, check=True)
+    return output_path.stat().st_size * 8 / seconds
+
+
+def measure_quality(input_path: str, offset: float, seconds: float, size: str, sample_path: Path):
+    """
+    Score an encoded sample against the scaled source with SSIM or VMAF.
+
+    Raises:
+        ValueError: If ffmpeg did not report a score.
+    """
+    metric = settings.PER_TITLE_METRIC
+    filter_name = "libvmaf" if metric == "vmaf" else "ssim"
+    cmd = [
+        "ffmpeg", "-hide_banner",
+        "-i", str(sample_path),
+        "-ss", str(offset), "-t", str(seconds),
+        "-i", input_path,
+        "-lavfi", f"[1:v]scale={size},format=yuv420p[ref];[0:v][ref]{filter_name}",
+        "-f", "null", "-"
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    match = QUALITY_PATTERNS[metric].search(result.stderr)
+    if not match:
+        raise ValueError(f"ffmpeg did not report a {metric} score")
+    return float(match.group(1))
+
+
+def probe(input_path: str, offsets, seconds: float, size: str, work_dir: Path, crf: int, maxrate=None):
+    """
+    Encode and score all sample windows at one CRF and optional bitrate cap.
+
+    Returns:
+        dict: The "crf", the average "bitrate" (bit/s) and "quality" score, and
+        the "maxrate" if the samples were capped.
+    """
+    bitrates, scores = [], []
+    for index, offset in enumerate(offsets):
+        sample_path = work_dir / f"{size}_{crf}_{index}_{maxrate or 0}.mp4"
+        bitrates.append(encode_sample(input_path, offset, seconds, size, crf, sample_path, maxrate))
+        scores.append(measure_quality(input_path, offset, seconds, size, sample_path))
+
+    result = {
+        "crf": crf,
+        "bitrate": int(sum(bitrates) / len(bitrates)),
+        "quality": round(sum(scores) / len(scores), 4),
+    }
+    if maxrate:
+        result["maxrate"] = maxrate
+    return result
+
+
+def analyse_rendition(input_path: str, offsets, seconds: float, size: str, work_dir: Path):
+    """
+    Find the cheapest CRF and bitrate cap whose samples meet the quality target for one resolution.
+
+    The quality falls with the CRF, so the cheapest CRF candidate whose average
+    score reaches PER_TITLE_QUALITY_TARGET is found by bisection, with about
+    log2(candidates) probes instead of one per candidate. If none reaches the
+    target, the best-quality candidate is used.
+
+    The final encode caps the bitrate, so the caps PER_TITLE_MAXRATE_FACTORS
+    times the measured bitrate are probed at the chosen CRF as well, lowest
+    first, and the first one still reaching the target is taken (the highest
+    one if none does).
+
+    Returns:
+        dict: The chosen "crf" and "maxrate" (bit/s) with the average "bitrate"
+        (bit/s) and "quality" score of its samples.
+    """
+    target = settings.PER_TITLE_QUALITY_TARGET
+    candidates = sorted(settings.PER_TITLE_CRF_CANDIDATES, reverse=True)
+    probes = {}
+    low, high = 0, len(candidates) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        probes[middle] = probe(input_path, offsets, seconds, size, work_dir, candidates[middle])
+        if probes[middle]["quality"] >= target:
+            high = middle - 1
+        else:
+            low = middle + 1
+    # `low` is the cheapest candidate reaching the target; past the end if none does
+    choice = probes[min(low, len(candidates) - 1)]
+
+    factors = sorted(settings.PER_TITLE_MAXRATE_FACTORS)
+    if choice["quality"] < target:
+        return {**choice, "maxrate": int(choice["bitrate"] * factors[-1])}
+    for factor in factors:
+        capped = probe(input_path, offsets, seconds, size, work_dir, choice["crf"], int(choice["bitrate"] * factor))
+        if capped["quality"] >= target:
+            return capped
+    return capped
+
+
+def analyse_title(input_path: str):
+    """
+    Run the per-title analysis for every resolution of the H.264 ladder.
+
+    Short sample scenes are trial-encoded at the CRF candidates and bitrate
+    caps and scored, so static content gets a lower bitrate than high-motion
+    content at the same visual quality. The resolutions are analysed by
+    PER_TITLE_WORKERS threads in parallel, as the work is done by ffmpeg.
+
+    Returns:
+        dict: The encoding profile, mapping resolution labels to the values
+        returned by analyse_rendition().
+
+    Raises:
+        ImproperlyConfigured: If PER_TITLE_QUALITY_TARGET is outside the scale of PER_TITLE_METRIC.
+        subprocess.CalledProcessError: If ffprobe or ffmpeg fails.
+    """
+    minimum, maximum = QUALITY_SCALES[settings.PER_TITLE_METRIC]
+    if not minimum < settings.PER_TITLE_QUALITY_TARGET <= maximum:
+        raise ImproperlyConfigured(
+            f"PER_TITLE_QUALITY_TARGET {settings.PER_TITLE_QUALITY_TARGET} is not a {settings.PER_TITLE_METRIC} score"
+        )
+
+    seconds = settings.PER_TITLE_SAMPLE_SECONDS
+    offsets = get_sample_offsets(get_duration(input_path), settings.PER_TITLE_SAMPLES, seconds)
+
+    with tempfile.TemporaryDirectory(prefix="videoflix-analysis-") as work_dir:
+        with ThreadPoolExecutor(max_workers=settings.PER_TITLE_WORKERS) as executor:
+            choices = executor.map(
+                lambda size: analyse_rendition(input_path, offsets, seconds, size, Path(work_dir)),
+                RESOLUTIONS.values(),
+            )
+            return dict(zip(RESOLUTIONS, choices))
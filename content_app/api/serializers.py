@@ -10,4 +10,49 @@ class VideoListSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = Video
-        fields = ['id', 'created_at', 'title', 'description', 'thumbnail_url', 'category']
\ No newline at end of file
+        fields = ['id', 'created_at', 'title', 'description', 'thumbnail_url', 'category']
+
+
+class VideoSearchQuerySerializer(serializers.Serializer):
+    """
+    Validate the query parameters of the video search.
+
+    `q` uses the web search syntax ("quoted phrases", -excluded, or).
+    `cursor` is the `next` value of the previous page.
+    """
+    q = serializers.CharField(max_length=200)
+    category = serializers.CharField(max_length=100, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+    cursor = serializers.CharField(required=False)
+
+
+class VideoSearchResultSerializer(VideoListSerializer):
+    """ Serialize a search hit with its relevance rank. """
+    rank = serializers.FloatField()
+
+    class Meta(VideoListSerializer.Meta):
+        fields = VideoListSerializer.Meta.fields + ['rank']
+
+
+class VideoSuggestQuerySerializer(serializers.Serializer):
+    """ Validate the query parameters of the title suggestions. """
+    q = serializers.CharField(max_length=100)
+    limit = serializers.IntegerField(min_value=1, max_value=20, default=10)
+
+
+class WatchProgressSerializer(serializers.Serializer):
+    """
+    Validate a playback heartbeat.
+
+    The position is given in seconds. Setting completed removes the video
+    from the continue-watching list.
+    """
+    position = serializers.FloatField(min_value=0)
+    completed = serializers.BooleanField(default=False)
+
+
+class ContinueWatchingSerializer(serializers.Serializer):
+    """ Serialize an entry of the continue-watching list. """
+    video_id = serializers.IntegerField()
+    position = serializers.FloatField()
+    updated_at = serializers.DateTimeField()
\ No newline at end of file
@@ -1,9 +1,15 @@
 from django.urls import path
 
-from .views import VideoListAPIView, video_playlist_view, video_segment_view
+from .views import ContinueWatchingAPIView, VideoListAPIView, VideoSearchAPIView, VideoSuggestAPIView,\
+    WatchProgressAPIView, video_master_playlist_view, video_playlist_view, video_segment_view
 
 urlpatterns = [
     path('video/', VideoListAPIView.as_view(), name="video-list"),
+    path('video/search/', VideoSearchAPIView.as_view(), name="video-search"),
+    path('video/suggest/', VideoSuggestAPIView.as_view(), name="video-suggest"),
+    path('video/continue-watching/', ContinueWatchingAPIView.as_view(), name="continue-watching"),
+    path('video/<int:movie_id>/progress/', WatchProgressAPIView.as_view(), name="watch-progress"),
+    path('video/<int:movie_id>/index.m3u8', video_master_playlist_view, name='video-master-playlist'),
     path('video/<int:movie_id>/<str:resolution>/index.m3u8', video_playlist_view, name='video-playlist'),
     path('video/<int:movie_id>/<str:resolution>/<str:segment>/', video_segment_view, name='video-segment')
 ]
\ No newline at end of file
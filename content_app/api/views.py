@@ -1,57 +1,259 @@
+import base64
+import json
 from pathlib import Path
 
-from django.http import FileResponse, Http404
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+from django.http import Http404
 from django.conf import settings
 
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import ListAPIView
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from content_app.models import Video
-from content_app.api.serializers import VideoListSerializer
+from auth_app.api.permissions import CookieJWTStatelessAuthentication
+from content_app.models import SEARCH_CONFIG, Video
+from content_app.api.serializers import ContinueWatchingSerializer, VideoListSerializer, VideoSearchQuerySerializer,\
+    VideoSearchResultSerializer, VideoSuggestQuerySerializer, WatchProgressSerializer
+from content_app.progress import get_continue_watching, record_progress
+from content_app.streaming import SEGMENT_CONTENT_TYPES, byte_range_response, playlist_response,\
+    segment_file_response
+from content_app.typeahead import get_suggestions
+from content_app.utils import COMPLETE_MARKER, FMP4_FILENAME
 
 class VideoListAPIView(ListAPIView):
     """
-    API view to list all videos.
+    API view to list all playable videos.
 
     Returns a list of video objects serialized with VideoListSerializer.
+    A video is listed as soon as its first rendition is published, while
+    the higher renditions may still be encoding.
     Access is restricted to authenticated users.
     """
 
-    queryset = Video.objects.all()
+    queryset = Video.objects.filter(playable=True)
     serializer_class = VideoListSerializer
     permission_classes = [IsAuthenticated]
 
 
+def encode_cursor(rank: float, video_id: int):
+    return base64.urlsafe_b64encode(json.dumps([rank, video_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """
+    Decode a search cursor into the rank and id of the last video of the previous page.
+
+    Raises:
+        ValidationError: If the cursor is malformed.
+    """
+    try:
+        rank, video_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank), int(video_id)
+    except (ValueError, TypeError):
+        raise ValidationError({"cursor": "Invalid cursor."})
+
+
+class VideoSearchAPIView(APIView):
+    """
+    Full-text search over title, category and description of the playable videos.
+
+    Matches are looked up in the GIN index on Video.search_vector and ordered
+    by relevance (title matches weigh most). Pages are fetched with keyset
+    pagination on (rank, id), so deep pages cost the same as the first one.
+    Access is restricted to authenticated users.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Search the catalog.
+        Returns:
+            - 200 with "results" and the "next" cursor (null on the last page)
+            - 400 for missing or invalid parameters
+        """
+        params = VideoSearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+
+        query = SearchQuery(data["q"], search_type="websearch", config=SEARCH_CONFIG)
+        videos = (
+            Video.objects
+            .filter(playable=True, search_vector=query)
+            # ts_rank() returns a real; as double precision the rank survives the
+            # round trip through the cursor exactly.
+            .annotate(rank=Cast(SearchRank(F("search_vector"), query), FloatField()))
+            .defer("search_vector", "encoding_profile")
+        )
+        if "category" in data:
+            videos = videos.filter(category=data["category"])
+        if "cursor" in data:
+            rank, video_id = decode_cursor(data["cursor"])
+            videos = videos.filter(Q(rank__lt=rank) | Q(rank=rank, id__lt=video_id))
+
+        page = list(videos.order_by("-rank", "-id")[:data["limit"] + 1])
+        has_next = len(page) > data["limit"]
+        page = page[:data["limit"]]
+
+        return Response({
+            "results": VideoSearchResultSerializer(page, many=True).data,
+            "next": encode_cursor(page[-1].rank, page[-1].id) if has_next else None,
+        })
+
+
+class VideoSuggestAPIView(APIView):
+    """
+    Title suggestions while typing.
+
+    Suggestions come from the in-memory prefix index of the worker (see
+    content_app.typeahead) and the user is taken from the access token, so a
+    request does not query the database. Access is restricted to authenticated users.
+    """
+
+    authentication_classes = [CookieJWTStatelessAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Suggest videos with a title word starting with `q`.
+        Returns:
+            - 200 with a list of {"id", "title"}
+            - 400 for missing or invalid parameters
+        """
+        params = VideoSuggestQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return Response(get_suggestions(params.validated_data["q"], params.validated_data["limit"]))
+
+
+class WatchProgressAPIView(APIView):
+    """
+    Accept playback heartbeats for a video.
+
+    Heartbeats are stored in Redis only and written to Postgres in bulk by the
+    periodic flush_watch_progress job. Access is restricted to authenticated users.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, movie_id: int):
+        """
+        Record the current playback position.
+        Returns:
+            - 202 when the heartbeat was accepted
+            - 400 for an invalid position
+            - 404 if the video does not exist
+        """
+        serializer = WatchProgressSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            record_progress(
+                user_id=request.user.pk,
+                video_id=movie_id,
+                position=serializer.validated_data["position"],
+                completed=serializer.validated_data["completed"]
+            )
+        except Video.DoesNotExist:
+            raise Http404("Video not found")
+        return Response(status=status.HTTP_202_ACCEPTED)
+
+
+class ContinueWatchingAPIView(APIView):
+    """
+    List the videos the user started but did not finish, most recent first.
+
+    The list is served from Redis. Access is restricted to authenticated users.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        entries = get_continue_watching(request.user.pk)
+        return Response(ContinueWatchingSerializer(entries, many=True).data)
+
+
+def video_master_playlist_view(request, movie_id: int):
+    """
+    Serve the HLS master playlist of a video, listing its published renditions.
+
+    The playlist is rewritten atomically whenever a rendition finishes
+    encoding, so it grows from the lowest resolution up.
+
+    Raises:
+        Http404: If no rendition is published yet.
+
+    Returns:
+        FileResponse: Returns the playlist file with content type 'application/vnd.apple.mpegurl',
+        brotli or gzip compressed if the client accepts it.
+    """
+    playlist_path = Path(settings.MEDIA_ROOT) / f"video/{movie_id}/index.m3u8"
+    try:
+        return playlist_response(request, playlist_path)
+    except FileNotFoundError:
+        raise Http404("Playlist not found")
+
+
 def video_playlist_view(request, movie_id: int, resolution: str):
     """
     Serve the HLS playlist (.m3u8) for a given video and resolution.
 
+    Only published renditions are served; a rendition that is still
+    encoding has no completion marker yet.
+
     Raises:
-        Http404: If the playlist file does not exist.
+        Http404: If the playlist file does not exist or the rendition is not finished.
 
     Returns:
-        FileResponse: Returns the playlist file with content type 'application/vnd.apple.mpegurl'.
+        FileResponse: Returns the playlist file with content type 'application/vnd.apple.mpegurl',
+        brotli or gzip compressed if the client accepts it.
     """
 
-    playlist_path = Path(settings.MEDIA_ROOT) / f"video/{movie_id}/{resolution}/index.m3u8"
-    if not playlist_path.exists():
+    rendition_dir = Path(settings.MEDIA_ROOT) / f"video/{movie_id}/{resolution}"
+    playlist_path = rendition_dir / "index.m3u8"
+    if not (rendition_dir / COMPLETE_MARKER).exists():
         raise Http404("Playlist not found")
 
-    return FileResponse(open(playlist_path, "rb"), content_type="application/vnd.apple.mpegurl")
+    try:
+        return playlist_response(request, playlist_path)
+    except FileNotFoundError:
+        raise Http404("Playlist not found")
 
 
 def video_segment_view(request, movie_id: int, resolution: str, segment: str):
     """
-    Serve a video segment (.ts) for HLS streaming.
+    Serve a video segment for HLS streaming.
+
+    Segments are either single .ts files, fMP4 segments (.m4s) with their init.mp4
+    for HEVC/AV1 renditions or, in "fmp4" output mode, byte ranges of the
+    rendition's fragmented MP4 file requested with a Range header.
+    Sequentially played streams get the following segments prefetched, and
+    hot segments are served from the shared segment cache when it is enabled.
 
     Raises:
         Http404: If the segment file does not exist.
 
     Returns:
-        FileResponse: Returns the video segment file with content type 'video/mp2t'.
+        FileResponse: Returns the video segment file with a content type matching its extension.
+        HttpResponse: Returns the requested byte range with content type 'video/mp4'.
     """
-    segment_path = Path(settings.MEDIA_ROOT) / f"video/{movie_id}/{resolution}/{segment}"
-    if not segment_path.exists():
+    # Hidden files such as the rendition's completion marker are no segments
+    if segment.startswith("."):
         raise Http404("Segment not found")
 
-    return FileResponse(open(segment_path, "rb"), content_type="video/mp2t")
\ No newline at end of file
+    segment_path = Path(settings.MEDIA_ROOT) / f"video/{movie_id}/{resolution}/{segment}"
+    stream_key = (request.META.get("REMOTE_ADDR"), movie_id, resolution)
+    cache_key = f"{movie_id}/{resolution}/{segment}"
+
+    try:
+        if segment == FMP4_FILENAME:
+            return byte_range_response(request, segment_path, "video/mp4", stream_key, cache_key)
+
+        content_type = SEGMENT_CONTENT_TYPES.get(segment_path.suffix, "video/mp2t")
+        return segment_file_response(segment_path, content_type, stream_key, cache_key)
+    except FileNotFoundError:
+        raise Http404("Segment not found")
\ No newline at end of file
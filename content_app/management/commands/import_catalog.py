@@ -0,0 +1,172 @@
+import csv
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from content_app.media_gc import ORIGINALS_DIR, THUMBNAILS_DIR
+from content_app.models import Video
+from content_app.outbox import TRANSCODE_TASK, add_jobs
+from core.utils import batched
+
+
+def read_manifest(path: Path):
+    """
+    Read the catalog manifest, a CSV file with a header row or a JSON list of objects.
+
+    Every entry needs "file" (relative to the import directory) and "title";
+    "description", "category" and "thumbnail" are optional.
+    """
+    with path.open(newline="", encoding="utf-8") as manifest:
+        entries = json.load(manifest) if path.suffix == ".json" else list(csv.DictReader(manifest))
+
+    for number, entry in enumerate(entries, start=1):
+        if not entry.get("file") or not entry.get("title"):
+            raise CommandError(f"Manifest entry {number} needs a file and a title.")
+    return entries
+
+
+def get_content_digest(path: Path):
+    with path.open("rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def get_source(directory: Path, file: str):
+    """
+    Return the resolved path of a file of the import directory.
+
+    Raises:
+        CommandError: If the file does not exist or lies outside `directory`.
+    """
+    source = (directory / file).resolve()
+    if not source.is_relative_to(directory.resolve()):
+        raise CommandError(f"File outside the import directory: {file}")
+    if not source.is_file():
+        raise CommandError(f"File not found: {source}")
+    return source
+
+
+def get_import_key(source: Path):
+    """
+    Return a key of an imported file that is cheap to compute.
+
+    The key is derived from the path, size and modification time instead of
+    the content, so a re-run finds imported videos without reading their files.
+    """
+    stat = source.stat()
+    return hashlib.sha256(f"{source}\0{stat.st_size}\0{stat.st_mtime_ns}".encode()).hexdigest()
+
+
+def place_file(source: Path, media_dir: str):
+    """
+    Make a file of the import directory available below MEDIA_ROOT and return its name for a FileField.
+
+    Files already below MEDIA_ROOT are used in place. Others are hard-linked
+    to `media_dir`/<content hash>/<file name> if possible, otherwise copied.
+    As the name depends on the content, files of different videos never
+    overwrite each other, and a file already in place with the same size is
+    the same file, so an interrupted import does not copy it again.
+    """
+    media_root = Path(settings.MEDIA_ROOT).resolve()
+    if source.is_relative_to(media_root):
+        return source.relative_to(media_root).as_posix()
+
+    name = f"{media_dir}/{get_content_digest(source)[:32]}/{source.name}"
+    target = media_root / name
+    if target.exists() and target.stat().st_size == source.stat().st_size:
+        return name
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.unlink(missing_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        # Copied under a temporary name, so an interrupted copy is never taken for the file
+        temp_target = target.with_name(f".{target.name}.tmp")
+        shutil.copyfile(source, temp_target)
+        os.replace(temp_target, target)
+    return name
+
+
+class Command(BaseCommand):
+    """
+    Import a catalog of videos from a directory and a manifest.
+
+    Videos are created with bulk_create in batches, which bypasses the
+    post_save signal. The transcode jobs of a batch are written to the outbox
+    in the same transaction and enqueued with a single pipelined Redis call
+    after the commit. Imported videos are not playable yet, so their titles
+    reach the suggestion index only once transcoding makes them playable.
+    Videos are matched by the path, size and modification time of their
+    original file before it is read and then by its content, so running the
+    command again, e.g. after an interrupted run, skips imported titles
+    without hashing their files again. Duplicate manifest entries are created
+    once.
+    """
+
+    help = "Import videos from a directory and a CSV or JSON manifest and enqueue their transcoding."
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", type=Path, help="Directory containing the video and thumbnail files.")
+        parser.add_argument("manifest", type=Path, help="CSV or JSON manifest describing the videos.")
+        parser.add_argument("--batch-size", type=int, default=500, help="Videos created and enqueued per batch.")
+        parser.add_argument("--no-transcode", action="store_true", help="Only create the videos.")
+
+    def handle(self, *args, **options):
+        directory = options["directory"]
+        entries = read_manifest(options["manifest"])
+        created = processed = 0
+
+        # Import keys and original files of all videos of this run, so duplicate entries are created once
+        seen_keys, seen_names = set(), set()
+        for batch in batched(entries, options["batch_size"]):
+            sources = {}
+            for entry in batch:
+                source = get_source(directory, entry["file"])
+                sources.setdefault(get_import_key(source), (source, entry))
+            keys = set(sources) - seen_keys
+            seen_keys |= keys
+            keys -= set(Video.objects.filter(import_key__in=keys).values_list("import_key", flat=True))
+
+            # Only the files of new entries are hashed and placed
+            videos = []
+            for key, (source, entry) in sources.items():
+                if key not in keys:
+                    continue
+                thumbnail = entry.get("thumbnail")
+                videos.append(Video(
+                    title=entry["title"],
+                    description=entry.get("description") or "",
+                    category=entry.get("category") or "",
+                    original_file=place_file(source, ORIGINALS_DIR),
+                    thumbnail_url=place_file(get_source(directory, thumbnail), THUMBNAILS_DIR) if thumbnail else "",
+                    import_key=key,
+                ))
+
+            # The same content under another path, or a video imported before import keys were stored
+            names = {video.original_file.name for video in videos} - seen_names
+            seen_names |= names
+            names -= set(Video.objects.filter(original_file__in=names).values_list("original_file", flat=True))
+            new_videos = []
+            for video in videos:
+                if video.original_file.name in names:
+                    names.discard(video.original_file.name)
+                    new_videos.append(video)
+
+            with transaction.atomic():
+                Video.objects.bulk_create(new_videos, batch_size=options["batch_size"])
+                if not options["no_transcode"]:
+                    add_jobs(TRANSCODE_TASK, [(video.id,) for video in new_videos])
+            created += len(new_videos)
+            processed += len(batch)
+
+            self.stdout.write(f"Processed {processed} of {len(entries)} videos")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created} videos, skipped {len(entries) - created} existing or duplicate."
+        ))
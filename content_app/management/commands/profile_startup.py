@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from core.startup import STARTUP_TARGETS, group_by_package, profile_imports
+
+
+class Command(BaseCommand):
+    """
+    Report the import time per module and package of a fresh web or worker process.
+
+    The target is started in a new interpreter with `python -X importtime`,
+    so modules already imported by this command do not hide any cost.
+    Times are the module's own import time ("self"), without the modules it
+    imports in turn, and the cumulative time including them.
+    """
+
+    help = "Profile the import time of a fresh web or worker process per module and package."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", choices=STARTUP_TARGETS, default="web",
+                            help="Process to profile: Django setup only, a web worker or an RQ worker.")
+        parser.add_argument("--limit", type=int, default=20, help="Number of modules and packages listed.")
+
+    def handle(self, *args, **options):
+        imports, wall = profile_imports(options["target"])
+        total_us = sum(self_us for _, self_us, _, _ in imports)
+        limit = options["limit"]
+
+        self.stdout.write(
+            f"{options['target']}: {len(imports)} modules imported in {total_us / 1000:.1f} ms, "
+            f"process wall time {wall * 1000:.1f} ms"
+        )
+
+        self.stdout.write(f"\n{'package':<40} {'self ms':>9}")
+        for package, self_us in group_by_package(imports)[:limit]:
+            self.stdout.write(f"{package:<40} {self_us / 1000:>9.1f}")
+
+        self.stdout.write(f"\n{'module':<60} {'self ms':>9} {'cumul. ms':>10}")
+        for module, self_us, cumulative_us, _ in sorted(imports, key=lambda entry: entry[1], reverse=True)[:limit]:
+            self.stdout.write(f"{module:<60} {self_us / 1000:>9.1f} {cumulative_us / 1000:>10.1f}")
@@ -0,0 +1,23 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Run the one-time tasks of a deployment in one process.
+
+    Static files are collected, migrations applied, revoked tokens left in
+    the old token_blacklist tables imported and the superuser created. Run it
+    once per release (the "release" role of the Docker entrypoint), not on
+    every replica start. Running the steps in one process sets up Django
+    once instead of once per manage.py call.
+    """
+
+    help = "Collect static files, apply migrations and create the superuser."
+
+    def handle(self, *args, **options):
+        call_command("collectstatic", interactive=False, verbosity=options["verbosity"])
+        call_command("migrate", interactive=False, verbosity=options["verbosity"])
+        # Revoked tokens left in the old token_blacklist tables (no-op once they are dropped)
+        call_command("import_token_blacklist")
+        call_command("ensure_superuser")
@@ -0,0 +1,38 @@
+import time
+
+import django_rq
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+
+LOCK_KEY = "videoflix:periodic:{job}"
+
+
+class Command(BaseCommand):
+    """
+    Enqueue the jobs in RQ_PERIODIC_JOBS into the "periodic" RQ queue at their interval.
+
+    A Redis key with the job's interval as expiry guards every enqueue, so
+    several replicas running this command still enqueue each job only once
+    per interval. The jobs themselves are executed by an rqworker for the
+    "periodic" queue, so they are not delayed by long transcodes in "default".
+    """
+
+    help = "Enqueue the periodic background jobs from RQ_PERIODIC_JOBS."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Enqueue due jobs once and exit.")
+
+    def handle(self, *args, **options):
+        queue = django_rq.get_queue("periodic")
+        redis = get_redis_connection("default")
+
+        while True:
+            for job, interval in settings.RQ_PERIODIC_JOBS.items():
+                if redis.set(LOCK_KEY.format(job=job), 1, nx=True, ex=interval):
+                    queue.enqueue(job)
+                    self.stdout.write(f"Enqueued {job}")
+
+            if options["once"]:
+                return
+            time.sleep(1)
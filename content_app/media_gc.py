@@ -0,0 +1,214 @@
+"""
+Garbage collection and storage accounting of the media volume.
+
+collect_media() reconciles the files below MEDIA_ROOT with the Video rows:
+
+    video/<id>/            HLS output; removed if the video does not exist,
+                           rendition directories of a ready video that its
+                           master playlist does not list are removed (e.g.
+                           after re-transcoding with another ladder)
+    video/originals/...    source files; removed if no video references them
+    video/thumbnails/...   thumbnails; removed if no video references them
+
+Directories are read with os.scandir() and reconciled in batches of
+MEDIA_GC_BATCH_SIZE entries, so neither the tree nor the video table is
+loaded at once. Deletions pause for MEDIA_GC_THROTTLE_MS after every batch
+of files to leave IO bandwidth to the segment requests. Files younger than
+MEDIA_GC_GRACE_SECONDS are kept, as an upload writes its file before the
+video row is committed.
+
+With MEDIA_COLD_STORAGE_ROOT set, originals of videos that are ready for
+MEDIA_COLD_AFTER_DAYS are moved there under the same name (see
+utils.get_original_path). The disk usage of every video is stored in
+Video.storage_bytes.
+"""
+
+import os
+import shutil
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.utils import batched
+
+from .models import Video
+from .utils import get_original_path, read_master_entries
+
+ORIGINALS_DIR = "video/originals"
+THUMBNAILS_DIR = "video/thumbnails"
+
+
+class Throttle:
+    """ Sleep for `pause` seconds after every `batch_size` IO operations. """
+
+    def __init__(self, batch_size: int, pause: float):
+        self.batch_size = batch_size
+        self.pause = pause
+        self.operations = 0
+
+    def tick(self):
+        self.operations += 1
+        if self.pause > 0 and self.operations % self.batch_size == 0:
+            time.sleep(self.pause)
+
+
+def is_expired(entry: os.DirEntry, grace: float):
+    return time.time() - entry.stat(follow_symlinks=False).st_mtime > grace
+
+
+def iter_files(path: Path, prefix: str):
+    """ Yield (name relative to MEDIA_ROOT, DirEntry) for every file below `path`, depth first. """
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                name = f"{prefix}/{entry.name}"
+                if entry.is_dir(follow_symlinks=False):
+                    yield from iter_files(Path(entry.path), name)
+                else:
+                    yield name, entry
+    except FileNotFoundError:
+        return
+
+
+def tree_size(path: Path):
+    """ Return the total size in bytes of the files below `path`. """
+    return sum(entry.stat(follow_symlinks=False).st_size for _, entry in iter_files(path, ""))
+
+
+def remove_tree(path: Path, throttle: Throttle):
+    """
+    Delete a directory tree file by file, throttled.
+
+    Returns:
+        int: The number of bytes freed.
+    """
+    freed = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                freed += remove_tree(Path(entry.path), throttle)
+            else:
+                freed += entry.stat(follow_symlinks=False).st_size
+                os.unlink(entry.path)
+                throttle.tick()
+    os.rmdir(path)
+    return freed
+
+
+def original_size(video: Video):
+    if not video.original_file:
+        return 0
+    try:
+        return get_original_path(video.original_file.name).stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def collect_video_dirs(media_root: Path, stats: dict, throttle: Throttle):
+    """ Remove HLS output of deleted videos and stale renditions, and record the disk usage of the others. """
+    grace = settings.MEDIA_GC_GRACE_SECONDS
+    try:
+        entries = os.scandir(media_root / "video")
+    except FileNotFoundError:
+        return
+
+    with entries:
+        video_dirs = (entry for entry in entries if entry.name.isdigit() and entry.is_dir(follow_symlinks=False))
+        for batch in batched(video_dirs, settings.MEDIA_GC_BATCH_SIZE):
+            videos = Video.objects.in_bulk([int(entry.name) for entry in batch])
+            updated = []
+
+            for entry in batch:
+                video = videos.get(int(entry.name))
+                if video is None:
+                    if is_expired(entry, grace):
+                        stats["freed_bytes"] += remove_tree(Path(entry.path), throttle)
+                        stats["orphan_dirs"] += 1
+                    continue
+
+                # The published renditions are kept, whatever the current ladder
+                # settings are. Without a master playlist nothing is published
+                # that tells them apart, so nothing is removed. Staging
+                # directories (.<label>.next/.old) belong to a running transcode.
+                labels = read_master_entries(Path(entry.path)) if video.status == "ready" else None
+                if labels:
+                    with os.scandir(entry.path) as renditions:
+                        stale = [
+                            rendition for rendition in renditions
+                            if rendition.is_dir(follow_symlinks=False) and not rendition.name.startswith(".")
+                            and rendition.name not in labels and is_expired(rendition, grace)
+                        ]
+                    # The status was read for the whole batch; a transcode started since may publish other renditions
+                    if stale and Video.objects.filter(id=video.id, status="ready").exists():
+                        labels = read_master_entries(Path(entry.path))
+                        for rendition in stale:
+                            if labels and rendition.name not in labels:
+                                stats["freed_bytes"] += remove_tree(Path(rendition.path), throttle)
+                                stats["stale_renditions"] += 1
+
+                video.storage_bytes = tree_size(Path(entry.path)) + original_size(video)
+                updated.append(video)
+
+            Video.objects.bulk_update(updated, ["storage_bytes"])
+
+
+def collect_unreferenced(media_root: Path, directory: str, field: str, stat: str, stats: dict, throttle: Throttle):
+    """ Remove the files below `directory` that the file `field` of no video references. """
+    grace = settings.MEDIA_GC_GRACE_SECONDS
+    files = iter_files(media_root / directory, directory)
+    for batch in batched(files, settings.MEDIA_GC_BATCH_SIZE):
+        names = [name for name, _ in batch]
+        referenced = set(Video.objects.filter(**{f"{field}__in": names}).values_list(field, flat=True))
+        for name, entry in batch:
+            if name not in referenced and is_expired(entry, grace):
+                stats["freed_bytes"] += entry.stat(follow_symlinks=False).st_size
+                os.unlink(entry.path)
+                stats[stat] += 1
+                throttle.tick()
+
+
+def move_originals_to_cold_storage(media_root: Path, cold_root: Path, stats: dict, throttle: Throttle):
+    """ Move the originals of videos that are ready for MEDIA_COLD_AFTER_DAYS to the cold storage. """
+    cutoff = timezone.now() - timedelta(days=settings.MEDIA_COLD_AFTER_DAYS)
+    names = (
+        Video.objects
+        .filter(status="ready", created_at__lt=cutoff)
+        .exclude(original_file="")
+        .values_list("original_file", flat=True)
+        .iterator(chunk_size=settings.MEDIA_GC_BATCH_SIZE)
+    )
+    for name in names:
+        source = media_root / name
+        if not source.exists():
+            continue
+        target = cold_root / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(source, target)
+        stats["cold_originals"] += 1
+        throttle.tick()
+
+
+def collect_media():
+    """
+    Reconcile MEDIA_ROOT with the Video rows (see module docstring).
+
+    Returns:
+        dict: Counts of removed directories, renditions, originals and
+        thumbnails, moved originals and the bytes freed.
+    """
+    media_root = Path(settings.MEDIA_ROOT)
+    throttle = Throttle(settings.MEDIA_GC_BATCH_SIZE, settings.MEDIA_GC_THROTTLE_MS / 1000)
+    stats = dict.fromkeys((
+        "orphan_dirs", "stale_renditions", "orphan_originals", "orphan_thumbnails", "cold_originals", "freed_bytes"
+    ), 0)
+
+    collect_video_dirs(media_root, stats, throttle)
+    collect_unreferenced(media_root, ORIGINALS_DIR, "original_file", "orphan_originals", stats, throttle)
+    collect_unreferenced(media_root, THUMBNAILS_DIR, "thumbnail_url", "orphan_thumbnails", stats, throttle)
+    if settings.MEDIA_COLD_STORAGE_ROOT:
+        move_originals_to_cold_storage(media_root, Path(settings.MEDIA_COLD_STORAGE_ROOT), stats, throttle)
+
+    return stats
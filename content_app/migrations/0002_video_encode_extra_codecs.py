@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='encode_extra_codecs',
+            field=models.BooleanField(default=False, help_text='Also encode the codecs in HLS_EXTRA_CODECS (e.g. HEVC, AV1) for this title.'),
+        ),
+    ]
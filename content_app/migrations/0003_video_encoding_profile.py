@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_app', '0002_video_encode_extra_codecs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='encoding_profile',
+            field=models.JSONField(blank=True, default=dict, help_text='Per-title CRF and bitrate per resolution chosen by the encoding analysis.'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 08:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_app', '0005_outboxjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='storage_bytes',
+            field=models.BigIntegerField(default=0, help_text='Disk usage of the original and the HLS output, updated by the media garbage collection.'),
+        ),
+    ]
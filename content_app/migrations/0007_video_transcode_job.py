@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_app', '0006_video_storage_bytes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='transcode_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='transcode_job_id',
+            field=models.CharField(blank=True, help_text='RQ job id of the last transcode attempt.', max_length=64),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 08:26
+
+from django.db import migrations, models
+
+
+def mark_ready_videos_playable(apps, schema_editor):
+    Video = apps.get_model('content_app', 'Video')
+    Video.objects.filter(status='ready').update(playable=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_app', '0009_video_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='playable',
+            field=models.BooleanField(default=False, help_text='At least one rendition is published in the master playlist; set as soon as the first one is encoded.'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['playable'], name='video_playable_idx'),
+        ),
+        migrations.RunPython(mark_ready_videos_playable, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content_app', '0010_video_playable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='import_key',
+            field=models.CharField(blank=True, db_index=True, help_text='Key of the imported original file from its path, size and modification time, set by import_catalog.', max_length=64),
+        ),
+    ]
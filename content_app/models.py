@@ -1,5 +1,11 @@
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
 
+# Text search configuration of Video.search_vector and of search queries.
+SEARCH_CONFIG = "english"
+
 class StatusType(models.TextChoices):   
     """ Enumeration of possible processing statuses for videos. """
     
@@ -16,6 +22,99 @@ class Video(models.Model):
     category = models.CharField(max_length=100)
     original_file = models.FileField(upload_to='video/originals/')
     status = models.CharField(max_length=20, choices=StatusType.choices, default=StatusType.pending)
+    encode_extra_codecs = models.BooleanField(
+        default=False,
+        help_text="Also encode the codecs in HLS_EXTRA_CODECS (e.g. HEVC, AV1) for this title."
+    )
+    encoding_profile = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Per-title CRF and bitrate per resolution chosen by the encoding analysis."
+    )
+    transcode_job_id = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="RQ job id of the last transcode attempt."
+    )
+    transcode_attempts = models.PositiveSmallIntegerField(default=0)
+    playable = models.BooleanField(
+        default=False,
+        help_text="At least one rendition is published in the master playlist; set as soon as the first one is encoded."
+    )
+    import_key = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        help_text="Key of the imported original file from its path, size and modification time, set by import_catalog."
+    )
+    storage_bytes = models.BigIntegerField(
+        default=0,
+        help_text="Disk usage of the original and the HLS output, updated by the media garbage collection."
+    )
+    # Computed by Postgres on every insert and update, including bulk_create.
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector("title", weight="A", config=SEARCH_CONFIG)
+            + SearchVector("category", weight="B", config=SEARCH_CONFIG)
+            + SearchVector("description", weight="C", config=SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=["search_vector"], name="video_search_vector_idx"),
+            models.Index(fields=["category"], name="video_category_idx"),
+            # Admin changelist filters and the transcode reaper
+            models.Index(fields=["status"], name="video_status_idx"),
+            models.Index(fields=["created_at"], name="video_created_at_idx"),
+            models.Index(fields=["playable"], name="video_playable_idx"),
+        ]
+
+    def __str__(self):
+        return f"Title:{self.title}, ID:{self.id}, status:{self.status}"
+
+
+class WatchProgress(models.Model):
+    """
+    Last playback position of a user in a video.
+
+    Heartbeats are collected in Redis and written here in bulk by the
+    flush_watch_progress job, so this table is behind Redis by at most
+    one flush interval.
+    """
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="watch_progress")
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name="watch_progress")
+    position = models.FloatField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "video"], name="unique_watch_progress")
+        ]
+        indexes = [
+            models.Index(fields=["user", "-updated_at"])
+        ]
+
+    def __str__(self):
+        return f"User:{self.user_id}, Video:{self.video_id}, position:{self.position}"
+
+class OutboxJob(models.Model):
+    """
+    Background job waiting to be enqueued to RQ.
+
+    Rows are written in the same transaction as the change that requires the
+    job and are enqueued and deleted by content_app.outbox.dispatch_outbox
+    after the commit, so a worker never sees a job for uncommitted data and
+    a rolled-back transaction leaves no job behind.
+    """
+
+    task = models.CharField(max_length=255, help_text="Dotted path of the task function.")
+    args = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Title:{self.title}, ID:{self.id}, status:{self.status}"
\ No newline at end of file
+        return f"Task:{self.task}, args:{self.args}"
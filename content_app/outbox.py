@@ -0,0 +1,78 @@
+"""
+Transactional outbox for RQ jobs.
+
+Jobs are not enqueued while the transaction that needs them is still open.
+Instead an OutboxJob row is written in that transaction and
+dispatch_outbox() moves the rows to RQ after the commit: right away via
+transaction.on_commit() and periodically via the dispatch_outbox_jobs task,
+which picks up rows whose immediate dispatch failed (e.g. Redis was down).
+
+Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent
+dispatchers never enqueue the same job, and every batch is enqueued with
+one pipelined Redis call. A row is only deleted once its job is enqueued.
+"""
+
+import logging
+
+import django_rq
+from django.db import transaction
+from rq.job import Job
+from rq.queue import Queue
+
+from .models import OutboxJob
+
+logger = logging.getLogger(__name__)
+
+TRANSCODE_TASK = "content_app.tasks.transcode_video"
+OUTBOX_JOB_ID = "outbox-{id}"
+
+
+def add_jobs(task: str, args_list):
+    """
+    Write outbox rows for `task` with every args tuple in `args_list` and dispatch them after the commit.
+
+    Must be called inside the transaction that makes the jobs necessary.
+
+    Returns:
+        list[OutboxJob]: The written rows; their jobs get the id OUTBOX_JOB_ID.
+    """
+    if not args_list:
+        return []
+    jobs = OutboxJob.objects.bulk_create([OutboxJob(task=task, args=list(args)) for args in args_list])
+    transaction.on_commit(dispatch_outbox, robust=True)
+    return jobs
+
+
+def dispatch_outbox(batch_size: int = 500):
+    """
+    Enqueue all outbox rows to the default RQ queue and delete them.
+
+    Jobs get the id OUTBOX_JOB_ID, so if a batch was enqueued but its rows
+    could not be deleted, the next dispatch finds the jobs and does not
+    enqueue them again.
+
+    Returns:
+        int: The number of outbox rows dispatched.
+    """
+    queue = django_rq.get_queue("default")
+    dispatched = 0
+
+    while True:
+        with transaction.atomic():
+            entries = list(OutboxJob.objects.select_for_update(skip_locked=True).order_by("id")[:batch_size])
+            if not entries:
+                return dispatched
+
+            job_ids = [OUTBOX_JOB_ID.format(id=entry.id) for entry in entries]
+            existing = Job.fetch_many(job_ids, connection=queue.connection)
+            job_datas = [
+                Queue.prepare_data(entry.task, args=entry.args, job_id=job_id)
+                for entry, job_id, job in zip(entries, job_ids, existing)
+                if job is None
+            ]
+            if job_datas:
+                queue.enqueue_many(job_datas)
+
+            OutboxJob.objects.filter(id__in=[entry.id for entry in entries]).delete()
+            dispatched += len(entries)
+            logger.info("Dispatched %s outbox jobs", len(entries))
@@ -0,0 +1,234 @@
+"""
+Watch progress with Redis write-behind.
+
+Players send a heartbeat with their position every few seconds. Heartbeats
+only touch Redis:
+
+    videoflix:progress:<user_id>        hash  video_id -> "position:completed:timestamp"
+    videoflix:continue:<user_id>        zset  video_id scored by last heartbeat
+    videoflix:continue-empty:<user_id>  marker for users without entries in Postgres
+    videoflix:progress:dirty            set   "user_id:video_id" not yet in Postgres
+
+The flush_watch_progress job drains the dirty set periodically and writes
+the coalesced positions to Postgres with bulk upserts, so the database sees
+one write per viewer and video per flush interval instead of one per heartbeat.
+
+The hash and the list of a user expire WATCH_PROGRESS_TTL seconds after the
+last heartbeat and are loaded from Postgres again on the next request. The
+empty marker lets users without any progress skip that query for
+CONTINUE_WATCHING_EMPTY_TTL seconds. Heartbeats are only accepted for
+existing videos; the ids found are remembered per process for
+KNOWN_VIDEO_SECONDS, so repeated heartbeats do not query Postgres.
+"""
+
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django_redis import get_redis_connection
+
+from .models import Video, WatchProgress
+
+PROGRESS_KEY = "videoflix:progress:{user_id}"
+CONTINUE_KEY = "videoflix:continue:{user_id}"
+CONTINUE_EMPTY_KEY = "videoflix:continue-empty:{user_id}"
+DIRTY_KEY = "videoflix:progress:dirty"
+
+# Existing video ids remembered per worker process, and for how long.
+MAX_KNOWN_VIDEOS = 10000
+KNOWN_VIDEO_SECONDS = 300
+
+# video id -> time.monotonic() of the check
+_known_videos = OrderedDict()
+
+
+def encode_progress(position: float, completed: bool, timestamp: float):
+    return f"{position}:{int(completed)}:{timestamp}"
+
+
+def decode_progress(value):
+    position, completed, timestamp = value.decode().split(":")
+    return float(position), completed == "1", float(timestamp)
+
+
+def video_exists(video_id: int):
+    """ Return whether a video exists, querying Postgres at most every KNOWN_VIDEO_SECONDS per video. """
+    now = time.monotonic()
+    checked_at = _known_videos.get(video_id)
+    if checked_at is not None and now - checked_at < KNOWN_VIDEO_SECONDS:
+        _known_videos.move_to_end(video_id)
+        return True
+
+    if not Video.objects.filter(id=video_id).exists():
+        _known_videos.pop(video_id, None)
+        return False
+    _known_videos[video_id] = now
+    _known_videos.move_to_end(video_id)
+    if len(_known_videos) > MAX_KNOWN_VIDEOS:
+        _known_videos.popitem(last=False)
+    return True
+
+
+def record_progress(user_id: int, video_id: int, position: float, completed: bool = False):
+    """
+    Store a heartbeat in Redis with a single pipelined round trip.
+
+    Completed videos are removed from the continue-watching list, which is
+    trimmed to CONTINUE_WATCHING_SIZE entries.
+
+    Raises:
+        Video.DoesNotExist: If there is no video with this id.
+    """
+    if not video_exists(video_id):
+        raise Video.DoesNotExist(f"Video {video_id} does not exist")
+
+    now = time.time()
+    progress_key = PROGRESS_KEY.format(user_id=user_id)
+    continue_key = CONTINUE_KEY.format(user_id=user_id)
+    size = settings.CONTINUE_WATCHING_SIZE
+    ttl = settings.WATCH_PROGRESS_TTL
+
+    pipeline = get_redis_connection("default").pipeline(transaction=False)
+    pipeline.hset(progress_key, video_id, encode_progress(position, completed, now))
+    pipeline.expire(progress_key, ttl)
+    if completed:
+        pipeline.zrem(continue_key, video_id)
+    else:
+        pipeline.zadd(continue_key, {video_id: now})
+        pipeline.zremrangebyrank(continue_key, 0, -size - 1)
+        pipeline.expire(continue_key, ttl)
+    pipeline.delete(CONTINUE_EMPTY_KEY.format(user_id=user_id))
+    pipeline.sadd(DIRTY_KEY, f"{user_id}:{video_id}")
+    pipeline.execute()
+
+
+def warm_continue_watching(redis, user_id: int):
+    """
+    Load the continue-watching list of a user from Postgres into Redis, e.g. after it expired.
+
+    Heartbeats in the Redis hash that are not flushed yet take precedence, so
+    a video completed since the last flush is not listed again. Users without
+    entries get the empty marker instead.
+    """
+    entries = list(
+        WatchProgress.objects
+        .filter(user_id=user_id, completed=False)
+        .order_by("-updated_at")
+        .values_list("video_id", "position", "updated_at")[:settings.CONTINUE_WATCHING_SIZE]
+    )
+    progress_key = PROGRESS_KEY.format(user_id=user_id)
+    continue_key = CONTINUE_KEY.format(user_id=user_id)
+    values = redis.hmget(progress_key, [video_id for video_id, _, _ in entries]) if entries else []
+
+    pipeline = redis.pipeline(transaction=False)
+    listed = False
+    for (video_id, position, updated_at), value in zip(entries, values):
+        if value is None:
+            timestamp = updated_at.timestamp()
+            pipeline.hsetnx(progress_key, video_id, encode_progress(position, False, timestamp))
+        else:
+            _, completed, timestamp = decode_progress(value)
+            if completed:
+                continue
+        pipeline.zadd(continue_key, {video_id: timestamp}, nx=True)
+        listed = True
+
+    if not listed:
+        pipeline.set(CONTINUE_EMPTY_KEY.format(user_id=user_id), 1, ex=settings.CONTINUE_WATCHING_EMPTY_TTL)
+    else:
+        pipeline.expire(progress_key, settings.WATCH_PROGRESS_TTL)
+        pipeline.expire(continue_key, settings.WATCH_PROGRESS_TTL)
+    pipeline.execute()
+
+
+def get_continue_watching(user_id: int):
+    """
+    Return the videos a user started but did not finish, most recent first.
+
+    Returns:
+        list[dict]: Entries with "video_id", "position" and "updated_at".
+    """
+    redis = get_redis_connection("default")
+    continue_key = CONTINUE_KEY.format(user_id=user_id)
+    if not redis.exists(continue_key, CONTINUE_EMPTY_KEY.format(user_id=user_id)):
+        warm_continue_watching(redis, user_id)
+
+    video_ids = redis.zrevrange(continue_key, 0, settings.CONTINUE_WATCHING_SIZE - 1)
+    if not video_ids:
+        return []
+
+    values = redis.hmget(PROGRESS_KEY.format(user_id=user_id), video_ids)
+    entries = []
+    for video_id, value in zip(video_ids, values):
+        if value is None:
+            continue
+        position, _, timestamp = decode_progress(value)
+        entries.append({
+            "video_id": int(video_id),
+            "position": position,
+            "updated_at": datetime.fromtimestamp(timestamp, tz=timezone.utc),
+        })
+    return entries
+
+
+def flush_progress(batch_size: int = 1000):
+    """
+    Write the dirty positions from Redis to Postgres in bulk upserts.
+
+    Members are popped from the dirty set in batches. If a batch cannot be
+    written, its members are put back so the next flush retries them.
+
+    Returns:
+        int: The number of rows written.
+    """
+    redis = get_redis_connection("default")
+    written = 0
+
+    while True:
+        members = redis.spop(DIRTY_KEY, batch_size)
+        if not members:
+            return written
+
+        try:
+            written += write_progress_batch(redis, members)
+        except Exception:
+            redis.sadd(DIRTY_KEY, *members)
+            raise
+
+
+def write_progress_batch(redis, members):
+    """ Upsert one batch of "user_id:video_id" members into WatchProgress. """
+    keys = [tuple(int(part) for part in member.decode().split(":")) for member in members]
+
+    pipeline = redis.pipeline(transaction=False)
+    for user_id, video_id in keys:
+        pipeline.hget(PROGRESS_KEY.format(user_id=user_id), video_id)
+    values = pipeline.execute()
+
+    # Users and videos may have been deleted since the heartbeat
+    existing_users = set(
+        get_user_model().objects.filter(id__in={user_id for user_id, _ in keys}).values_list("id", flat=True)
+    )
+    existing_videos = set(Video.objects.filter(id__in={video_id for _, video_id in keys}).values_list("id", flat=True))
+    rows = []
+    for (user_id, video_id), value in zip(keys, values):
+        if value is None or user_id not in existing_users or video_id not in existing_videos:
+            continue
+        position, completed, timestamp = decode_progress(value)
+        rows.append(WatchProgress(
+            user_id=user_id,
+            video_id=video_id,
+            position=position,
+            completed=completed,
+            updated_at=datetime.fromtimestamp(timestamp, tz=timezone.utc),
+        ))
+
+    WatchProgress.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["user", "video"],
+        update_fields=["position", "completed", "updated_at"],
+    )
+    return len(rows)
@@ -0,0 +1,62 @@
+"""
+Recovery of transcodes whose RQ worker died.
+
+A video stays in "processing" if the worker running its transcode_video job
+is killed. RQ keeps the job in the started job registry until the worker's
+heartbeat expires; cleaning the registry then marks the job as failed.
+reap_stuck_transcodes() finds processing videos whose job is no longer
+queued or running and enqueues them again through the outbox. The retried
+job skips the renditions the dead one had finished (see utils.COMPLETE_MARKER).
+"""
+
+import logging
+
+import django_rq
+from django.conf import settings
+from django.db import transaction
+from rq.job import Job, JobStatus
+
+from .models import Video
+from .outbox import TRANSCODE_TASK, add_jobs
+
+logger = logging.getLogger(__name__)
+
+LIVE_JOB_STATUSES = {JobStatus.QUEUED, JobStatus.STARTED, JobStatus.DEFERRED, JobStatus.SCHEDULED}
+
+
+def reap_stuck_transcodes():
+    """
+    Enqueue processing videos without a live job again, or fail them after TRANSCODE_MAX_ATTEMPTS.
+
+    Returns:
+        int: The number of videos enqueued again.
+    """
+    queue = django_rq.get_queue("default")
+    # Moves jobs of dead workers from the started registry to the failed one
+    queue.started_job_registry.cleanup()
+
+    with transaction.atomic():
+        videos = list(
+            Video.objects.select_for_update(skip_locked=True)
+            .filter(status="processing")
+            .only("id", "transcode_job_id", "transcode_attempts")
+        )
+        if not videos:
+            return 0
+
+        jobs = Job.fetch_many([video.transcode_job_id for video in videos], connection=queue.connection)
+        stuck = [
+            video for video, job in zip(videos, jobs)
+            if job is None or job.get_status(refresh=False) not in LIVE_JOB_STATUSES
+        ]
+
+        retry = [video for video in stuck if video.transcode_attempts < settings.TRANSCODE_MAX_ATTEMPTS]
+        give_up = [video.id for video in stuck if video.transcode_attempts >= settings.TRANSCODE_MAX_ATTEMPTS]
+
+        Video.objects.filter(id__in=[video.id for video in retry]).update(status="pending")
+        Video.objects.filter(id__in=give_up).update(status="failed")
+        add_jobs(TRANSCODE_TASK, [(video.id,) for video in retry])
+
+    if stuck:
+        logger.warning("Re-enqueued %s stuck transcodes, marked %s as failed", len(retry), len(give_up))
+    return len(retry)
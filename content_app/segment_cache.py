@@ -0,0 +1,228 @@
+"""
+Shared-memory cache for hot HLS segments.
+
+All gunicorn workers (and the RQ worker) on a host map the same arena file,
+usually on /dev/shm, so a segment read from disk by one worker is served
+from memory by every other worker afterwards.
+
+Arena layout:
+    header | entry table (slot_count entries) | ghost table | data slots
+
+Every slot holds one segment of at most slot_size bytes. Entries store the
+blake2b digest of the cache key, the data length and a reference bit.
+Eviction uses the CLOCK algorithm over the reference bits. To resist scans
+(e.g. a client seeking through a whole title once), a key is only admitted
+on its second miss: the first miss just records its digest in the ghost
+table. Readers take a shared flock on the arena, writers an exclusive one.
+
+Entries are never invalidated: callers put the generation of the data into
+the key (see streaming.get_generation_key()), and outdated entries are
+evicted like any other cold segment.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+from core.metrics import SEGMENT_CACHE_REQUESTS
+
+try:
+    import fcntl
+except ImportError:  # Windows: the cache is disabled
+    fcntl = None
+
+MAGIC = b"VFXSEG01"
+HEADER = struct.Struct("<8sIIII")  # magic, slot count, slot size, clock hand, ghost cursor
+ENTRY = struct.Struct("<16sIB3x")  # key digest, data length, reference bit
+DIGEST_SIZE = 16
+EMPTY_DIGEST = bytes(DIGEST_SIZE)
+PAGE_SIZE = mmap.PAGESIZE
+
+
+class SegmentCache:
+    """ Size-bounded segment cache in a memory-mapped file shared across processes. """
+
+    def __init__(self, path, size: int, slot_size: int):
+        self.path = str(path)
+        self.slot_size = slot_size
+        self.slot_count = max(size // slot_size, 1)
+        self.ghost_count = self.slot_count * 2
+
+        self.table_start = HEADER.size
+        self.ghost_start = self.table_start + self.slot_count * ENTRY.size
+        ghost_end = self.ghost_start + self.ghost_count * DIGEST_SIZE
+        self.data_start = (ghost_end + PAGE_SIZE - 1) // PAGE_SIZE * PAGE_SIZE
+        self.arena_size = self.data_start + self.slot_count * slot_size
+
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    def _open(self):
+        """
+        Map the arena file, creating or resizing it if needed.
+
+        The mapping is opened per process: flock locks belong to the open file
+        description, which forked workers would otherwise share.
+        """
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            expected = HEADER.pack(MAGIC, self.slot_count, self.slot_size, 0, 0)[:16]
+            if os.fstat(fd).st_size != self.arena_size or os.pread(fd, 16, 0) != expected:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.arena_size)
+                os.pwrite(fd, HEADER.pack(MAGIC, self.slot_count, self.slot_size, 0, 0), 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(fd, self.arena_size, mmap.MAP_SHARED)
+        self._fd = fd
+        self._pid = os.getpid()
+
+    def _lock(self, operation):
+        self._open()
+        fcntl.flock(self._fd, operation)
+
+    def _unlock(self):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _digest(key: str):
+        return hashlib.blake2b(key.encode(), digest_size=DIGEST_SIZE).digest()
+
+    def _find(self, digest: bytes, start: int, count: int, item_size: int):
+        """ Return the index of digest in a table of count items, or None. """
+        end = start + count * item_size
+        position = self._map.find(digest, start, end)
+        while position != -1:
+            if (position - start) % item_size == 0:
+                return (position - start) // item_size
+            position = self._map.find(digest, position + 1, end)
+        return None
+
+    def _entry_offset(self, index: int):
+        return self.table_start + index * ENTRY.size
+
+    def get(self, key: str):
+        """
+        Return the cached bytes for key, or None on a miss.
+
+        The data is copied out of the arena while the shared lock is held, so a
+        concurrent eviction can never hand out a half-overwritten segment.
+        """
+        digest = self._digest(key)
+        self._lock(fcntl.LOCK_SH)
+        try:
+            index = self._find(digest, self.table_start, self.slot_count, ENTRY.size)
+            if index is None:
+                SEGMENT_CACHE_REQUESTS.labels("miss").inc()
+                return None
+            SEGMENT_CACHE_REQUESTS.labels("hit").inc()
+            offset = self._entry_offset(index)
+            _, length, _ = ENTRY.unpack_from(self._map, offset)
+            # Setting the reference bit under the shared lock is a benign race.
+            self._map[offset + DIGEST_SIZE + 4] = 1
+            slot = self.data_start + index * self.slot_size
+            return self._map[slot:slot + length]
+        finally:
+            self._unlock()
+
+    def put(self, key: str, data: bytes):
+        """
+        Offer data for key to the cache.
+
+        Returns:
+            bool: True if the data was stored, False if it is too large or the
+            key was seen for the first time and only recorded as a ghost.
+        """
+        if len(data) > self.slot_size:
+            SEGMENT_CACHE_REQUESTS.labels("too_large").inc()
+            return False
+
+        digest = self._digest(key)
+        self._lock(fcntl.LOCK_EX)
+        try:
+            if self._find(digest, self.table_start, self.slot_count, ENTRY.size) is not None:
+                return True
+
+            _, _, _, hand, ghost_cursor = HEADER.unpack_from(self._map, 0)
+            ghost = self._find(digest, self.ghost_start, self.ghost_count, DIGEST_SIZE)
+            if ghost is None:
+                self._map[self.ghost_start + ghost_cursor * DIGEST_SIZE:
+                          self.ghost_start + (ghost_cursor + 1) * DIGEST_SIZE] = digest
+                ghost_cursor = (ghost_cursor + 1) % self.ghost_count
+                HEADER.pack_into(self._map, 0, MAGIC, self.slot_count, self.slot_size, hand, ghost_cursor)
+                SEGMENT_CACHE_REQUESTS.labels("ghosted").inc()
+                return False
+
+            ghost_offset = self.ghost_start + ghost * DIGEST_SIZE
+            self._map[ghost_offset:ghost_offset + DIGEST_SIZE] = EMPTY_DIGEST
+
+            index = self._find(EMPTY_DIGEST, self.table_start, self.slot_count, ENTRY.size)
+            if index is None:
+                index, hand = self._evict(hand)
+
+            slot = self.data_start + index * self.slot_size
+            self._map[slot:slot + len(data)] = data
+            ENTRY.pack_into(self._map, self._entry_offset(index), digest, len(data), 0)
+            HEADER.pack_into(self._map, 0, MAGIC, self.slot_count, self.slot_size, hand, ghost_cursor)
+            SEGMENT_CACHE_REQUESTS.labels("stored").inc()
+            return True
+        finally:
+            self._unlock()
+
+    def _evict(self, hand: int):
+        """
+        Advance the CLOCK hand to the first slot without reference bit.
+
+        Reference bits are cleared on the way, so the loop ends after at most
+        one full turn.
+
+        Returns:
+            tuple: The index of the victim slot and the new hand position.
+        """
+        while True:
+            offset = self._entry_offset(hand)
+            referenced = self._map[offset + DIGEST_SIZE + 4]
+            if not referenced:
+                return hand, (hand + 1) % self.slot_count
+            self._map[offset + DIGEST_SIZE + 4] = 0
+            hand = (hand + 1) % self.slot_count
+
+
+_segment_cache = None
+
+
+def get_segment_cache():
+    """
+    Return the process-wide SegmentCache, or None if the cache is disabled.
+
+    The cache is enabled by setting SEGMENT_CACHE_SIZE_MB to a positive value.
+    """
+    global _segment_cache
+    size_mb = getattr(settings, "SEGMENT_CACHE_SIZE_MB", 0)
+    if size_mb <= 0 or fcntl is None:
+        return None
+
+    path = str(getattr(settings, "SEGMENT_CACHE_PATH", "") or default_cache_path())
+    slot_size = settings.SEGMENT_CACHE_SLOT_KB * 1024
+    if (_segment_cache is None or _segment_cache.path != path
+            or _segment_cache.slot_size != slot_size
+            or _segment_cache.slot_count != max(size_mb * 1024 * 1024 // slot_size, 1)):
+        _segment_cache = SegmentCache(path, size_mb * 1024 * 1024, slot_size)
+    return _segment_cache
+
+
+def default_cache_path():
+    """ Place the arena on /dev/shm if available, otherwise in the temp directory. """
+    directory = Path("/dev/shm")
+    if not directory.is_dir():
+        directory = Path(tempfile.gettempdir())
+    return directory / "videoflix-segment-cache"
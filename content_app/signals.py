@@ -1,8 +1,19 @@
-import django_rq
-from django.db.models.signals import post_save
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
 from .models import Video
-from .tasks import transcode_video
+from .outbox import TRANSCODE_TASK, add_jobs
+from .typeahead import publish_changes
+
+# Published title of an instance whose title or playable field was not loaded.
+UNKNOWN = object()
+
+
+def get_suggested_title(instance):
+    """ Return the title a video is suggested with, None while it is not playable. """
+    return instance.title if instance.playable else None
 
 
 @receiver(post_save, sender=Video)
@@ -11,13 +22,47 @@ def start_transcoding_job(sender, instance, created, *args, **kwargs):
     Trigger a background transcoding job when a new Video instance is created.
 
     This signal listens to the post_save event of the Video model.
-    If a new video is created, it enqueues the `transcode_video` task
-    in the default RQ queue with the video's ID.
+    If a new video is created, a `transcode_video` job for the video's ID is
+    written to the outbox in the same transaction and enqueued into the
+    default RQ queue once the transaction is committed.
     """
     
     if created:
-        try:
-            queue = django_rq.get_queue("default")
-            queue.enqueue(transcode_video, instance.id)
-        except Exception as e:
-            print(f"Failed to enqueue transcoding job for video {instance.id}: {e}")
\ No newline at end of file
+        add_jobs(TRANSCODE_TASK, [(instance.id,)])
+
+
+@receiver(post_init, sender=Video)
+def remember_suggested_title(sender, instance, *args, **kwargs):
+    """ Remember the suggested title of a loaded video, so saves can tell whether it changed. """
+    fields = instance.__dict__
+    # Reading deferred fields here would query the database for every instance.
+    if "title" in fields and "playable" in fields:
+        instance._suggested_title = get_suggested_title(instance)
+    else:
+        instance._suggested_title = UNKNOWN
+
+
+@receiver(post_save, sender=Video)
+def publish_title(sender, instance, created, update_fields=None, *args, **kwargs):
+    """
+    Publish the title of a saved video to the suggestion index of all workers once committed.
+
+    Videos are only suggested while they are playable, otherwise they are
+    published as removed. Only changes of the suggested title are published,
+    so saves of other fields (e.g. the status updates of a transcode) are
+    skipped.
+    """
+    if update_fields is not None and not {"title", "playable"} & set(update_fields):
+        return
+    title = get_suggested_title(instance)
+    previous = None if created else getattr(instance, "_suggested_title", UNKNOWN)
+    if title == previous:
+        return
+    instance._suggested_title = title
+    transaction.on_commit(partial(publish_changes, [(instance.id, title)]), robust=True)
+
+
+@receiver(post_delete, sender=Video)
+def unpublish_title(sender, instance, *args, **kwargs):
+    """ Remove a deleted video from the suggestion index of all workers once committed. """
+    transaction.on_commit(partial(publish_changes, [(instance.id, None)]), robust=True)
@@ -0,0 +1,386 @@
+"""
+Helpers for serving HLS playlists and media segments.
+
+Playlists are served from the gzip or brotli copies written next to them by
+the transcoder (see utils.write_precompressed), picked by the client's
+Accept-Encoding header, so they are never compressed per request.
+
+In "fmp4" output mode every rendition is a single fragmented MP4 file and
+the players request the segments as byte ranges of that file. The file
+descriptors of these files are kept open per worker process, so serving a
+segment costs a stat() and a pread() instead of open(), read() and close().
+The stat() detects a re-transcoded file (a new inode, size or mtime), whose
+descriptor is then reopened instead of serving the replaced file's bytes.
+
+Segments cached in the shared segment cache are keyed by the generation of
+their rendition (see get_generation_key()). A re-transcode publishes a new
+generation, so its segments get new keys and the outdated ones age out of
+the cache without invalidating the segments of other videos.
+
+HLS players fetch segments strictly in order. Once a stream is read
+sequentially, the next SEGMENT_PREFETCH_COUNT segments are announced to the
+kernel with posix_fadvise(WILLNEED), which starts the readahead in the
+background so the next request does not stall on a cold read.
+"""
+
+import os
+import re
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from core.metrics import SEGMENT_PREFETCH_DECISIONS
+
+from .segment_cache import get_segment_cache
+from .utils import COMPLETE_MARKER, PLAYLIST_ENCODINGS
+
+PLAYLIST_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+SEGMENT_CONTENT_TYPES = {
+    ".ts": "video/mp2t",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+}
+
+SEGMENT_NUMBER_PATTERN = re.compile(r"^(?P<prefix>.*?)(?P<number>\d+)(?P<suffix>\.(ts|m4s))$")
+
+# Maximum number of single-file renditions kept open per worker process.
+MAX_OPEN_FILES = 64
+
+# Maximum number of streams whose access pattern is tracked per worker process.
+MAX_TRACKED_STREAMS = 4096
+
+_open_files = OrderedDict()
+
+# stream key -> (last position, prefetched until); positions are segment
+# numbers for segment files and byte offsets for single-file renditions.
+_stream_positions = OrderedDict()
+
+
+def file_version(stat_result):
+    return stat_result.st_dev, stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns
+
+
+def close_open_file(path):
+    entry = _open_files.pop(str(path), None)
+    if entry is not None:
+        os.close(entry[0])
+
+
+def get_open_file(path):
+    """
+    Return a cached (file descriptor, size) pair for the given path.
+
+    The path is stat()ed on every call; if it now names another file (e.g.
+    after a re-transcode) or the file changed, the descriptor is reopened,
+    which also releases the disk space of a deleted file. The least recently
+    used descriptor is closed once more than MAX_OPEN_FILES files are open.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    key = str(path)
+    try:
+        version = file_version(os.stat(key))
+    except FileNotFoundError:
+        close_open_file(key)
+        raise
+
+    entry = _open_files.get(key)
+    if entry is not None:
+        if entry[2] == version:
+            _open_files.move_to_end(key)
+            return entry[0], entry[1]
+        close_open_file(key)
+
+    fd = os.open(key, os.O_RDONLY)
+    stat_result = os.fstat(fd)
+    _open_files[key] = (fd, stat_result.st_size, file_version(stat_result))
+    if len(_open_files) > MAX_OPEN_FILES:
+        _, (old_fd, _, _) = _open_files.popitem(last=False)
+        os.close(old_fd)
+    return fd, stat_result.st_size
+
+
+def get_generation_key(path, cache_key: str):
+    """
+    Qualify cache_key with the generation of the rendition holding path.
+
+    Every encode of a rendition writes a new completion marker (see
+    utils.mark_rendition_complete), so the marker's inode and mtime identify
+    the generation.
+
+    Returns:
+        str | None: The key, or None if the rendition has no marker and its
+        segments must not be cached.
+    """
+    try:
+        stat_result = os.stat(os.path.join(os.path.dirname(path), COMPLETE_MARKER))
+    except FileNotFoundError:
+        return None
+    return f"{cache_key}@{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}"
+
+
+def get_cache(path, cache_key):
+    """ Return the segment cache and the generation key for path, or (None, None) if it is not cached. """
+    cache = get_segment_cache() if cache_key else None
+    cache_key = get_generation_key(path, cache_key) if cache is not None else None
+    return (cache, cache_key) if cache_key is not None else (None, None)
+
+
+def parse_range(header: str, size: int):
+    """
+    Parse a single-range HTTP Range header into inclusive (start, end) offsets.
+
+    Returns:
+        tuple | None: The requested range, or None if the header is not a byte range.
+
+    Raises:
+        ValueError: If the range cannot be satisfied for a file of this size.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if start == "" and end == "":
+        return None
+    if start == "":
+        # Suffix range: the last N bytes of the file
+        length = int(end)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def get_accepted_encodings(header: str):
+    """ Return the content codings of an Accept-Encoding header that are not refused with q=0. """
+    accepted = set()
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def playlist_response(request, path):
+    """
+    Serve a playlist, precompressed if the client accepts brotli or gzip and the copy exists.
+
+    Raises:
+        FileNotFoundError: If the playlist does not exist.
+    """
+    accepted = get_accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    response = None
+    for coding, suffix in PLAYLIST_ENCODINGS.items():
+        if coding in accepted or "*" in accepted:
+            try:
+                compressed = open(path.with_name(path.name + suffix), "rb")
+            except FileNotFoundError:
+                # Encoded before playlists were precompressed
+                continue
+            response = FileResponse(compressed, content_type=PLAYLIST_CONTENT_TYPE)
+            response["Content-Encoding"] = coding
+            break
+    if response is None:
+        response = FileResponse(open(path, "rb"), content_type=PLAYLIST_CONTENT_TYPE)
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def segment_file_response(path, content_type: str, stream_key=None, cache_key=None):
+    """
+    Serve a whole segment file.
+
+    With the shared segment cache enabled, hits are served from memory and
+    misses are read completely and offered to the cache. If a stream_key is
+    given, the following segments are prefetched for sequential streams.
+
+    Raises:
+        FileNotFoundError: If the segment file does not exist.
+    """
+    cache, cache_key = get_cache(path, cache_key)
+    if cache is not None:
+        data = cache.get(cache_key)
+        if data is not None:
+            return HttpResponse(data, content_type=content_type)
+
+    file = open(path, "rb")
+    if stream_key is not None:
+        prefetch_next_segments(stream_key, path)
+    if cache is None:
+        return FileResponse(file, content_type=content_type)
+
+    with file:
+        data = file.read()
+    cache.put(cache_key, data)
+    return HttpResponse(data, content_type=content_type)
+
+
+def byte_range_response(request, path, content_type: str, stream_key=None, cache_key=None):
+    """
+    Serve a byte range of a single-file rendition.
+
+    If a stream_key is given, the following ranges are prefetched when the
+    stream is read sequentially (see prefetch_next_range()). With a cache_key
+    the range is looked up in and offered to the shared segment cache.
+
+    Returns:
+        HttpResponse: 206 with the requested bytes, 416 if the range is not
+        satisfiable, or a FileResponse with the whole file if no byte range
+        was requested.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    fd, size = get_open_file(path)
+    header = request.headers.get("Range", "")
+
+    try:
+        byte_range = parse_range(header, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+        response["Accept-Ranges"] = "bytes"
+        return response
+
+    start, end = byte_range
+    cache, cache_key = get_cache(path, cache_key)
+    range_key = f"{cache_key}:{start}-{end}"
+    data = cache.get(range_key) if cache is not None else None
+    if data is None:
+        data = os.pread(fd, end - start + 1, start)
+        if cache is not None:
+            cache.put(range_key, data)
+
+    if stream_key is not None:
+        prefetch_next_range(stream_key, fd, start, end, size)
+
+    response = HttpResponse(data, content_type=content_type, status=206)
+    response["Accept-Ranges"] = "bytes"
+    response["Content-Range"] = f"bytes {start}-{start + len(data) - 1}/{size}"
+    return response
+
+
+
+def _advise_willneed(fd: int, offset: int = 0, length: int = 0):
+    """ Ask the kernel to read a file region into the page cache without blocking. """
+    os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+    SEGMENT_PREFETCH_DECISIONS.labels("issued").inc()
+
+
+def _update_position(stream_key, position, sequential_from):
+    """
+    Record the latest position of a stream.
+
+    Returns:
+        int | None: The position up to which data was already prefetched, or
+        None if this access does not continue the previous one.
+    """
+    previous = _stream_positions.pop(stream_key, None)
+    prefetched_until = None
+    if previous is not None and previous[0] == sequential_from:
+        prefetched_until = previous[1]
+    _stream_positions[stream_key] = (position, prefetched_until if prefetched_until is not None else position)
+    if len(_stream_positions) > MAX_TRACKED_STREAMS:
+        _stream_positions.popitem(last=False)
+    return prefetched_until
+
+
+def _set_prefetched_until(stream_key, position):
+    _stream_positions[stream_key] = (_stream_positions[stream_key][0], position)
+
+
+def prefetch_next_segments(stream_key, segment_path):
+    """
+    Prefetch the segment files following segment_path if the stream is sequential.
+
+    Segment file names end with their sequence number (index0.ts, index1.ts, ...).
+    Only segments that were not announced before are advised, so a sequentially
+    played stream issues one fadvise per request.
+    """
+    count = getattr(settings, "SEGMENT_PREFETCH_COUNT", 0)
+    if count <= 0:
+        return
+    if not hasattr(os, "posix_fadvise"):
+        SEGMENT_PREFETCH_DECISIONS.labels("unsupported").inc()
+        return
+
+    match = SEGMENT_NUMBER_PATTERN.match(segment_path.name)
+    if not match:
+        SEGMENT_PREFETCH_DECISIONS.labels("unsupported").inc()
+        return
+
+    number = int(match.group("number"))
+    prefetched_until = _update_position(stream_key, number, sequential_from=number - 1)
+    if prefetched_until is None:
+        SEGMENT_PREFETCH_DECISIONS.labels("random").inc()
+        return
+
+    first = max(prefetched_until, number) + 1
+    for next_number in range(first, number + count + 1):
+        next_path = segment_path.with_name(f"{match.group('prefix')}{next_number}{match.group('suffix')}")
+        try:
+            fd = os.open(next_path, os.O_RDONLY)
+        except FileNotFoundError:
+            # End of the stream
+            SEGMENT_PREFETCH_DECISIONS.labels("missing").inc()
+            break
+        try:
+            _advise_willneed(fd)
+        finally:
+            os.close(fd)
+        _set_prefetched_until(stream_key, next_number)
+
+
+def prefetch_next_range(stream_key, fd: int, start: int, end: int, size: int):
+    """
+    Prefetch the bytes following a served range of a single-file rendition.
+
+    A range is sequential if it starts right after the previous one of the same
+    stream. The next SEGMENT_PREFETCH_COUNT ranges of the same length are
+    advised, skipping what was announced before.
+    """
+    count = getattr(settings, "SEGMENT_PREFETCH_COUNT", 0)
+    if count <= 0:
+        return
+    if not hasattr(os, "posix_fadvise"):
+        SEGMENT_PREFETCH_DECISIONS.labels("unsupported").inc()
+        return
+
+    prefetched_until = _update_position(stream_key, end + 1, sequential_from=start)
+    if prefetched_until is None:
+        SEGMENT_PREFETCH_DECISIONS.labels("random").inc()
+        return
+
+    window_end = min(end + 1 + (end - start + 1) * count, size)
+    window_start = max(prefetched_until, end + 1)
+    if window_start >= window_end:
+        SEGMENT_PREFETCH_DECISIONS.labels("missing").inc()
+        return
+
+    _advise_willneed(fd, window_start, window_end - window_start)
+    _set_prefetched_until(stream_key, window_end)
\ No newline at end of file
@@ -1,27 +1,141 @@
+import logging
+
+from django.conf import settings
+from django.db.models import F
+from rq import get_current_job
+
+from core.metrics import track_job
+
+from .analysis import analyse_title
+from .media_gc import collect_media
 from .models import Video
-from .utils import generate_hls_files
+from .outbox import dispatch_outbox
+from .progress import flush_progress
+from .reaper import reap_stuck_transcodes
+from .typeahead import rebuild_snapshot
+from .utils import generate_hls_files, get_original_path
 
+logger = logging.getLogger(__name__)
 
+
+@track_job
 def transcode_video(video_id):
     """
     Transcode a video to HLS format and update its processing status.
 
     This function is intended to run as a background task using RQ.
+    With PER_TITLE_ENCODING enabled, the per-title analysis runs first (once per
+    video) and its encoding profile is used for the H.264 ladder. Renditions
+    finished by an earlier, interrupted attempt are not encoded again. The
+    video becomes playable (and listed) as soon as its first rendition is
+    published, while the higher ones still encode. The video is claimed by
+    switching it from "pending" to "processing" in a single UPDATE, so videos
+    that are no longer pending (e.g. cancelled in the admin, or claimed by a
+    concurrent job for the same video) are skipped.
 
     Raises:
         Exception: Any exception raised during HLS generation is propagated.
     """
+    job = get_current_job()
+    claimed = Video.objects.filter(id=video_id, status="pending").update(
+        status="processing",
+        transcode_job_id=job.id if job else "",
+        transcode_attempts=F("transcode_attempts") + 1,
+    )
+    if not claimed:
+        logger.info("Skipping transcode of video %s, it is no longer pending", video_id)
+        return
     video = Video.objects.get(id=video_id)
-    video.status = "processing"
-    video.save()
 
     try:
-        generate_hls_files(video.original_file.path, video.id)
+        original_path = get_original_path(video.original_file.name)
+        if settings.PER_TITLE_ENCODING and not video.encoding_profile:
+            video.encoding_profile = analyse_title(str(original_path))
+            video.save()
+
+        def publish(labels):
+            if video.playable != bool(labels):
+                video.playable = bool(labels)
+                video.save(update_fields=["playable"])
+
+        extra_codecs = settings.HLS_EXTRA_CODECS if video.encode_extra_codecs else ()
+        generate_hls_files(str(original_path), video.id, extra_codecs, video.encoding_profile, on_publish=publish)
 
         video.status = "ready"
+        video.transcode_attempts = 0
         video.save()
 
     except Exception as error:
         video.status = "failed"
         video.save()
-        raise error
\ No newline at end of file
+        raise error
+
+
+@track_job
+def flush_watch_progress():
+    """
+    Write the watch progress collected in Redis to Postgres.
+
+    This function is intended to run periodically as a background task using
+    RQ (see RQ_PERIODIC_JOBS).
+
+    Returns:
+        int: The number of WatchProgress rows written.
+    """
+    return flush_progress()
+
+
+@track_job
+def dispatch_outbox_jobs():
+    """
+    Enqueue the jobs left in the outbox, e.g. after Redis was unavailable at commit time.
+
+    This function is intended to run periodically as a background task using
+    RQ (see RQ_PERIODIC_JOBS).
+
+    Returns:
+        int: The number of outbox jobs dispatched.
+    """
+    return dispatch_outbox()
+
+
+@track_job
+def collect_media_garbage():
+    """
+    Remove media files of deleted videos and record the disk usage per video.
+
+    This function is intended to run periodically as a background task using
+    RQ (see RQ_PERIODIC_JOBS).
+
+    Returns:
+        dict: The counts reported by media_gc.collect_media.
+    """
+    return collect_media()
+
+
+@track_job
+def reap_transcodes():
+    """
+    Re-enqueue transcodes whose worker died, so their videos do not stay in "processing".
+
+    This function is intended to run periodically as a background task using
+    RQ (see RQ_PERIODIC_JOBS).
+
+    Returns:
+        int: The number of videos enqueued again.
+    """
+    return reap_stuck_transcodes()
+
+
+@track_job
+def rebuild_typeahead_snapshot():
+    """
+    Write the snapshot of the title suggestion index to Redis.
+
+    This function is intended to run periodically as a background task using
+    RQ (see RQ_PERIODIC_JOBS).
+
+    Returns:
+        int: The version of the snapshot.
+    """
+    return rebuild_snapshot()
@@ -1,17 +1,41 @@
-from unittest.mock import patch
+import gzip
+import json
+import shutil
+import tempfile
+from io import StringIO
+from unittest.mock import MagicMock, patch
 from pathlib import Path
 
 from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.exceptions import ImproperlyConfigured
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django_redis import get_redis_connection
 
 from rest_framework.test import APITestCase
 from rest_framework import status
 
-from content_app.models import Video
+from content_app.analysis import analyse_rendition, analyse_title
+from content_app.management.commands import import_catalog
+from content_app.media_gc import collect_media
+from content_app.models import OutboxJob, Video, WatchProgress
+from content_app.outbox import dispatch_outbox
+from content_app.progress import CONTINUE_EMPTY_KEY, CONTINUE_KEY, PROGRESS_KEY, flush_progress
+from content_app.reaper import reap_stuck_transcodes
+from content_app.segment_cache import SegmentCache
 from content_app.tasks import transcode_video
+from content_app.typeahead import (
+    CHANGES_KEY, MAX_CHANGES, REBUILD_LOCK_KEY, REBUILD_TASK, SNAPSHOT_KEY, VERSION_KEY, PrefixIndex, SharedIndex,
+    publish_changes
+)
+from content_app.utils import COMPLETE_MARKER, generate_hls_files, get_renditions, write_precompressed
+from core import db_router
+from core.startup import group_by_package, parse_importtime
+from core.profiling import PROFILE_HEADER, make_profile_token
 
 User = get_user_model()
 
@@ -27,7 +51,8 @@ class VideoListTests(APITestCase):
             thumbnail_url="http://example.com/thumbnail.jpg",
             category="Sample Category",
             original_file="video/originals/test.mp4",
-            status="pending"
+            status="processing",
+            playable=True
         )
 
 
@@ -42,51 +67,857 @@ class VideoListTests(APITestCase):
         self.assertIn('created_at', response.data[0])
 
 
+    @override_settings(GZIP_MIN_LENGTH=1024)
+    def test_large_json_responses_are_gzip_compressed(self):
+        self.client.post(self.login_url, data={'email': 'testuser@example.com', 'password': 'Test123$'})
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        Video.objects.bulk_create([
+            Video(title=f"Video {index}", description="x" * 100, original_file="video/originals/test.mp4",
+                  playable=True)
+            for index in range(20)
+        ])
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))), 21)
+
+
+    def test_videos_without_published_rendition_are_not_listed(self):
+        Video.objects.create(title="Still Encoding", original_file="video/originals/encoding.mp4")
+        self.client.post(self.login_url, data={'email': 'testuser@example.com', 'password': 'Test123$'})
+
+        response = self.client.get(self.url)
+
+        self.assertEqual([video['title'] for video in response.data], [self.video.title])
+
+
     def test_get_content_list_unauthenticated(self):
         self.client.logout()
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+    @override_settings(METRICS_TOKEN="secret")
+    def test_request_is_exported_as_metric(self):
+        self.client.get(self.url)
+
+        self.assertEqual(self.client.get("/metrics").status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            'videoflix_request_duration_seconds_count{group="list",method="GET",view="video-list"}',
+            response.content.decode(),
+        )
+
+
+class RequestProfilingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='Test123$', email='testuser@example.com')
+        self.client.post(reverse('login'), data={'email': 'testuser@example.com', 'password': 'Test123$'})
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.profile_dir = Path(settings.MEDIA_ROOT) / "test_profiles"
+
+
+    def test_signed_header_profiles_request(self):
+        with self.settings(REQUEST_PROFILING_ENABLED=True, REQUEST_PROFILING_DIR=str(self.profile_dir)):
+            self.client.handler.load_middleware()
+            response = self.client.get(reverse('video-list'), headers={PROFILE_HEADER: make_profile_token()})
+            unsigned = self.client.get(reverse('video-list'), headers={PROFILE_HEADER: "profile"})
+
+        name = response["X-Videoflix-Profile-Id"]
+        report = json.loads((self.profile_dir / f"{name}.json").read_text())
+        self.assertEqual(report["view"], "video-list")
+        self.assertGreater(report["sql"]["count"], 0)
+        self.assertTrue((self.profile_dir / f"{name}.folded").exists())
+        self.assertNotIn("X-Videoflix-Profile-Id", unsigned)
+
+
+class VideoSearchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='Test123$', email='testuser@example.com')
+        self.client.post(reverse('login'), data={'email': 'testuser@example.com', 'password': 'Test123$'})
+        self.url = reverse('video-search')
+        for index in range(5):
+            Video.objects.create(
+                title=f"Ocean Documentary {index}", description="Whales and dolphins.", category="Nature",
+                original_file=f"video/originals/ocean{index}.mp4", playable=True
+            )
+        Video.objects.create(
+            title="City Lights", description="A drama near the ocean.", category="Drama",
+            original_file="video/originals/city.mp4", playable=True
+        )
+        Video.objects.create(
+            title="Ocean Rising", description="Still encoding.", category="Nature",
+            original_file="video/originals/rising.mp4"
+        )
+
+
+    def test_title_matches_rank_first_and_pages_do_not_overlap(self):
+        first = self.client.get(self.url, {"q": "oceans", "limit": 4})
+        second = self.client.get(self.url, {"q": "oceans", "limit": 4, "cursor": first.data["next"]})
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        titles = [video["title"] for video in first.data["results"] + second.data["results"]]
+        self.assertEqual(len(titles), 6)
+        self.assertEqual(len(set(titles)), 6)
+        self.assertEqual(titles[-1], "City Lights")
+        self.assertIsNone(second.data["next"])
+
+
+    def test_category_filter(self):
+        response = self.client.get(self.url, {"q": "ocean", "category": "Drama"})
+
+        self.assertEqual([video["title"] for video in response.data["results"]], ["City Lights"])
+
+
+class TypeaheadTests(APITestCase):
+    def setUp(self):
+        get_redis_connection("default").delete(VERSION_KEY, CHANGES_KEY, SNAPSHOT_KEY, REBUILD_LOCK_KEY)
+        self.mock_get_queue = self.enterContext(patch("content_app.typeahead.django_rq")).get_queue
+        self.user = User.objects.create_user(username='testuser', password='Test123$', email='testuser@example.com')
+        self.client.post(reverse('login'), data={'email': 'testuser@example.com', 'password': 'Test123$'})
+        self.video = Video.objects.create(
+            title="Ocean Documentary", original_file="video/originals/ocean.mp4", playable=True
+        )
+
+
+    def tearDown(self):
+        get_redis_connection("default").delete(VERSION_KEY, CHANGES_KEY, SNAPSHOT_KEY, REBUILD_LOCK_KEY)
+
+
+    def test_prefix_index_matches_word_starts(self):
+        index = PrefixIndex({1: "Die Straße", 2: "Strange Days", 3: "Ocean's Eleven"})
+
+        self.assertEqual(index.search("STRA", 10), [(2, "Strange Days"), (1, "Die Straße")])
+        self.assertEqual(index.search("oceans e", 10), [(3, "Ocean's Eleven")])
+        self.assertEqual(index.search("ays", 10), [])
+
+        index.set(2, "Night Shift")
+        index.set(3, None)
+        self.assertEqual(index.search("stra", 10), [(1, "Die Straße")])
+        self.assertEqual(index.search("o", 10), [])
+
+
+    @override_settings(TYPEAHEAD_SYNC_INTERVAL=0)
+    def test_changes_reach_other_workers_and_requests_skip_the_database(self):
+        worker = SharedIndex()
+        with patch("content_app.typeahead.shared_index", worker):
+            response = self.client.get(reverse('video-suggest'), {"q": "doc"})
+            self.assertEqual(response.data, [{"id": self.video.id, "title": "Ocean Documentary"}])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.video.title = "Deep Sea"
+                self.video.save()
+                Video.objects.create(title="Documenta", original_file="video/originals/documenta.mp4", playable=True)
+                Video.objects.create(title="Docking", original_file="video/originals/docking.mp4")
+
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse('video-suggest'), {"q": "doc"})
+            self.assertEqual([video["title"] for video in response.data], ["Documenta"])
+
+
+    @override_settings(TYPEAHEAD_SYNC_INTERVAL=0)
+    def test_videos_are_suggested_only_while_playable(self):
+        with patch("content_app.typeahead.shared_index", SharedIndex()):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.video.playable = False
+                self.video.save(update_fields=["playable"])
+            self.assertEqual(self.client.get(reverse('video-suggest'), {"q": "ocean"}).data, [])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.video.playable = True
+                self.video.save(update_fields=["playable"])
+            response = self.client.get(reverse('video-suggest'), {"q": "ocean"})
+
+        self.assertEqual(response.data, [{"id": self.video.id, "title": "Ocean Documentary"}])
+
+
+    def test_only_changed_titles_are_published(self):
+        with patch("content_app.signals.publish_changes") as mock_publish, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.video.status = "ready"
+            self.video.save()
+            Video.objects.get(id=self.video.id).save()
+            Video.objects.create(title="Not playable yet", original_file="video/originals/new.mp4")
+            self.video.title = "Deep Sea"
+            self.video.save()
+
+        mock_publish.assert_called_once_with([(self.video.id, "Deep Sea")])
+
+
+    @override_settings(TYPEAHEAD_SYNC_INTERVAL=0)
+    def test_missing_snapshot_is_rebuilt_in_the_background(self):
+        worker = SharedIndex()
+        with patch("content_app.typeahead.shared_index", worker):
+            self.client.get(reverse('video-suggest'), {"q": "doc"})
+            # More changes than kept, so the worker cannot replay them
+            publish_changes([(self.video.id, "Deep Sea")] * (MAX_CHANGES + 1))
+
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse('video-suggest'), {"q": "doc"})
+                self.client.get(reverse('video-suggest'), {"q": "doc"})
+
+        self.assertEqual(response.data, [{"id": self.video.id, "title": "Ocean Documentary"}])
+        self.mock_get_queue.assert_called_once_with("periodic")
+        self.mock_get_queue.return_value.enqueue.assert_called_once_with(REBUILD_TASK)
+
+
+    def test_falls_back_to_the_database_without_redis(self):
+        with patch("content_app.typeahead.shared_index", SharedIndex()),\
+                patch("content_app.typeahead.get_redis_connection", side_effect=ConnectionError):
+            response = self.client.get(reverse('video-suggest'), {"q": "ocean"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{"id": self.video.id, "title": "Ocean Documentary"}])
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"], DB_REPLICA_MAX_LAG=2, DB_REPLICA_LAG_CHECK_INTERVAL=0)
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = db_router.PrimaryReplicaRouter()
+        self.token = db_router.start_request(pinned=False)
+
+
+    def tearDown(self):
+        db_router.end_request(self.token)
+
+
+    @patch("core.db_router.get_replica_lag", return_value=0.1)
+    def test_request_reads_use_replica_until_first_write(self, mock_lag):
+        self.assertEqual(self.router.db_for_read(Video), "replica_1")
+        self.assertEqual(self.router.db_for_write(Video), "default")
+        self.assertEqual(self.router.db_for_read(Video), "default")
+
+
+    @patch("core.db_router.get_replica_lag", return_value=30)
+    def test_lagging_replica_falls_back_to_primary(self, mock_lag):
+        self.assertEqual(self.router.db_for_read(Video), "default")
+
+
+    @patch("core.db_router.connections")
+    def test_disconnected_replica_falls_back_to_primary(self, mock_connections):
+        cursor = mock_connections.__getitem__.return_value.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (None,)
+
+        self.assertEqual(db_router.get_replica_lag("replica_1"), float("inf"))
+        self.assertFalse(db_router.is_replica_healthy("replica_1"))
+
+
+    @patch("core.db_router.get_replica_lag", return_value=0)
+    def test_reads_outside_requests_use_primary(self, mock_lag):
+        db_router.end_request(self.token)
+        self.token = db_router.start_request(pinned=None)
+        self.assertEqual(self.router.db_for_read(Video), "default")
+
+
+class ReplicaLagQueryTests(TestCase):
+
+    def test_primary_reports_no_lag(self):
+        self.assertEqual(db_router.get_replica_lag("default"), 0)
+
+
+class StartupProfileTests(SimpleTestCase):
+
+    def test_import_times_are_grouped_by_package(self):
+        output = "\n".join([
+            "import time: self [us] | cumulative | imported package",
+            "import time:       120 |        120 |     redis.utils",
+            "import time:       300 |        420 |   redis",
+            "import time:        80 |        500 | rq",
+        ])
+
+        imports = parse_importtime(output)
+
+        self.assertEqual(imports[1], ("redis", 300, 420, 1))
+        self.assertEqual(group_by_package(imports), [("redis", 420), ("rq", 80)])
+
+
+    def test_command_profiles_a_fresh_process(self):
+        out = StringIO()
+        call_command("profile_startup", "--target", "setup", "--limit", "5", stdout=out)
+
+        self.assertIn("setup: ", out.getvalue())
+        self.assertIn("django", out.getvalue())
+
+
+class WatchProgressTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='Test123$', email='testuser@example.com')
+        self.video = Video.objects.create(
+            title="Sample Video",
+            description="This is a sample video description.",
+            thumbnail_url="http://example.com/thumbnail.jpg",
+            category="Sample Category",
+            original_file="video/originals/test.mp4",
+        )
+
+
+    @patch("content_app.progress.get_redis_connection")
+    def test_heartbeat_is_stored_in_redis(self, mock_connection):
+        pipeline = mock_connection.return_value.pipeline.return_value
+        self.client.force_authenticate(self.user)
+
+        response = self.client.post(reverse('watch-progress', args=[self.video.id]), {'position': 42.5}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        pipeline.sadd.assert_called_once_with("videoflix:progress:dirty", f"{self.user.id}:{self.video.id}")
+        pipeline.execute.assert_called_once()
+        self.assertFalse(WatchProgress.objects.exists())
+
+
+    @patch("content_app.progress.get_redis_connection")
+    def test_flush_upserts_positions(self, mock_connection):
+        redis = mock_connection.return_value
+        redis.spop.side_effect = [[f"{self.user.id}:{self.video.id}".encode(), f"{self.user.id}:99999".encode()], []]
+        redis.pipeline.return_value.execute.return_value = [b"42.5:0:1700000000.0", b"10.0:0:1700000000.0"]
+        WatchProgress.objects.create(user=self.user, video=self.video, position=1, updated_at="2023-01-01T00:00:00Z")
+
+        written = flush_progress()
+
+        self.assertEqual(written, 1)
+        self.assertEqual(WatchProgress.objects.get(user=self.user, video=self.video).position, 42.5)
+
+
+    def test_heartbeat_for_unknown_video_is_rejected(self):
+        self.client.force_authenticate(self.user)
+
+        with patch("content_app.progress.get_redis_connection") as mock_connection:
+            response = self.client.post(reverse('watch-progress', args=[99999]), {'position': 1}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        mock_connection.assert_not_called()
+
+
+    def test_progress_expires_and_empty_list_skips_the_database(self):
+        redis = get_redis_connection("default")
+        keys = [key.format(user_id=self.user.id) for key in (PROGRESS_KEY, CONTINUE_KEY, CONTINUE_EMPTY_KEY)]
+        redis.delete(*keys)
+        self.addCleanup(redis.delete, *keys)
+        self.addCleanup(redis.srem, "videoflix:progress:dirty", f"{self.user.id}:{self.video.id}")
+        self.client.force_authenticate(self.user)
+
+        self.assertEqual(self.client.get(reverse('continue-watching')).data, [])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('continue-watching')).data, [])
+
+        self.client.post(reverse('watch-progress', args=[self.video.id]), {'position': 42.5}, format='json')
+        response = self.client.get(reverse('continue-watching'))
+
+        self.assertEqual([entry["video_id"] for entry in response.data], [self.video.id])
+        self.assertGreater(redis.ttl(keys[0]), 0)
+        self.assertGreater(redis.ttl(keys[1]), 0)
+
+
+    def test_completed_video_is_not_listed_again_before_the_flush(self):
+        redis = get_redis_connection("default")
+        keys = [key.format(user_id=self.user.id) for key in (PROGRESS_KEY, CONTINUE_KEY, CONTINUE_EMPTY_KEY)]
+        redis.delete(*keys)
+        self.addCleanup(redis.delete, *keys)
+        self.addCleanup(redis.srem, "videoflix:progress:dirty", f"{self.user.id}:{self.video.id}")
+        WatchProgress.objects.create(user=self.user, video=self.video, position=10, updated_at="2023-01-01T00:00:00Z")
+        self.client.force_authenticate(self.user)
+
+        self.assertEqual(len(self.client.get(reverse('continue-watching')).data), 1)
+        self.client.post(
+            reverse('watch-progress', args=[self.video.id]), {'position': 60, 'completed': True}, format='json'
+        )
+
+        self.assertEqual(self.client.get(reverse('continue-watching')).data, [])
+        self.assertEqual(redis.zcard(keys[1]), 0)
+
+
 class VideoUploadTests(TestCase):
 
-    @patch("content_app.signals.django_rq.get_queue")  
-    def test_admin_upload_triggers_transcoding(self, mock_job):
+    @patch("content_app.outbox.Job.fetch_many")
+    @patch("content_app.outbox.django_rq.get_queue")
+    def test_admin_upload_triggers_transcoding(self, mock_job, mock_fetch_many):
         mock_queue = mock_job.return_value
+        mock_fetch_many.side_effect = lambda job_ids, connection: [None for _ in job_ids]
         fake_video = SimpleUploadedFile(
             name="test.mp4",
             content=b"\x00" * 1024,
             content_type="video/mp4"
         )
 
-        video = Video.objects.create(
-            title="Test Video",
-            description="Test description",
-            thumbnail_url="https://example.com/thumb.jpg",
-            category="Test",
-            original_file=fake_video,
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            video = Video.objects.create(
+                title="Test Video",
+                description="Test description",
+                thumbnail_url="https://example.com/thumb.jpg",
+                category="Test",
+                original_file=fake_video,
+            )
+            # Nothing is enqueued before the transaction commits
+            mock_queue.enqueue_many.assert_not_called()
+            self.assertEqual(OutboxJob.objects.get().args, [video.id])
 
         self.assertIsNotNone(video.id)
-        mock_queue.enqueue.assert_called_once_with(transcode_video, video.id)
+        job_datas = mock_queue.enqueue_many.call_args.args[0]
+        self.assertEqual(job_datas[0].func, "content_app.tasks.transcode_video")
+        self.assertEqual(job_datas[0].args, [video.id])
+        self.assertFalse(OutboxJob.objects.exists())
         self.assertIn("test", video.original_file.name)
         self.assertTrue(video.original_file.name.endswith(".mp4"))
 
 
+    @patch("content_app.outbox.Job.fetch_many")
+    @patch("content_app.outbox.django_rq.get_queue")
+    def test_already_enqueued_outbox_jobs_are_not_enqueued_again(self, mock_job, mock_fetch_many):
+        mock_queue = mock_job.return_value
+        mock_fetch_many.side_effect = lambda job_ids, connection: [MagicMock() for _ in job_ids]
+        OutboxJob.objects.create(task="content_app.tasks.transcode_video", args=[1])
+
+        self.assertEqual(dispatch_outbox(), 1)
+        mock_queue.enqueue_many.assert_not_called()
+        self.assertFalse(OutboxJob.objects.exists())
+
+
+class ImportCatalogTests(TestCase):
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        for name in ("first.mp4", "second.mp4"):
+            (self.directory / name).write_bytes(b"\x00" * 1024)
+        self.manifest = self.directory / "manifest.json"
+        self.manifest.write_text(json.dumps([
+            {"file": "first.mp4", "title": "First", "category": "Drama"},
+            {"file": "second.mp4", "title": "Second", "category": "Comedy"},
+        ]))
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+
+    def test_import_is_batched_and_idempotent(self):
+        call_command("import_catalog", self.directory, self.manifest, stdout=MagicMock())
+
+        self.assertEqual(Video.objects.count(), 2)
+        self.assertEqual(
+            sorted(job.args for job in OutboxJob.objects.all()),
+            sorted([video.id] for video in Video.objects.all()),
+        )
+
+        call_command("import_catalog", self.directory, self.manifest, stdout=MagicMock())
+
+        self.assertEqual(Video.objects.count(), 2)
+        self.assertEqual(OutboxJob.objects.count(), 2)
+
+
+    def test_imported_videos_are_not_suggested_before_they_are_playable(self):
+        with patch("content_app.typeahead.get_redis_connection") as mock_redis, \
+                self.captureOnCommitCallbacks(execute=True):
+            call_command("import_catalog", self.directory, self.manifest, stdout=MagicMock())
+
+        mock_redis.assert_not_called()
+
+
+    def test_rerun_hashes_only_new_files_and_skips_duplicate_entries(self):
+        call_command("import_catalog", self.directory, self.manifest, stdout=MagicMock())
+        (self.directory / "third.mp4").write_bytes(b"\x01" * 1024)
+        self.manifest.write_text(json.dumps([
+            {"file": "first.mp4", "title": "First"},
+            {"file": "second.mp4", "title": "Second"},
+            {"file": "third.mp4", "title": "Third"},
+            {"file": "third.mp4", "title": "Third again"},
+        ]))
+
+        with patch(
+            "content_app.management.commands.import_catalog.get_content_digest", wraps=import_catalog.get_content_digest
+        ) as mock_digest:
+            call_command("import_catalog", self.directory, self.manifest, stdout=MagicMock())
+
+        mock_digest.assert_called_once_with(self.directory.resolve() / "third.mp4")
+        self.assertEqual(sorted(Video.objects.values_list("title", flat=True)), ["First", "Second", "Third"])
+
+
+    def test_files_with_the_same_name_do_not_overwrite_each_other(self):
+        for folder, content in (("a", b"first"), ("b", b"second")):
+            (self.directory / folder).mkdir()
+            (self.directory / folder / "movie.mp4").write_bytes(content)
+        self.manifest.write_text(json.dumps([
+            {"file": "a/movie.mp4", "title": "A"},
+            {"file": "b/movie.mp4", "title": "B"},
+        ]))
+
+        call_command("import_catalog", self.directory, self.manifest, stdout=MagicMock())
+
+        originals = {video.title: video.original_file.read() for video in Video.objects.all()}
+        self.assertEqual(originals, {"A": b"first", "B": b"second"})
+
+
+    def test_paths_outside_the_import_directory_are_refused(self):
+        self.manifest.write_text(json.dumps([{"file": "../outside.mp4", "title": "Outside"}]))
+
+        with self.assertRaises(CommandError):
+            call_command("import_catalog", self.directory, self.manifest, stdout=MagicMock())
+
+
+class MediaGarbageCollectionTests(TestCase):
+    def setUp(self):
+        self.media_root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.video = Video.objects.create(
+            title="Kept", description="", category="Test", original_file="video/originals/kept.mp4",
+            thumbnail_url="video/thumbnails/kept.jpg", status="ready"
+        )
+        self.files = {
+            f"video/{self.video.id}/720p/index0.ts": 1000,
+            f"video/{self.video.id}/retired/index0.ts": 200,
+            f"video/{self.video.id}/old_label/index0.ts": 500,
+            "video/99999/720p/index0.ts": 2000,
+            "video/originals/kept.mp4": 300,
+            "video/originals/orphan.mp4": 400,
+            "video/thumbnails/kept.jpg": 30,
+            "video/thumbnails/orphan.jpg": 40,
+        }
+        for name, size in self.files.items():
+            path = self.media_root / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"\x00" * size)
+        # "retired" is no longer in the configured ladder but still published
+        (self.media_root / f"video/{self.video.id}/index.m3u8").write_text(
+            "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1\n720p/index.m3u8\n#EXT-X-STREAM-INF:BANDWIDTH=1\nretired/index.m3u8\n"
+        )
+
+
+    @override_settings(MEDIA_GC_GRACE_SECONDS=-1, MEDIA_GC_THROTTLE_MS=0)
+    def test_orphans_are_removed_and_usage_recorded(self):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            stats = collect_media()
+
+        self.assertEqual(stats["orphan_dirs"], 1)
+        self.assertEqual(stats["stale_renditions"], 1)
+        self.assertEqual(stats["orphan_originals"], 1)
+        self.assertEqual(stats["orphan_thumbnails"], 1)
+        self.assertEqual(stats["freed_bytes"], 2940)
+        self.assertFalse((self.media_root / "video/99999").exists())
+        self.assertTrue((self.media_root / f"video/{self.video.id}/720p/index0.ts").exists())
+        self.assertTrue((self.media_root / f"video/{self.video.id}/retired/index0.ts").exists())
+        self.assertTrue((self.media_root / "video/originals/kept.mp4").exists())
+        self.assertTrue((self.media_root / "video/thumbnails/kept.jpg").exists())
+        self.video.refresh_from_db()
+        master_size = (self.media_root / f"video/{self.video.id}/index.m3u8").stat().st_size
+        self.assertEqual(self.video.storage_bytes, 1500 + master_size)
+
+
+    @override_settings(MEDIA_GC_THROTTLE_MS=0)
+    def test_staging_and_recent_renditions_are_kept(self):
+        staging = self.media_root / f"video/{self.video.id}/.480p.next/index0.ts"
+        staging.parent.mkdir()
+        staging.write_bytes(b"\x00" * 100)
+
+        with self.settings(MEDIA_ROOT=self.media_root, MEDIA_GC_GRACE_SECONDS=3600):
+            stats = collect_media()
+        self.assertEqual(stats["stale_renditions"], 0)
+        self.assertTrue((self.media_root / f"video/{self.video.id}/old_label").exists())
+
+        with self.settings(MEDIA_ROOT=self.media_root, MEDIA_GC_GRACE_SECONDS=-1):
+            stats = collect_media()
+        self.assertEqual(stats["stale_renditions"], 1)
+        self.assertFalse((self.media_root / f"video/{self.video.id}/old_label").exists())
+        self.assertTrue(staging.exists())
+
+
+    @override_settings(MEDIA_GC_GRACE_SECONDS=-1, MEDIA_GC_THROTTLE_MS=0)
+    def test_renditions_are_kept_when_a_transcode_starts_meanwhile(self):
+        in_bulk = Video.objects.in_bulk
+
+        def start_transcode(*args, **kwargs):
+            videos = in_bulk(*args, **kwargs)
+            Video.objects.filter(id=self.video.id).update(status="processing")
+            return videos
+
+        with self.settings(MEDIA_ROOT=self.media_root), \
+                patch("content_app.media_gc.Video.objects.in_bulk", side_effect=start_transcode):
+            stats = collect_media()
+
+        self.assertEqual(stats["stale_renditions"], 0)
+        self.assertTrue((self.media_root / f"video/{self.video.id}/old_label").exists())
+
+
+class RenditionTests(TestCase):
+
+    @override_settings(HLS_EXTRA_CODEC_RESOLUTIONS=["1080p"])
+    def test_extra_codecs_only_for_configured_resolutions(self):
+        renditions = get_renditions(extra_codecs=["hevc"])
+
+        self.assertEqual(len(renditions), 6)
+        self.assertIn(("1080p_hevc", "1920x1080", "hevc"), renditions)
+        self.assertNotIn("720p_hevc", [label for label, _, _ in renditions])
+
+
+class ResumableTranscodeTests(TestCase):
+    def setUp(self):
+        self.media_root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.source = self.media_root / "source.mp4"
+        self.source.write_bytes(b"\x00" * 1024)
+
+
+    @patch("content_app.utils.has_audio_stream", return_value=True)
+    @patch("content_app.utils.subprocess.run")
+    def test_retry_skips_finished_renditions(self, mock_run, mock_has_audio):
+        renditions = len(get_renditions())
+
+        def encode(cmd, check):
+            if mock_run.call_count == 3:
+                raise RuntimeError("worker killed")
+            Path(cmd[-1]).write_text("#EXTM3U")
+
+        mock_run.side_effect = encode
+        with self.settings(MEDIA_ROOT=self.media_root):
+            with self.assertRaises(RuntimeError):
+                generate_hls_files(str(self.source), 1)
+            mock_run.side_effect = lambda cmd, check: Path(cmd[-1]).write_text("#EXTM3U")
+            generate_hls_files(str(self.source), 1)
+
+        # The audio and one video rendition were finished before the crash and are not encoded again
+        self.assertEqual(mock_run.call_count, 3 + renditions + 1 - 2)
+        self.assertTrue((self.media_root / "video/1/index.m3u8").exists())
+
+
+    @override_settings(TRANSCODE_MAX_ATTEMPTS=2)
+    @patch("content_app.reaper.Job.fetch_many")
+    @patch("content_app.reaper.django_rq.get_queue")
+    def test_reaper_re_enqueues_videos_without_live_job(self, mock_get_queue, mock_fetch_many):
+        mock_fetch_many.side_effect = lambda job_ids, connection: [None for _ in job_ids]
+        stuck = Video.objects.create(
+            title="Stuck", description="", category="Test", original_file="video/originals/stuck.mp4",
+            status="processing", transcode_job_id="dead-job", transcode_attempts=1
+        )
+        exhausted = Video.objects.create(
+            title="Exhausted", description="", category="Test", original_file="video/originals/exhausted.mp4",
+            status="processing", transcode_job_id="dead-job-2", transcode_attempts=2
+        )
+        OutboxJob.objects.all().delete()
+
+        self.assertEqual(reap_stuck_transcodes(), 1)
+
+        stuck.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(stuck.status, "pending")
+        self.assertEqual(exhausted.status, "failed")
+        self.assertEqual(OutboxJob.objects.get().args, [stuck.id])
+
+
+class VideoAdminTests(TestCase):
+    def setUp(self):
+        admin_user = User.objects.create_superuser(username='admin', password='Admin123$', email='admin@example.com')
+        self.client.force_login(admin_user)
+        self.url = reverse('admin:content_app_video_changelist')
+        self.videos = {
+            status: Video.objects.create(
+                title=f"{status} video", description="", category="Test",
+                original_file=f"video/originals/{status}.mp4", status=status, transcode_attempts=3
+            )
+            for status in ("pending", "processing", "ready", "failed")
+        }
+        OutboxJob.objects.all().delete()
+
+
+    def run_action(self, action):
+        ids = [video.id for video in self.videos.values()]
+        with self.captureOnCommitCallbacks():
+            return self.client.post(self.url, {"action": action, "_selected_action": ids}, follow=True)
+
+
+    def test_retry_failed_enqueues_only_failed_videos(self):
+        response = self.run_action("retry_failed")
+
+        self.assertContains(response, "Enqueued 1 failed videos again.")
+        failed = Video.objects.get(id=self.videos["failed"].id)
+        self.assertEqual((failed.status, failed.transcode_attempts), ("pending", 0))
+        self.assertEqual(OutboxJob.objects.get().args, [failed.id])
+
+
+    def test_cancelled_video_is_skipped_by_its_queued_job(self):
+        response = self.run_action("cancel")
+
+        self.assertContains(response, "Cancelled 2 videos.")
+        statuses = dict(Video.objects.values_list("title", "status"))
+        self.assertEqual(statuses["pending video"], "failed")
+        self.assertEqual(statuses["ready video"], "ready")
+
+        with patch("content_app.tasks.generate_hls_files") as mock_generate:
+            transcode_video(self.videos["pending"].id)
+        mock_generate.assert_not_called()
+
+
+    def test_video_claimed_by_another_job_is_skipped(self):
+        with patch("content_app.tasks.generate_hls_files") as mock_generate:
+            transcode_video(self.videos["processing"].id)
+
+        mock_generate.assert_not_called()
+        video = Video.objects.get(id=self.videos["processing"].id)
+        self.assertEqual((video.status, video.transcode_attempts), ("processing", 3))
+
+
+    def test_changelist_search_uses_full_text_index(self):
+        response = self.client.get(self.url, {"q": "ready"})
+
+        self.assertContains(response, "ready video")
+        self.assertContains(response, "1 result")
+
+
+class ProgressivePublishingTests(TestCase):
+    def setUp(self):
+        self.media_root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.source = self.media_root / "source.mp4"
+        self.source.write_bytes(b"\x00" * 1024)
+        self.video = Video.objects.create(title="Progressive", original_file="source.mp4")
+
+
+    @patch("content_app.utils.has_audio_stream", return_value=True)
+    @patch("content_app.utils.subprocess.run")
+    def test_video_is_playable_with_its_first_rendition(self, mock_run, mock_has_audio):
+        master = self.media_root / f"video/{self.video.id}/index.m3u8"
+
+        def encode(cmd, check):
+            # The audio is encoded first; the third video rendition fails and the finished ones stay published
+            if mock_run.call_count == 4:
+                raise RuntimeError("ffmpeg failed")
+            self.video.refresh_from_db()
+            self.assertEqual(self.video.playable, mock_run.call_count > 2)
+            Path(cmd[-1]).write_text("#EXTM3U")
+
+        mock_run.side_effect = encode
+        with self.settings(MEDIA_ROOT=self.media_root):
+            with self.assertRaises(RuntimeError):
+                transcode_video(self.video.id)
+
+        self.video.refresh_from_db()
+        self.assertEqual((self.video.status, self.video.playable), ("failed", True))
+        variants = [line for line in master.read_text().splitlines() if not line.startswith("#")]
+        self.assertEqual(variants, ["120p/index.m3u8", "360p/index.m3u8"])
+
+
+    @patch("content_app.utils.has_audio_stream", return_value=True)
+    @patch("content_app.utils.subprocess.run")
+    def test_re_transcode_keeps_previous_renditions_published(self, mock_run, mock_has_audio):
+        master = self.media_root / f"video/{self.video.id}/index.m3u8"
+        mock_run.side_effect = lambda cmd, check: Path(cmd[-1]).write_text("#EXTM3U")
+        with self.settings(MEDIA_ROOT=self.media_root):
+            generate_hls_files(str(self.source), self.video.id)
+            previous = master.read_text()
+
+            def encode(cmd, check):
+                # Only 120p and 360p change; 120p is replaced, 360p fails
+                if mock_run.call_count == 2:
+                    raise RuntimeError("ffmpeg failed")
+                Path(cmd[-1]).write_text("#EXTM3U")
+
+            mock_run.reset_mock()
+            mock_run.side_effect = encode
+            published = []
+            with self.assertRaises(RuntimeError):
+                generate_hls_files(str(self.source), self.video.id, encoding_profile={
+                    "120p": {"crf": 30, "bitrate": 100000}, "360p": {"crf": 30, "bitrate": 300000},
+                }, on_publish=published.append)
+
+        self.assertTrue(all(labels == [label for label, _, _ in get_renditions()] for labels in published))
+        self.assertNotEqual(master.read_text(), previous)
+        self.assertIn("BANDWIDTH=278000", master.read_text())
+        self.assertEqual(master.read_text().count("#EXT-X-STREAM-INF"), len(get_renditions()))
+        self.assertTrue((self.media_root / f"video/{self.video.id}/360p/{COMPLETE_MARKER}").exists())
+
+
+    @patch("content_app.utils.has_audio_stream", return_value=True)
+    @patch("content_app.utils.subprocess.run")
+    def test_audio_is_encoded_once_into_a_shared_group(self, mock_run, mock_has_audio):
+        mock_run.side_effect = lambda cmd, check: Path(cmd[-1]).write_text("#EXTM3U")
+        with self.settings(MEDIA_ROOT=self.media_root):
+            generate_hls_files(str(self.source), self.video.id)
+
+        commands = [call.args[0] for call in mock_run.call_args_list]
+        self.assertEqual(sum("-c:a" in cmd for cmd in commands), 1)
+        self.assertTrue(all("-an" in cmd for cmd in commands[1:]))
+
+        master = (self.media_root / f"video/{self.video.id}/index.m3u8").read_text()
+        self.assertEqual(master.count('#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio"'), 1)
+        self.assertEqual(master.count('AUDIO="audio"'), len(get_renditions()))
+
+
+class PerTitleAnalysisTests(TestCase):
+
+    @override_settings(
+        PER_TITLE_CRF_CANDIDATES=[21, 24, 27, 30], PER_TITLE_QUALITY_TARGET=0.96, PER_TITLE_MAXRATE_FACTORS=[1.5, 1.2]
+    )
+    @patch("content_app.analysis.measure_quality")
+    @patch("content_app.analysis.encode_sample")
+    def test_picks_cheapest_crf_and_bitrate_cap_meeting_target(self, mock_encode, mock_measure):
+        # A cap of 1.2x the bitrate costs quality, 1.5x does not
+        scores = {(30, 0): 0.93, (27, 0): 0.97, (24, 0): 0.98, (21, 0): 0.99, (27, 1200): 0.95, (27, 1500): 0.965}
+        mock_encode.side_effect = lambda *args: 1000
+        mock_measure.side_effect = lambda *args: scores[tuple(int(part) for part in args[4].stem.split("_")[1::2])]
+
+        choice = analyse_rendition("input.mp4", [0.0, 10.0], 4, "1280x720", Path("/tmp"))
+
+        self.assertEqual((choice["crf"], choice["maxrate"], choice["quality"]), (27, 1500, 0.965))
+        # Bisection probes CRF 27 and 30, then both caps are probed, with two samples each
+        self.assertEqual(mock_encode.call_count, 8)
+
+
+    @override_settings(PER_TITLE_METRIC="vmaf", PER_TITLE_QUALITY_TARGET=0.96)
+    def test_quality_target_must_match_the_metric_scale(self):
+        with self.assertRaises(ImproperlyConfigured):
+            analyse_title("input.mp4")
+
+
+class SegmentCacheTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.path = Path(settings.MEDIA_ROOT) / "segment-cache-test"
+        self.cache = SegmentCache(self.path, size=2 * 1024, slot_size=1024)
+
+
+    def test_segment_is_admitted_on_second_miss(self):
+        self.assertFalse(self.cache.put("1/720p/index0.ts", b"segment-0"))
+        self.assertIsNone(self.cache.get("1/720p/index0.ts"))
+
+        self.assertTrue(self.cache.put("1/720p/index0.ts", b"segment-0"))
+        self.assertEqual(self.cache.get("1/720p/index0.ts"), b"segment-0")
+
+
+    def test_referenced_segment_survives_eviction(self):
+        for key in ["a", "b", "a", "b"]:
+            self.cache.put(key, key.encode())
+        self.cache.get("a")
+
+        for key in ["c", "c"]:
+            self.cache.put(key, key.encode())
+
+        self.assertEqual(self.cache.get("a"), b"a")
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("c"), b"c")
+
+
 class VideoStreamingTests(TestCase):
     def setUp(self):
         self.movie_id = 1
         self.resolution = "720p"
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
 
         self.base = Path(settings.MEDIA_ROOT) / f"video/{self.movie_id}/{self.resolution}"
         self.base.mkdir(parents=True, exist_ok=True)
 
         self.playlist = self.base / "index.m3u8"
         self.playlist.write_text("#EXTM3U")
+        (self.base / COMPLETE_MARKER).write_text("fingerprint")
 
         self.segment = self.base / "seg1.ts"
         self.segment.write_bytes(b"fake-ts-data")
 
+        self.single_file = self.base / "stream.mp4"
+        self.single_file.write_bytes(b"fake-fmp4-data")
+
 
     def test_playlist_returns_file(self):
         url = reverse("video-playlist", args=[self.movie_id, self.resolution])
@@ -96,6 +927,19 @@ class VideoStreamingTests(TestCase):
         self.assertEqual(response["Content-Type"], "application/vnd.apple.mpegurl")
 
 
+    def test_playlist_is_served_precompressed(self):
+        write_precompressed(self.playlist, self.playlist.read_bytes())
+        url = reverse("video-playlist", args=[self.movie_id, self.resolution])
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip;q=0.5, br;q=0")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), b"#EXTM3U")
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="identity")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+
     def test_playlist_missing_returns_404(self):
         url = reverse("video-playlist", args=[99999, "720p"])
         response = self.client.get(url)
@@ -115,4 +959,92 @@ class VideoStreamingTests(TestCase):
         url = reverse("video-segment",
                       args=[1, "720p", "missing.ts"])
         response = self.client.get(url)
-        self.assertEqual(response.status_code, 404)
\ No newline at end of file
+        self.assertEqual(response.status_code, 404)
+
+
+    def test_single_file_segment_returns_byte_range(self):
+        url = reverse("video-segment",
+                      args=[self.movie_id, self.resolution, "stream.mp4"])
+        response = self.client.get(url, HTTP_RANGE="bytes=5-8")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Type"], "video/mp4")
+        self.assertEqual(response["Content-Range"], "bytes 5-8/14")
+        self.assertEqual(response.content, b"fmp4")
+
+
+    def test_single_file_is_reopened_after_re_transcode(self):
+        url = reverse("video-segment", args=[self.movie_id, self.resolution, "stream.mp4"])
+        self.client.get(url, HTTP_RANGE="bytes=5-8")
+
+        # A re-transcode replaces the file with a new inode of the same size
+        self.single_file.unlink()
+        self.single_file.write_bytes(b"next-fmp4-data")
+        response = self.client.get(url, HTTP_RANGE="bytes=0-3")
+
+        self.assertEqual(response.content, b"next")
+
+
+    def test_single_file_unsatisfiable_range_returns_416(self):
+        url = reverse("video-segment",
+                      args=[self.movie_id, self.resolution, "stream.mp4"])
+        response = self.client.get(url, HTTP_RANGE="bytes=100-200")
+
+        self.assertEqual(response.status_code, 416)
+
+
+    def test_segment_served_from_shared_cache(self):
+        cache_path = Path(settings.MEDIA_ROOT) / "segment-cache-test"
+        url = reverse("video-segment", args=[self.movie_id, self.resolution, "seg1.ts"])
+
+        with override_settings(SEGMENT_CACHE_SIZE_MB=1, SEGMENT_CACHE_SLOT_KB=64, SEGMENT_CACHE_PATH=str(cache_path)):
+            self.client.get(url)
+            self.client.get(url)
+            self.segment.unlink()
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"fake-ts-data")
+
+
+    def test_re_transcoded_segment_is_not_served_from_shared_cache(self):
+        cache_path = Path(settings.MEDIA_ROOT) / "segment-cache-test"
+        url = reverse("video-segment", args=[self.movie_id, self.resolution, "seg1.ts"])
+        other_url = reverse("video-segment", args=[2, self.resolution, "seg1.ts"])
+        other = Path(settings.MEDIA_ROOT) / f"video/2/{self.resolution}"
+        other.mkdir(parents=True, exist_ok=True)
+        (other / "seg1.ts").write_bytes(b"other-ts-data")
+        (other / COMPLETE_MARKER).write_text("fingerprint")
+
+        with override_settings(SEGMENT_CACHE_SIZE_MB=1, SEGMENT_CACHE_SLOT_KB=64, SEGMENT_CACHE_PATH=str(cache_path)):
+            for _ in range(2):
+                self.client.get(url)
+                self.client.get(other_url)
+            # Published like utils.replace_rendition() does it
+            staging = self.base.with_name(f".{self.resolution}.next")
+            staging.mkdir()
+            (staging / "seg1.ts").write_bytes(b"new-ts-data")
+            (staging / COMPLETE_MARKER).write_text("fingerprint")
+            self.base.rename(self.base.with_name(f".{self.resolution}.old"))
+            staging.rename(self.base)
+            (other / "seg1.ts").unlink()
+
+            response = self.client.get(url)
+            other_response = self.client.get(other_url)
+
+        self.assertEqual(response.content, b"new-ts-data")
+        self.assertEqual(other_response.content, b"other-ts-data")
+
+
+    @override_settings(SEGMENT_PREFETCH_COUNT=2)
+    @patch("content_app.streaming.os.posix_fadvise")
+    def test_sequential_segments_are_prefetched(self, mock_fadvise):
+        for number in range(4):
+            (self.base / f"index{number}.ts").write_bytes(b"fake-ts-data")
+
+        for number in range(2):
+            url = reverse("video-segment", args=[self.movie_id, self.resolution, f"index{number}.ts"])
+            self.client.get(url)
+
+        # index1.ts continues index0.ts, so index2.ts and index3.ts are read ahead
+        self.assertEqual(mock_fadvise.call_count, 2)
\ No newline at end of file
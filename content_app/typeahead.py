@@ -0,0 +1,260 @@
+"""
+In-process prefix index for title suggestions (typeahead).
+
+Every worker keeps a PrefixIndex of the normalized titles of the playable
+videos in memory:
+a sorted list of keys (the title from each word on, so "doc" finds
+"Ocean Documentary") with the video id of every key. A lookup is a binary
+search plus a short scan and never touches Postgres.
+
+Workers are kept in sync through Redis:
+
+    videoflix:typeahead:version     counter, incremented by every change
+    videoflix:typeahead:changes     list of the last changes as JSON {"v", "id", "title"}
+                                    (title null for deleted videos)
+    videoflix:typeahead:snapshot    zlib-compressed JSON {"v", "titles"} of the whole index
+
+Video save and delete signals publish changes after the commit; a video
+that stops being playable is published as removed. Before a
+lookup, a worker compares its version with Redis at most every
+TYPEAHEAD_SYNC_INTERVAL seconds and replays the missing changes, or loads
+the snapshot if they were trimmed. The snapshot is rebuilt from the database
+by the periodic rebuild_typeahead_snapshot task. If it is missing or older
+than the kept changes, a rebuild is enqueued into the "periodic" queue and
+workers keep serving their index until it is done; only a worker without an
+index yet reads the titles from the database itself. Without Redis, workers
+build their index from the database.
+"""
+
+import json
+import logging
+import threading
+import time
+import unicodedata
+import zlib
+from bisect import bisect_left
+
+import django_rq
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from .models import Video
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "videoflix:typeahead:version"
+CHANGES_KEY = "videoflix:typeahead:changes"
+SNAPSHOT_KEY = "videoflix:typeahead:snapshot"
+# Guards the rebuilds enqueued by workers, so they are enqueued once per REBUILD_LOCK_SECONDS.
+REBUILD_LOCK_KEY = "videoflix:typeahead:rebuild"
+REBUILD_LOCK_SECONDS = 60
+REBUILD_TASK = "content_app.tasks.rebuild_typeahead_snapshot"
+
+MAX_CHANGES = 10000
+
+APOSTROPHES = "'\u2019"
+
+
+def normalize(text: str):
+    """ Lowercase, strip accents, apostrophes and punctuation and collapse whitespace. """
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    characters = (
+        character if character.isalnum() else " "
+        for character in decomposed
+        if not unicodedata.combining(character) and character not in APOSTROPHES
+    )
+    return " ".join("".join(characters).split())
+
+
+class PrefixIndex:
+    """ Sorted keys of normalized titles, starting at every word, with the matching video ids. """
+
+    def __init__(self, titles=None):
+        self.titles = dict(titles or {})
+        entries = sorted((key, video_id) for video_id, title in self.titles.items() for key in self.keys(title))
+        self.entries = [key for key, _ in entries]
+        self.ids = [video_id for _, video_id in entries]
+
+    @staticmethod
+    def keys(title: str):
+        words = normalize(title).split(" ")
+        return {" ".join(words[index:]) for index in range(len(words)) if words[index]}
+
+    def set(self, video_id: int, title):
+        """ Add, rename (title) or remove (title None) a video. """
+        old_title = self.titles.pop(video_id, None)
+        if old_title is not None:
+            for key in self.keys(old_title):
+                position = bisect_left(self.entries, key)
+                while self.ids[position] != video_id:
+                    position += 1
+                del self.entries[position]
+                del self.ids[position]
+
+        if title is not None:
+            self.titles[video_id] = title
+            for key in self.keys(title):
+                position = bisect_left(self.entries, key)
+                while position < len(self.entries) and self.entries[position] == key and self.ids[position] < video_id:
+                    position += 1
+                self.entries.insert(position, key)
+                self.ids.insert(position, video_id)
+
+    def search(self, prefix: str, limit: int):
+        """
+        Return up to `limit` (video_id, title) pairs with a word starting with `prefix`.
+
+        Titles starting with the prefix come first, then matches inside titles,
+        each in alphabetical order.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        leading, inner = [], []
+        seen = set()
+        position = bisect_left(self.entries, prefix)
+        while position < len(self.entries) and self.entries[position].startswith(prefix):
+            video_id = self.ids[position]
+            if video_id not in seen:
+                seen.add(video_id)
+                title = self.titles[video_id]
+                (leading if normalize(title).startswith(prefix) else inner).append((video_id, title))
+                if len(leading) >= limit:
+                    break
+            position += 1
+        return (leading + inner)[:limit]
+
+
+def load_titles():
+    """ Return the titles of all playable videos by id. """
+    return dict(Video.objects.filter(playable=True).values_list("id", "title").iterator(chunk_size=5000))
+
+
+def rebuild_snapshot():
+    """
+    Write the snapshot of all titles to Redis.
+
+    The version is read before the titles, so changes made during the rebuild
+    are replayed on top of the snapshot again, which is harmless.
+
+    Returns:
+        int: The version of the snapshot.
+    """
+    redis = get_redis_connection("default")
+    version = int(redis.get(VERSION_KEY) or 0)
+    titles = load_titles()
+    snapshot = zlib.compress(json.dumps({"v": version, "titles": titles}).encode())
+    redis.set(SNAPSHOT_KEY, snapshot)
+    return version
+
+
+def request_rebuild(redis):
+    """ Enqueue a rebuild of the snapshot into the "periodic" queue, unless one was enqueued recently. """
+    if redis.set(REBUILD_LOCK_KEY, 1, nx=True, ex=REBUILD_LOCK_SECONDS):
+        django_rq.get_queue("periodic").enqueue(REBUILD_TASK)
+
+
+def publish_changes(changes):
+    """
+    Publish changed videos to all workers.
+
+    Args:
+        changes: (video_id, title) pairs, with title None for deleted videos.
+    """
+    if not changes:
+        return
+    redis = get_redis_connection("default")
+    last_version = redis.incrby(VERSION_KEY, len(changes))
+    first_version = last_version - len(changes) + 1
+    pipeline = redis.pipeline(transaction=False)
+    pipeline.rpush(CHANGES_KEY, *(
+        json.dumps({"v": version, "id": video_id, "title": title})
+        for version, (video_id, title) in enumerate(changes, start=first_version)
+    ))
+    pipeline.ltrim(CHANGES_KEY, -MAX_CHANGES, -1)
+    pipeline.execute()
+
+
+class SharedIndex:
+    """ The PrefixIndex of this process, synchronized with the Redis snapshot and change log. """
+
+    def __init__(self):
+        self.index = None
+        self.version = 0
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if self.index is not None and now - self.checked_at < settings.TYPEAHEAD_SYNC_INTERVAL:
+            return self.index
+
+        with self.lock:
+            if self.index is None or now - self.checked_at >= settings.TYPEAHEAD_SYNC_INTERVAL:
+                try:
+                    self.sync(get_redis_connection("default"))
+                except Exception as error:
+                    logger.warning("Typeahead sync with Redis failed: %s", error)
+                    if self.index is None:
+                        self.index = PrefixIndex(load_titles())
+                self.checked_at = now
+        return self.index
+
+    def sync(self, redis):
+        version = int(redis.get(VERSION_KEY) or 0)
+        if self.index is not None and version <= self.version:
+            return
+
+        # Only the changes this worker is missing are read, unless it needs the snapshot.
+        behind = min(version - self.version, MAX_CHANGES) if self.index is not None else MAX_CHANGES
+        changes = sorted(
+            (json.loads(change) for change in redis.lrange(CHANGES_KEY, -behind, -1)),
+            key=lambda change: change["v"],
+        )
+        missing = [change for change in changes if change["v"] > self.version]
+        if self.index is None or (missing and missing[0]["v"] > self.version + 1):
+            if not self.load_snapshot(redis, changes):
+                return
+            missing = [change for change in changes if change["v"] > self.version]
+
+        # The version only advances with applied changes, as a change may be
+        # counted before it is pushed to the list.
+        for change in missing:
+            self.index.set(change["id"], change["title"])
+            self.version = change["v"]
+
+    def load_snapshot(self, redis, changes):
+        """
+        Load the snapshot, unless it is missing or older than the kept changes.
+
+        In that case a rebuild is enqueued and the current index is kept until
+        it is done. A worker without an index reads the titles from the
+        database instead, reading the version first like rebuild_snapshot().
+
+        Returns:
+            bool: Whether the index was replaced.
+        """
+        snapshot = redis.get(SNAPSHOT_KEY)
+        data = json.loads(zlib.decompress(snapshot)) if snapshot is not None else None
+        if data is None or (changes and changes[0]["v"] > data["v"] + 1):
+            request_rebuild(redis)
+            if self.index is not None:
+                return False
+            data = {"v": int(redis.get(VERSION_KEY) or 0), "titles": load_titles()}
+        self.index = PrefixIndex({int(video_id): title for video_id, title in data["titles"].items()})
+        self.version = data["v"]
+        return True
+
+
+shared_index = SharedIndex()
+
+
+def get_suggestions(prefix: str, limit: int = 10):
+    """
+    Return up to `limit` videos with a title word starting with `prefix`.
+
+    Returns:
+        list[dict]: Entries with "id" and "title".
+    """
+    return [{"id": video_id, "title": title} for video_id, title in shared_index.get().search(prefix, limit)]
@@ -1,7 +1,23 @@
+import gzip
+import hashlib
+import logging
+import os
+import shutil
 import subprocess
+import time
 from pathlib import Path
 
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from core.metrics import FFMPEG_ENCODE_SECONDS, FFMPEG_ENCODE_SPEED
+
+try:
+    import brotli
+except ImportError:  # Playlists are precompressed with gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
 
 RESOLUTIONS = {
     "120p": "214x120",
@@ -11,7 +27,251 @@ RESOLUTIONS = {
     "1080p": "1920x1080",
 }
 
-def generate_hls_files(input_path: str, video_id: int):
+# Encoder settings per video codec. Profile and level are pinned so that the
+# CODECS attribute written to the master playlist matches the encoded stream.
+VIDEO_CODECS = {
+    "h264": {
+        "args": ["-c:v", "libx264", "-preset", "veryfast", "-profile:v", "high", "-level:v", "4.1"],
+        "codecs": "avc1.640029",
+    },
+    "hevc": {
+        "args": ["-c:v", "libx265", "-preset", "veryfast", "-profile:v", "main",
+                 "-x265-params", "level-idc=4.1:log-level=error", "-tag:v", "hvc1"],
+        "codecs": "hvc1.1.6.L123.B0",
+    },
+    "av1": {
+        "args": ["-c:v", "libsvtav1", "-preset", "8", "-svtav1-params", "tune=0"],
+        "codecs": "av01.0.08M.08",
+    },
+}
+
+DEFAULT_CODEC = "h264"
+AUDIO_CODECS = "mp4a.40.2"
+AUDIO_BITRATE = 128000
+
+# Audio is encoded once into this rendition directory and shared by all video
+# renditions through an EXT-X-MEDIA audio group in the master playlist.
+AUDIO_LABEL = "audio"
+AUDIO_GROUP = "audio"
+
+# BANDWIDTH announced for renditions without a per-title encoding profile.
+DEFAULT_BANDWIDTH = 800000
+
+# Written into a rendition directory once its encode finished. It holds the
+# fingerprint of the encode, so a retried transcode skips finished renditions.
+COMPLETE_MARKER = ".complete"
+
+# File name of the single fragmented MP4 file written per rendition in "fmp4" mode.
+FMP4_FILENAME = "stream.mp4"
+
+
+def get_original_path(name: str):
+    """
+    Return the path of an original video file.
+
+    Originals moved to MEDIA_COLD_STORAGE_ROOT by the media garbage collection
+    keep their name, so they are looked up there if they are not below MEDIA_ROOT.
+    """
+    path = Path(settings.MEDIA_ROOT) / name
+    cold_root = getattr(settings, "MEDIA_COLD_STORAGE_ROOT", "")
+    if not path.exists() and cold_root:
+        return Path(cold_root) / name
+    return path
+
+
+def get_segment_args(out_dir: Path, codec: str = DEFAULT_CODEC):
+    """
+    Return the ffmpeg HLS muxer arguments for the configured output mode.
+
+    In "ts" mode (default) ffmpeg writes one MPEG-TS file per segment.
+    In "fmp4" mode each rendition is written into one fragmented MP4 file and
+    the playlist addresses the init section and segments with EXT-X-BYTERANGE.
+    HEVC and AV1 are not carried in MPEG-TS, so they always use fMP4 segments.
+    """
+    if getattr(settings, "HLS_OUTPUT_MODE", "ts") == "fmp4":
+        return [
+            "-hls_segment_type", "fmp4",
+            "-hls_flags", "single_file",
+            "-hls_segment_filename", str(out_dir / FMP4_FILENAME),
+        ]
+    if codec != DEFAULT_CODEC:
+        return ["-hls_segment_type", "fmp4"]
+    return []
+
+
+def get_renditions(extra_codecs=()):
+    """
+    Build the list of renditions to encode as (label, size, codec) tuples.
+
+    Every resolution is encoded with H.264. The given extra codecs are added
+    only for the resolutions listed in HLS_EXTRA_CODEC_RESOLUTIONS, since these
+    encodes are considerably more expensive.
+
+    Raises:
+        ImproperlyConfigured: If an unknown codec is requested.
+    """
+    extra_resolutions = getattr(settings, "HLS_EXTRA_CODEC_RESOLUTIONS", [])
+    renditions = [(label, size, DEFAULT_CODEC) for label, size in RESOLUTIONS.items()]
+
+    for codec in extra_codecs:
+        if codec not in VIDEO_CODECS:
+            raise ImproperlyConfigured(f"Unsupported video codec: {codec}")
+        renditions += [
+            (f"{label}_{codec}", size, codec)
+            for label, size in RESOLUTIONS.items() if label in extra_resolutions
+        ]
+    return renditions
+
+
+def has_audio_stream(input_path: str):
+    """ Return whether a media file contains an audio stream, using ffprobe. """
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "a", "-show_entries", "stream=index", "-of", "csv=p=0",
+         input_path],
+        check=True, capture_output=True, text=True,
+    )
+    return bool(result.stdout.strip())
+
+
+def get_rate_control(label: str, codec: str, encoding_profile=None):
+    """
+    Return the ffmpeg rate control arguments and the BANDWIDTH of a rendition.
+
+    If the per-title analysis chose a CRF for this H.264 resolution, the encode
+    uses that CRF capped at the chosen maxrate (1.5x the measured bitrate for
+    profiles analysed before caps were probed). Otherwise the encoder defaults
+    are kept and DEFAULT_BANDWIDTH is announced.
+    """
+    rung = (encoding_profile or {}).get(label) if codec == DEFAULT_CODEC else None
+    if not rung:
+        return [], DEFAULT_BANDWIDTH
+
+    maxrate = rung.get("maxrate") or int(rung["bitrate"] * 1.5)
+    args = ["-crf", str(rung["crf"]), "-maxrate", str(maxrate), "-bufsize", str(maxrate * 2)]
+    return args, maxrate + AUDIO_BITRATE
+
+
+def get_playlist_duration(playlist_path: Path):
+    """ Return the total duration in seconds of the segments listed in a media playlist. """
+    return sum(
+        float(line[len("#EXTINF:"):].split(",")[0])
+        for line in playlist_path.read_text().splitlines()
+        if line.startswith("#EXTINF:")
+    )
+
+
+def record_encode_metrics(label: str, playlist_path: Path, seconds: float):
+    """ Observe the encode time of a rendition and its speed relative to the video duration. """
+    FFMPEG_ENCODE_SECONDS.labels(label).observe(seconds)
+    if seconds > 0 and playlist_path.exists():
+        FFMPEG_ENCODE_SPEED.labels(label).observe(get_playlist_duration(playlist_path) / seconds)
+
+
+def get_encode_fingerprint(input_path: str, cmd):
+    """ Identify an encode by its ffmpeg command and the size and mtime of the source file. """
+    source = os.stat(input_path)
+    return hashlib.sha256(f"{cmd}|{source.st_size}|{source.st_mtime_ns}".encode()).hexdigest()
+
+
+def is_rendition_complete(out_dir: Path, fingerprint: str):
+    marker = out_dir / COMPLETE_MARKER
+    return marker.exists() and marker.read_text() == fingerprint
+
+
+def mark_rendition_complete(out_dir: Path, fingerprint: str):
+    """ Write the completion marker atomically, so a crash never leaves a partial marker. """
+    temp_marker = out_dir / f"{COMPLETE_MARKER}.tmp"
+    temp_marker.write_text(fingerprint)
+    os.replace(temp_marker, out_dir / COMPLETE_MARKER)
+
+
+# Precompressed siblings of every playlist ("index.m3u8.br", "index.m3u8.gz"),
+# in the order they are preferred when a client accepts several.
+PLAYLIST_ENCODINGS = {
+    "br": ".br",
+    "gzip": ".gz",
+}
+
+
+def write_precompressed(path: Path, data: bytes):
+    """
+    Write gzip and, with the brotli package installed, brotli compressed copies of a playlist next to `path`.
+
+    The playlist views serve them as they are, so compressing costs nothing
+    per request. Each copy is replaced atomically.
+    """
+    compressed = {PLAYLIST_ENCODINGS["gzip"]: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressed[PLAYLIST_ENCODINGS["br"]] = brotli.compress(data, mode=brotli.MODE_TEXT, quality=11)
+    for suffix, content in compressed.items():
+        temp_path = path.with_name(f".{path.name}{suffix}.tmp")
+        temp_path.write_bytes(content)
+        os.replace(temp_path, path.with_name(path.name + suffix))
+
+
+def get_staging_dir(out_dir: Path):
+    """ Return the directory a rendition is encoded into before it replaces `out_dir`. """
+    return out_dir.with_name(f".{out_dir.name}.next")
+
+
+def replace_rendition(out_dir: Path, staging_dir: Path):
+    """
+    Move a finished encode from `staging_dir` to `out_dir`, replacing the previous one.
+
+    The previous rendition stays in place until the new one is complete;
+    the directories are swapped with two renames.
+    """
+    old_dir = out_dir.with_name(f".{out_dir.name}.old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if out_dir.exists():
+        os.rename(out_dir, old_dir)
+    os.rename(staging_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def read_master_entries(output_root: Path):
+    """
+    Return the entries of the current master playlist by rendition label.
+
+    Returns:
+        dict: The EXT-X-MEDIA line or the EXT-X-STREAM-INF line with its URI per label.
+    """
+    try:
+        lines = (output_root / "index.m3u8").read_text().splitlines()
+    except FileNotFoundError:
+        return {}
+
+    entries = {}
+    for index, line in enumerate(lines):
+        if line.startswith("#EXT-X-MEDIA:") and 'URI="' in line:
+            entries[line.split('URI="', 1)[1].split("/", 1)[0]] = line
+        elif line.startswith("#EXT-X-STREAM-INF:") and index + 1 < len(lines):
+            entries[lines[index + 1].split("/", 1)[0]] = f"{line}\n{lines[index + 1]}"
+    return entries
+
+
+def write_master_playlist(output_root: Path, variants):
+    """
+    Replace the master playlist atomically with one listing `variants`.
+
+    Players reading it concurrently see either the old or the new playlist,
+    never a partial one. Without variants the master playlist and its
+    precompressed copies are removed.
+    """
+    master_playlist = output_root / "index.m3u8"
+    if not variants:
+        master_playlist.unlink(missing_ok=True)
+        for suffix in PLAYLIST_ENCODINGS.values():
+            master_playlist.with_name(master_playlist.name + suffix).unlink(missing_ok=True)
+        return
+    data = ("#EXTM3U\n" + "\n".join(variants)).encode()
+    write_precompressed(master_playlist, data)
+    temp_playlist = output_root / ".index.m3u8.tmp"
+    temp_playlist.write_bytes(data)
+    os.replace(temp_playlist, master_playlist)
+
+
+def generate_hls_files(input_path: str, video_id: int, extra_codecs=(), encoding_profile=None, on_publish=None):
     """
     Generate HLS (HTTP Live Streaming) playlist and video segments for a given video.
 
@@ -21,54 +281,148 @@ def generate_hls_files(input_path: str, video_id: int):
     Args:
         input_path (str): Path to the original video file.
         video_id (int): ID of the Video instance, used to create output directories.
+        extra_codecs (Iterable[str]): Codecs (e.g. "hevc", "av1") encoded in addition
+            to H.264 for the resolutions in HLS_EXTRA_CODEC_RESOLUTIONS.
+        encoding_profile (dict | None): Per-title CRF and bitrate per resolution
+            as returned by content_app.analysis.analyse_title().
+        on_publish (Callable[[list[str]], None] | None): Called with the labels
+            of the published renditions whenever the master playlist changed.
 
     Steps:
-        1. Create output directories for each resolution.
-        2. Transcode the video into .ts segments for HLS using ffmpeg.
-        3. Generate an index.m3u8 playlist for each resolution.
-        4. Create a master playlist referencing all resolution playlists.
+        1. Publish the renditions whose completion marker matches the encode
+           (finished by an earlier, interrupted attempt) in the master playlist.
+           Outdated renditions of an earlier transcode stay published with
+           their previous entry until they are replaced.
+        2. Transcode the remaining renditions into .ts segments (or one
+           fragmented MP4 file per rendition in "fmp4" mode) with an
+           index.m3u8 playlist each, using ffmpeg: the audio track once into
+           its own rendition, then the video-only resolutions, lowest first.
+           Each rendition is encoded into a staging directory, which replaces
+           the rendition's directory once the encode is complete.
+        3. After every rendition, rewrite the master playlist atomically with
+           all finished renditions: the audio as an EXT-X-MEDIA group referenced
+           by every video variant, each with a CODECS attribute so clients can
+           pick a variant they can decode. The video is playable as soon as the
+           audio and the first resolution are published. Every playlist gets
+           precompressed copies (see write_precompressed).
 
     Raises:
         subprocess.CalledProcessError: If ffmpeg fails during transcoding.
+        ImproperlyConfigured: If an unknown codec is requested.
     """
 
     # Create directory for this resolution
     output_root = Path(settings.MEDIA_ROOT) / f"video/{video_id}/"
-    output_root.mkdir(parents=True, exist_ok=True)
     try:
         output_root.mkdir(parents=True, exist_ok=True)
-    except Exception as e:
-        print("Failed to mkdir:", e)
+    except Exception:
+        logger.exception("Failed to create output directory %s", output_root)
         raise
 
-    master_playlist_content = []
+    audio = has_audio_stream(input_path)
+    encodes = []
+    if audio:
+        def audio_cmd(out_dir):
+            return [
+                "ffmpeg",
+                "-i", input_path,
+                "-vn",
+                "-c:a", "aac",
+                "-b:a", str(AUDIO_BITRATE),
+                "-hls_time", "3",
+                "-hls_playlist_type", "vod",
+                *get_segment_args(out_dir),
+                str(out_dir / "index.m3u8")
+            ]
+
+        media = (
+            f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="{AUDIO_GROUP}",NAME="Audio",DEFAULT=YES,AUTOSELECT=YES,'
+            f'URI="{AUDIO_LABEL}/index.m3u8"'
+        )
+        encodes.append((AUDIO_LABEL, output_root / AUDIO_LABEL, audio_cmd, media))
+
+    for label, size, codec in get_renditions(extra_codecs):
+        rate_control_args, bandwidth = get_rate_control(label, codec, encoding_profile)
+
+        def video_cmd(out_dir, size=size, codec=codec, rate_control_args=rate_control_args):
+            return [
+                "ffmpeg",
+                "-i", input_path,
+                "-vf", f"scale={size}",
+                "-pix_fmt", "yuv420p",
+                *VIDEO_CODECS[codec]["args"],
+                *rate_control_args,
+                "-an",
+                "-g", "48",
+                "-hls_time", "3",
+                "-hls_playlist_type", "vod",
+                *get_segment_args(out_dir, codec),
+                str(out_dir / "index.m3u8")
+            ]
 
-    for label, size in RESOLUTIONS.items():
-        out_dir = output_root / label
-        out_dir.mkdir(exist_ok=True)
+        # Master playlist entry of the rendition. CODECS and BANDWIDTH include the audio group.
+        codecs = f"{VIDEO_CODECS[codec]['codecs']},{AUDIO_CODECS}" if audio else VIDEO_CODECS[codec]["codecs"]
+        group = f',AUDIO="{AUDIO_GROUP}"' if audio else ""
+        variant = (
+            f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={size},CODECS="{codecs}"{group}\n{label}/index.m3u8'
+        )
+        encodes.append((label, output_root / label, video_cmd, variant))
+
+    # The fingerprint is taken from the command for the final directory, as
+    # the staging directory is only where the encode is written.
+    encodes = [
+        (label, out_dir, make_cmd, get_encode_fingerprint(input_path, make_cmd(out_dir)), entry)
+        for label, out_dir, make_cmd, entry in encodes
+    ]
 
-        # Path to the resolution-specific playlist
-        playlist_path = out_dir / "index.m3u8"
+    previous_entries = read_master_entries(output_root)
+    entries = {}
+    previous = set()
+    for label, out_dir, _, fingerprint, entry in encodes:
+        staging_dir = get_staging_dir(out_dir)
+        if is_rendition_complete(staging_dir, fingerprint):
+            # Finished, but not moved into place by an interrupted attempt
+            replace_rendition(out_dir, staging_dir)
+        if is_rendition_complete(out_dir, fingerprint):
+            entries[label] = entry
+        elif (out_dir / COMPLETE_MARKER).exists() and label in previous_entries:
+            entries[label] = previous_entries[label]
+            previous.add(label)
 
-        cmd = [
-            "ffmpeg",
-            "-i", input_path,
-            "-vf", f"scale={size}",
-            "-preset", "veryfast",
-            "-g", "48",
-            "-hls_time", "3",
-            "-hls_playlist_type", "vod",
-            str(playlist_path)
+    def publish():
+        # New video renditions are only published together with the audio they reference.
+        audio_published = not audio or AUDIO_LABEL in entries
+        videos = [
+            label for label, *_ in encodes
+            if label in entries and label != AUDIO_LABEL and (audio_published or label in previous)
         ]
+        lines = [entries[label] for label, *_ in encodes if label in videos]
+        if videos and AUDIO_LABEL in entries:
+            lines.insert(0, entries[AUDIO_LABEL])
+        write_master_playlist(output_root, lines)
+        if on_publish is not None:
+            on_publish(videos)
 
-        # Run ffmpeg and raise error if it fails
-        subprocess.Popen(cmd)
+    publish()
 
-        # Add entry to the master playlist
-        master_playlist_content.append(
-            f"#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION={size}\n{label}/index.m3u8"
-        )
+    for label, out_dir, make_cmd, fingerprint, entry in encodes:
+        if label in entries and label not in previous:
+            logger.info("Skipping finished rendition %s of video %s", label, video_id)
+            continue
 
-    # Write master playlist referencing all resolutions
-    master_playlist = output_root / "index.m3u8"
-    master_playlist.write_text("#EXTM3U\n" + "\n".join(master_playlist_content))
\ No newline at end of file
+        staging_dir = get_staging_dir(out_dir)
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        staging_dir.mkdir()
+        playlist_path = staging_dir / "index.m3u8"
+
+        # Run ffmpeg and raise error if it fails
+        start = time.perf_counter()
+        subprocess.run(make_cmd(staging_dir), check=True)
+        record_encode_metrics(label, playlist_path, time.perf_counter() - start)
+        write_precompressed(playlist_path, playlist_path.read_bytes())
+        mark_rendition_complete(staging_dir, fingerprint)
+        replace_rendition(out_dir, staging_dir)
+
+        entries[label] = entry
+        previous.discard(label)
+        publish()
@@ -0,0 +1,113 @@
+"""
+Routing of reads to Postgres read replicas.
+
+Reads made while handling an HTTP request go to a random healthy replica in
+DATABASE_REPLICAS, writes always go to "default". A request is pinned to the
+primary for all following reads as soon as it writes, and
+ReplicaPinningMiddleware keeps the client pinned for DB_REPLICA_PIN_SECONDS
+with a cookie, so users read their own writes while the replicas catch up.
+
+Reads inside a transaction on the primary (e.g. select_for_update()) and
+reads outside of requests (RQ jobs, management commands) always use the
+primary. A replica whose replication lag exceeds DB_REPLICA_MAX_LAG, that
+lost its connection to the primary, or that cannot be reached, is skipped
+until its next lag check.
+"""
+
+import contextvars
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+# None outside of requests, otherwise whether the request is pinned to the primary.
+_pinned = contextvars.ContextVar("replica_pinned", default=None)
+
+# Lag of the replica in seconds: 0 when it is not a standby or replayed
+# everything it received while connected to the primary, NULL when its WAL
+# receiver is not running (a disconnected standby receives nothing, so an equal
+# receive and replay position says nothing about its lag) or it has not
+# replayed any transaction yet. pg_stat_wal_receiver has a row while the
+# receiver runs, also for roles that may not see its details.
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+# alias -> (checked at, healthy)
+_replica_health = {}
+
+
+def start_request(pinned: bool):
+    """ Start routing the reads of a request; returns a token for end_request(). """
+    return _pinned.set(pinned)
+
+
+def end_request(token):
+    _pinned.reset(token)
+
+
+def is_pinned():
+    return _pinned.get() is True
+
+
+def pin_to_primary():
+    if _pinned.get() is not None:
+        _pinned.set(True)
+
+
+def get_replica_lag(alias: str):
+    """ Return the replication lag of a replica in seconds, infinite if it is disconnected from the primary. """
+    with connections[alias].cursor() as cursor:
+        cursor.execute(LAG_QUERY)
+        lag = cursor.fetchone()[0]
+    return float("inf") if lag is None else float(lag)
+
+
+def is_replica_healthy(alias: str):
+    """ Check the lag of a replica at most every DB_REPLICA_LAG_CHECK_INTERVAL seconds per process. """
+    now = time.monotonic()
+    checked_at, healthy = _replica_health.get(alias, (None, False))
+    if checked_at is not None and now - checked_at < settings.DB_REPLICA_LAG_CHECK_INTERVAL:
+        return healthy
+
+    try:
+        lag = get_replica_lag(alias)
+        healthy = lag <= settings.DB_REPLICA_MAX_LAG
+        if not healthy:
+            logger.warning("Replica %s lags %.1f s behind, reading from the primary", alias, lag)
+    except Exception as error:
+        healthy = False
+        logger.warning("Replica %s is unavailable, reading from the primary: %s", alias, error)
+
+    _replica_health[alias] = (now, healthy)
+    return healthy
+
+
+class PrimaryReplicaRouter:
+    """ Database router sending request reads to replicas and everything else to the primary. """
+
+    def db_for_read(self, model, **hints):
+        if _pinned.get() is not False or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = [alias for alias in settings.DATABASE_REPLICAS if is_replica_healthy(alias)]
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
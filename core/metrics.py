@@ -0,0 +1,151 @@
+"""
+Prometheus metrics for requests, streaming, background jobs and transcoding.
+
+When PROMETHEUS_MULTIPROC_DIR is set (see backend.entrypoint.sh), every
+gunicorn worker and RQ worker writes its samples to files in that directory
+and the /metrics view aggregates them across all processes. Containers share
+the directory as a volume, so the processes of all roles are reported.
+Without it, the metrics of the current process are exported.
+"""
+
+import functools
+import os
+import time
+
+import django_rq
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# URL names grouped into the views we want to compare; everything else is "other".
+VIEW_GROUPS = {
+    "register": "auth",
+    "activate": "auth",
+    "login": "auth",
+    "token_refresh": "auth",
+    "logout": "auth",
+    "password_reset": "auth",
+    "password_confirm": "auth",
+    "provision_users": "auth",
+    "video-list": "list",
+    "video-search": "list",
+    "video-suggest": "list",
+    "video-master-playlist": "playlist",
+    "video-playlist": "playlist",
+    "video-segment": "segment",
+}
+
+REQUEST_LATENCY = Histogram(
+    "videoflix_request_duration_seconds",
+    "Request latency by view.",
+    ["group", "view", "method"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUEST_DB_QUERIES = Histogram(
+    "videoflix_request_db_queries",
+    "Database queries per request by view.",
+    ["group", "view"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+STREAMED_BYTES = Counter(
+    "videoflix_streamed_bytes",
+    "Bytes of playlists and segments sent to clients.",
+    ["group"],
+)
+SEGMENT_PREFETCH_DECISIONS = Counter(
+    "videoflix_segment_prefetch_decisions",
+    "Segment readahead decisions (issued, random, missing, unsupported).",
+    ["decision"],
+)
+SEGMENT_CACHE_REQUESTS = Counter(
+    "videoflix_segment_cache_requests",
+    "Shared segment cache lookups and stores (hit, miss, stored, ghosted, too_large).",
+    ["outcome"],
+)
+JOB_DURATION = Histogram(
+    "videoflix_rq_job_duration_seconds",
+    "Duration of background jobs by task and outcome.",
+    ["task", "outcome"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+FFMPEG_ENCODE_SECONDS = Histogram(
+    "videoflix_ffmpeg_encode_seconds",
+    "Wall-clock time of the ffmpeg encode of one rendition.",
+    ["rendition"],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600),
+)
+FFMPEG_ENCODE_SPEED = Histogram(
+    "videoflix_ffmpeg_encode_speed",
+    "Seconds of video encoded per wall-clock second for one rendition.",
+    ["rendition"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 16, 32, 64),
+)
+
+
+class QueueCollector:
+    """ Report the depth of every RQ queue and its started and failed job registries at scrape time. """
+
+    def collect(self):
+        depth = GaugeMetricFamily("videoflix_rq_queue_depth", "Jobs waiting in the RQ queue.", labels=["queue"])
+        started = GaugeMetricFamily("videoflix_rq_started_jobs", "Jobs currently executed.", labels=["queue"])
+        failed = GaugeMetricFamily("videoflix_rq_failed_jobs", "Jobs in the failed job registry.", labels=["queue"])
+        for name in settings.RQ_QUEUES:
+            try:
+                queue = django_rq.get_queue(name)
+                depth.add_metric([name], queue.count)
+                started.add_metric([name], queue.started_job_registry.count)
+                failed.add_metric([name], queue.failed_job_registry.count)
+            except Exception:
+                continue
+        yield depth
+        yield started
+        yield failed
+
+
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    REGISTRY.register(QueueCollector())
+
+
+def get_registry():
+    """ Return the registry to export: aggregated over all processes in multiprocess mode. """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(QueueCollector())
+    return registry
+
+
+def metrics_view(request):
+    """
+    Export all metrics in the Prometheus text format.
+
+    If METRICS_TOKEN is set, the request must send it as a bearer token.
+
+    Raises:
+        Http404: If the token is missing or wrong, to not reveal the endpoint.
+    """
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        raise Http404()
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+def track_job(func):
+    """ Record the duration and outcome of a background job in JOB_DURATION. """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        outcome = "failed"
+        try:
+            result = func(*args, **kwargs)
+            outcome = "finished"
+            return result
+        finally:
+            JOB_DURATION.labels(func.__name__, outcome).observe(time.perf_counter() - start)
+
+    return wrapper
@@ -0,0 +1,175 @@
+import random
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware
+
+from core import db_router
+from core.metrics import REQUEST_DB_QUERIES, REQUEST_LATENCY, STREAMED_BYTES, VIEW_GROUPS
+from core.profiling import (
+    PROFILE_HEADER, CallRecorder, StackSampler, _active_recorder, install_hooks, is_valid_profile_token,
+    write_profile
+)
+
+
+class MetricsMiddleware:
+    """
+    Record latency, database query count and streamed bytes of every request.
+
+    Requests are labeled by the URL name of the matched view and its group
+    (auth, list, playlist, segment or other). This middleware should be the
+    first in MIDDLEWARE so the measured latency covers all other middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_queries))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = getattr(request, "resolver_match", None)
+        view = match.url_name if match and match.url_name else "unmatched"
+        group = VIEW_GROUPS.get(view, "other")
+
+        REQUEST_LATENCY.labels(group, view, request.method).observe(duration)
+        REQUEST_DB_QUERIES.labels(group, view).observe(queries)
+        if group in ("playlist", "segment") and response.has_header("Content-Length"):
+            STREAMED_BYTES.labels(group).inc(int(response["Content-Length"]))
+
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile a sample of requests, or requests with a signed PROFILE_HEADER.
+
+    The stack samples and the SQL, cache and Redis timings of a profiled request
+    are written to REQUEST_PROFILING_DIR (see core.profiling) and the file name
+    is returned in the "X-Videoflix-Profile-Id" response header.
+
+    Raises:
+        MiddlewareNotUsed: If REQUEST_PROFILING_ENABLED is off, so Django
+            removes the middleware and unprofiled requests pay nothing.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sample_rate = settings.REQUEST_PROFILING_SAMPLE_RATE
+        self.interval = settings.REQUEST_PROFILING_INTERVAL_MS / 1000
+        self.directory = Path(settings.REQUEST_PROFILING_DIR)
+        install_hooks()
+
+    def should_profile(self, request):
+        token = request.headers.get(PROFILE_HEADER)
+        if token:
+            return is_valid_profile_token(token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        recorder = CallRecorder()
+
+        def record_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                recorder.add("sql", sql, time.perf_counter() - start)
+
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        token = _active_recorder.set(recorder)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(record_query))
+                response = self.get_response(request)
+        finally:
+            sampler.stop()
+            _active_recorder.reset(token)
+        duration = time.perf_counter() - start
+
+        match = getattr(request, "resolver_match", None)
+        view = match.url_name if match and match.url_name else "unmatched"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{view}-{uuid.uuid4().hex[:8]}"
+        write_profile(self.directory, name, sampler, recorder, {
+            "method": request.method,
+            "path": request.path,
+            "view": view,
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 3),
+        })
+        response["X-Videoflix-Profile-Id"] = name
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """
+    Route the reads of a request to the read replicas, with read-your-writes pinning.
+
+    Once a request wrote to the primary, the response sets the PIN_COOKIE for
+    DB_REPLICA_PIN_SECONDS and all reads of the client's requests within that
+    time go to the primary as well (see core.db_router).
+
+    Raises:
+        MiddlewareNotUsed: If no replicas are configured.
+    """
+
+    PIN_COOKIE = "videoflix_primary"
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = db_router.start_request(pinned=self.PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+            if db_router.is_pinned():
+                response.set_cookie(
+                    self.PIN_COOKIE, "1", max_age=settings.DB_REPLICA_PIN_SECONDS, httponly=True, samesite="Lax"
+                )
+        finally:
+            db_router.end_request(token)
+        return response
+
+
+class JSONGZipMiddleware(GZipMiddleware):
+    """
+    Gzip compress JSON responses of at least GZIP_MIN_LENGTH bytes.
+
+    Streaming responses are compressed chunk by chunk as they are sent.
+    Other content types are passed through: segments are already compressed
+    video and playlists are served precompressed by the views.
+    """
+
+    def process_response(self, request, response):
+        if not response.get("Content-Type", "").startswith("application/json"):
+            return response
+        if not response.streaming and len(response.content) < settings.GZIP_MIN_LENGTH:
+            return response
+        return super().process_response(request, response)
@@ -0,0 +1,180 @@
+"""
+Sampled on-demand request profiling.
+
+A statistical profiler samples the stack of the request thread at a fixed
+interval and writes the samples in the folded stack format
+("frame;frame;frame count" per line) that flamegraph.pl, speedscope and
+inferno read directly. Next to it, a JSON report lists the SQL queries,
+cache calls and Redis commands of the request with their timings.
+
+Profiling is off unless REQUEST_PROFILING_ENABLED is set; then Django drops
+the middleware at startup and no hooks are installed. When enabled, a request
+is profiled if it is picked by REQUEST_PROFILING_SAMPLE_RATE or if it carries
+a valid signed token in the PROFILE_HEADER (see make_profile_token()).
+"""
+
+import contextvars
+import functools
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.core import signing
+
+PROFILE_HEADER = "X-Videoflix-Profile"
+PROFILE_TOKEN_SALT = "videoflix.profile"
+PROFILE_TOKEN_MAX_AGE = 3600
+
+# Cache backend methods timed as "cache" calls.
+CACHE_METHODS = (
+    "add", "get", "set", "touch", "delete", "get_many", "set_many", "delete_many",
+    "has_key", "incr", "decr", "clear",
+)
+
+# Recorder of the request being profiled in the current thread, if any.
+_active_recorder = contextvars.ContextVar("active_recorder", default=None)
+_hooks_installed = False
+
+
+def make_profile_token():
+    """
+    Return a value for the PROFILE_HEADER that forces profiling of a request.
+
+    The token is signed with SECRET_KEY and valid for PROFILE_TOKEN_MAX_AGE seconds.
+    """
+    return signing.TimestampSigner(salt=PROFILE_TOKEN_SALT).sign("profile")
+
+
+def is_valid_profile_token(token: str):
+    try:
+        signing.TimestampSigner(salt=PROFILE_TOKEN_SALT).unsign(token, max_age=PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def frame_label(frame):
+    """ Name a stack frame as "module:qualified.function". """
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class StackSampler:
+    """
+    Sample the stack of one thread from a background thread.
+
+    Samples are aggregated by their folded stack (root first), so memory
+    grows with the number of distinct stacks, not with the request duration.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class CallRecorder:
+    """ Collect the timed SQL queries, cache calls and Redis commands of one request. """
+
+    def __init__(self):
+        self.calls = {"sql": [], "cache": [], "redis": []}
+
+    def add(self, kind: str, name: str, seconds: float):
+        self.calls[kind].append({"name": name, "ms": round(seconds * 1000, 3)})
+
+    def summary(self):
+        return {
+            kind: {
+                "count": len(calls),
+                "total_ms": round(sum(call["ms"] for call in calls), 3),
+                "calls": calls,
+            }
+            for kind, calls in self.calls.items()
+        }
+
+
+def timed(kind: str, name_of):
+    """ Wrap a method so its calls are recorded while a request is profiled in the same thread. """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            recorder = _active_recorder.get()
+            if recorder is None:
+                return method(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                recorder.add(kind, name_of(method, args), time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def install_hooks():
+    """
+    Wrap the default cache backend and the Redis client once per process.
+
+    The wrappers only check a context variable unless the current request is
+    profiled. They are installed when the profiling middleware is enabled.
+    """
+    global _hooks_installed
+    if _hooks_installed:
+        return
+
+    from django.core.cache import caches
+    from redis.client import Pipeline, Redis
+
+    cache_class = type(caches["default"])
+    for name in CACHE_METHODS:
+        if hasattr(cache_class, name):
+            setattr(cache_class, name, timed("cache", lambda method, args: method.__name__)(getattr(cache_class, name)))
+
+    Redis.execute_command = timed("redis", lambda method, args: str(args[1]))(Redis.execute_command)
+    Pipeline.execute = timed(
+        "redis", lambda method, args: f"PIPELINE({len(args[0].command_stack)})"
+    )(Pipeline.execute)
+
+    _hooks_installed = True
+
+
+def write_profile(directory: Path, name: str, sampler: StackSampler, recorder: CallRecorder, report: dict):
+    """
+    Write the folded stacks and the JSON report of a profiled request.
+
+    Returns:
+        Path: The path of the folded stack file; the report has the suffix ".json".
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    folded_path = directory / f"{name}.folded"
+    folded_path.write_text(sampler.folded())
+    report = {**report, "samples": sum(sampler.stacks.values()), **recorder.summary()}
+    folded_path.with_suffix(".json").write_text(json.dumps(report, indent=2))
+    return folded_path
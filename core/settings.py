@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import copy
 from datetime import timedelta
 from pathlib import Path
 import os
@@ -58,6 +59,15 @@ else:
     EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER", default="")
     EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD", default="")
     DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", default="webmaster@localhost")
+
+# Bulk user provisioning (see auth_app.provisioning): processes hashing passwords,
+# users per activation email job and the maximum users per API request.
+PROVISION_WORKERS = int(os.environ.get("PROVISION_WORKERS", default=os.cpu_count() or 1))
+PROVISION_MAIL_BATCH_SIZE = int(os.environ.get("PROVISION_MAIL_BATCH_SIZE", default=100))
+PROVISION_API_MAX_USERS = int(os.environ.get("PROVISION_API_MAX_USERS", default=10000))
+# Seconds the users submitted through the provisioning API wait in Redis for their job.
+PROVISION_PAYLOAD_TTL = int(os.environ.get("PROVISION_PAYLOAD_TTL", default=3600))
+
 # Application definition
 
 
@@ -68,9 +78,8 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
-    'rest_framework_simplejwt',
-    'rest_framework_simplejwt.token_blacklist',
     'corsheaders',
     'auth_app.apps.AuthAppConfig',
     'content_app.apps.ContentAppConfig',
@@ -80,6 +89,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.ReplicaPinningMiddleware',
+    'core.middleware.JSONGZipMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -91,6 +104,10 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# JSON responses of at least GZIP_MIN_LENGTH bytes are gzip compressed for
+# clients accepting it; smaller ones are not worth the CPU and header bytes.
+GZIP_MIN_LENGTH = int(os.environ.get("GZIP_MIN_LENGTH", default=1024))
+
 CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:5500",
     "http://localhost:5500",
@@ -117,6 +134,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'core.wsgi.application'
 
+# Runs the tests without throttle rates (see core.test_runner).
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -128,32 +148,186 @@ DATABASES = {
         "USER": os.environ.get("DB_USER", default="videoflix_user"),
         "PASSWORD": os.environ.get("DB_PASSWORD", default="supersecretpassword"),
         "HOST": os.environ.get("DB_HOST", default="db"),
-        "PORT": os.environ.get("DB_PORT", default=5432)
+        "PORT": os.environ.get("DB_PORT", default=5432),
+        # Keep connections open across requests and check them before reuse
+        # instead of opening a new connection (TCP and auth) per request.
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", default=60)),
+        "CONN_HEALTH_CHECKS": os.environ.get("DB_CONN_HEALTH_CHECKS", default="True") == "True",
+        "OPTIONS": {},
     }
 }
 
+# Behind pgbouncer in transaction pooling mode, server-side cursors (used by
+# QuerySet.iterator()) do not survive across transactions and must be disabled.
+if os.environ.get("DB_PGBOUNCER", default="False") == "True":
+    DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+
+# Native connection pool of the psycopg 3 backend (requires "psycopg[binary,pool]"
+# instead of psycopg2). It replaces persistent connections.
+if os.environ.get("DB_POOL", default="False") == "True":
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", default=2)),
+        "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", default=10)),
+        "timeout": int(os.environ.get("DB_POOL_TIMEOUT", default=10)),
+    }
+# Read replicas (comma-separated "host" or "host:port"), registered as the
+# aliases replica_1, replica_2, ... and used by core.db_router for the reads of
+# HTTP requests. In tests they mirror the default database.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.environ.get("DB_REPLICA_HOSTS", default="").split(",")), start=1):
+    host, _, port = replica.partition(":")
+    DATABASES[f"replica_{index}"] = {
+        **copy.deepcopy(DATABASES["default"]),
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "NAME": os.environ.get("DB_REPLICA_NAME") or DATABASES["default"]["NAME"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica_{index}")
+
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ["core.db_router.PrimaryReplicaRouter"]
+
+# Replicas lagging more than DB_REPLICA_MAX_LAG seconds are skipped; the lag is
+# checked every DB_REPLICA_LAG_CHECK_INTERVAL seconds per process. After a write,
+# a client reads from the primary for DB_REPLICA_PIN_SECONDS.
+DB_REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", default="2"))
+DB_REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get("DB_REPLICA_LAG_CHECK_INTERVAL", default="5"))
+DB_REPLICA_PIN_SECONDS = int(os.environ.get("DB_REPLICA_PIN_SECONDS", default=5))
+
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
         "LOCATION": os.environ.get("REDIS_LOCATION", default="redis://redis:6379/1"),
         "OPTIONS": {
-            "CLIENT_CLASS": "django_redis.client.DefaultClient"
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            # One bounded pool per process, shared by the cache, the throttles,
+            # watch progress and (with REDIS_SHARED_POOL) RQ. When all connections
+            # are in use, callers wait up to REDIS_POOL_TIMEOUT seconds.
+            "CONNECTION_POOL_CLASS": "redis.BlockingConnectionPool",
+            "CONNECTION_POOL_KWARGS": {
+                "max_connections": int(os.environ.get("REDIS_MAX_CONNECTIONS", default=50)),
+                "timeout": int(os.environ.get("REDIS_POOL_TIMEOUT", default=5)),
+                "health_check_interval": 30,
+            },
         },
         "KEY_PREFIX": "videoflix"
     }
 }
 
-RQ_QUEUES = {
-    'default': {
-        'HOST': os.environ.get("REDIS_HOST", default="redis"),
-        'PORT': os.environ.get("REDIS_PORT", default=6379),
-        'DB': os.environ.get("REDIS_DB", default=0),
-        'DEFAULT_TIMEOUT': 900,
-        'REDIS_CLIENT_KWARGS': {},
-    },
+# With REDIS_SHARED_POOL, RQ uses the connection pool of the default cache, so
+# its queues live in the cache's Redis database (REDIS_LOCATION) and must not be
+# wiped with cache.clear(). Otherwise RQ opens its own connections to REDIS_DB.
+if os.environ.get("REDIS_SHARED_POOL", default="True") == "True":
+    RQ_QUEUES = {
+        'default': {
+            'USE_REDIS_CACHE': 'default',
+            'DEFAULT_TIMEOUT': 900,
+        },
+        'periodic': {
+            'USE_REDIS_CACHE': 'default',
+            'DEFAULT_TIMEOUT': 900,
+        },
+    }
+else:
+    RQ_QUEUES = {
+        'default': {
+            'HOST': os.environ.get("REDIS_HOST", default="redis"),
+            'PORT': os.environ.get("REDIS_PORT", default=6379),
+            'DB': os.environ.get("REDIS_DB", default=0),
+            'DEFAULT_TIMEOUT': 900,
+            'REDIS_CLIENT_KWARGS': {},
+        },
+        'periodic': {
+            'HOST': os.environ.get("REDIS_HOST", default="redis"),
+            'PORT': os.environ.get("REDIS_PORT", default=6379),
+            'DB': os.environ.get("REDIS_DB", default=0),
+            'DEFAULT_TIMEOUT': 900,
+            'REDIS_CLIENT_KWARGS': {},
+        },
+    }
+
+# Jobs enqueued periodically by `python manage.py run_periodic_jobs` into the
+# "periodic" queue, whose worker never waits behind transcodes
+# (dotted path of the task -> interval in seconds).
+RQ_PERIODIC_JOBS = {
+    'content_app.tasks.flush_watch_progress': int(os.environ.get("WATCH_PROGRESS_FLUSH_INTERVAL", default=30)),
+    'content_app.tasks.dispatch_outbox_jobs': int(os.environ.get("OUTBOX_DISPATCH_INTERVAL", default=10)),
+    'content_app.tasks.collect_media_garbage': int(os.environ.get("MEDIA_GC_INTERVAL", default=86400)),
+    'content_app.tasks.reap_transcodes': int(os.environ.get("TRANSCODE_REAPER_INTERVAL", default=300)),
+    'content_app.tasks.rebuild_typeahead_snapshot': int(os.environ.get("TYPEAHEAD_SNAPSHOT_INTERVAL", default=3600)),
 }
 
 
+# Video transcoding
+
+# "ts" writes one MPEG-TS file per HLS segment, "fmp4" writes one fragmented MP4
+# file per resolution whose segments are served as byte ranges (EXT-X-BYTERANGE).
+HLS_OUTPUT_MODE = os.environ.get("HLS_OUTPUT_MODE", default="ts")
+
+# Codecs encoded in addition to H.264 (comma-separated: "hevc", "av1"). They are only
+# encoded for videos with encode_extra_codecs set and for the listed resolutions.
+HLS_EXTRA_CODECS = [codec for codec in os.environ.get("HLS_EXTRA_CODECS", default="").split(",") if codec]
+HLS_EXTRA_CODEC_RESOLUTIONS = os.environ.get("HLS_EXTRA_CODEC_RESOLUTIONS", default="720p,1080p").split(",")
+
+# Per-title encoding: trial-encode sample scenes at the CRF candidates and bitrate
+# caps (factors of the measured bitrate) and use the cheapest ones whose quality
+# score reaches the target: SSIM from 0 to 1, VMAF from 0 to 100.
+PER_TITLE_ENCODING = os.environ.get("PER_TITLE_ENCODING", default="False") == "True"
+PER_TITLE_METRIC = os.environ.get("PER_TITLE_METRIC", default="ssim")
+PER_TITLE_QUALITY_TARGET = float(
+    os.environ.get("PER_TITLE_QUALITY_TARGET", default="94" if PER_TITLE_METRIC == "vmaf" else "0.96")
+)
+PER_TITLE_CRF_CANDIDATES = [int(crf) for crf in os.environ.get("PER_TITLE_CRF_CANDIDATES", default="30,27,24,21").split(",")]
+PER_TITLE_MAXRATE_FACTORS = [
+    float(factor) for factor in os.environ.get("PER_TITLE_MAXRATE_FACTORS", default="1.2,1.5").split(",")
+]
+# Resolutions analysed in parallel
+PER_TITLE_WORKERS = int(os.environ.get("PER_TITLE_WORKERS", default=min(4, os.cpu_count() or 1)))
+PER_TITLE_SAMPLES = int(os.environ.get("PER_TITLE_SAMPLES", default=3))
+PER_TITLE_SAMPLE_SECONDS = int(os.environ.get("PER_TITLE_SAMPLE_SECONDS", default=4))
+
+# Videos stuck in "processing" without a live RQ job are enqueued again until
+# they were attempted TRANSCODE_MAX_ATTEMPTS times, then they are marked failed.
+TRANSCODE_MAX_ATTEMPTS = int(os.environ.get("TRANSCODE_MAX_ATTEMPTS", default=3))
+
+
+# Media garbage collection (see content_app.media_gc)
+MEDIA_GC_BATCH_SIZE = int(os.environ.get("MEDIA_GC_BATCH_SIZE", default=500))
+MEDIA_GC_THROTTLE_MS = int(os.environ.get("MEDIA_GC_THROTTLE_MS", default=50))
+MEDIA_GC_GRACE_SECONDS = int(os.environ.get("MEDIA_GC_GRACE_SECONDS", default=3600))
+
+# Originals of videos that are ready for MEDIA_COLD_AFTER_DAYS are moved to this
+# directory (e.g. a cheaper volume) by the garbage collection (empty disables it).
+MEDIA_COLD_STORAGE_ROOT = os.environ.get("MEDIA_COLD_STORAGE_ROOT", default="")
+MEDIA_COLD_AFTER_DAYS = int(os.environ.get("MEDIA_COLD_AFTER_DAYS", default=7))
+
+
+# Video streaming
+
+# Number of upcoming segments read ahead into the page cache once a stream is
+# played sequentially (0 disables the prefetch).
+SEGMENT_PREFETCH_COUNT = int(os.environ.get("SEGMENT_PREFETCH_COUNT", default=3))
+
+# Shared-memory cache for hot segments, used by all worker processes on a host
+# (0 disables it). Segments larger than one slot are not cached.
+SEGMENT_CACHE_SIZE_MB = int(os.environ.get("SEGMENT_CACHE_SIZE_MB", default=0))
+SEGMENT_CACHE_SLOT_KB = int(os.environ.get("SEGMENT_CACHE_SLOT_KB", default=2048))
+SEGMENT_CACHE_PATH = os.environ.get("SEGMENT_CACHE_PATH", default="")
+
+# Number of entries kept in a user's continue-watching list.
+CONTINUE_WATCHING_SIZE = int(os.environ.get("CONTINUE_WATCHING_SIZE", default=20))
+# Seconds the watch progress of a user stays in Redis after the last heartbeat,
+# and the seconds users without any progress are remembered as such.
+WATCH_PROGRESS_TTL = int(os.environ.get("WATCH_PROGRESS_TTL", default=7 * 86400))
+CONTINUE_WATCHING_EMPTY_TTL = int(os.environ.get("CONTINUE_WATCHING_EMPTY_TTL", default=300))
+
+# Seconds between checks of a worker's in-memory title index against the
+# changes published in Redis (see content_app.typeahead).
+TYPEAHEAD_SYNC_INTERVAL = float(os.environ.get("TYPEAHEAD_SYNC_INTERVAL", default=1))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -209,11 +383,50 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'auth_app.api.permissions.CookieJWTAuthentication',
-    )
+    ),
+    # Token-bucket rates of auth_app.api.throttles: "<scope>" per client IP,
+    # "<scope>_account" per email address.
+    'DEFAULT_THROTTLE_RATES': {
+        'login': os.environ.get("THROTTLE_LOGIN", default="30/min"),
+        'login_account': os.environ.get("THROTTLE_LOGIN_ACCOUNT", default="10/min"),
+        'register': os.environ.get("THROTTLE_REGISTER", default="20/min"),
+        'register_account': os.environ.get("THROTTLE_REGISTER_ACCOUNT", default="5/min"),
+        'password_reset': os.environ.get("THROTTLE_PASSWORD_RESET", default="20/min"),
+        'password_reset_account': os.environ.get("THROTTLE_PASSWORD_RESET_ACCOUNT", default="5/min"),
+    },
+    # Reverse proxies in front of the app. The client IP of the throttles is
+    # taken from X-Forwarded-For only that many hops back; with 0 it is the
+    # peer address, so clients cannot choose their bucket with the header.
+    'NUM_PROXIES': int(os.environ.get("NUM_PROXIES", default=0)),
 }
 
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=5),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1)
-}
\ No newline at end of file
+}
+
+
+# Metrics
+# If set, GET /metrics requires "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", default="")
+
+# Request profiling (see core.profiling). When enabled, a share of
+# REQUEST_PROFILING_SAMPLE_RATE of all requests and every request with a signed
+# X-Videoflix-Profile header is profiled into REQUEST_PROFILING_DIR.
+REQUEST_PROFILING_ENABLED = os.environ.get("REQUEST_PROFILING_ENABLED", default="False") == "True"
+REQUEST_PROFILING_SAMPLE_RATE = float(os.environ.get("REQUEST_PROFILING_SAMPLE_RATE", default="0"))
+REQUEST_PROFILING_INTERVAL_MS = float(os.environ.get("REQUEST_PROFILING_INTERVAL_MS", default="5"))
+REQUEST_PROFILING_DIR = os.environ.get("REQUEST_PROFILING_DIR") or str(BASE_DIR / "profiles")
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.environ.get("LOG_LEVEL", default="INFO"),
+    },
+}
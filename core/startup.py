@@ -0,0 +1,84 @@
+"""
+Startup profiling and warm-up of web and worker processes.
+
+profile_imports() starts a fresh interpreter with `python -X importtime`
+running one of the STARTUP_TARGETS and parses the import time of every
+module from its stderr, so the cost of booting a replica can be attributed
+to the packages that cause it (see the profile_startup command).
+
+warm_up() loads the URLconf, and with it every view, serializer and the
+simplejwt and DRF machinery they import, at boot. Django would otherwise
+import them lazily during the first request of every worker. Under gunicorn
+with preload_app (gunicorn.conf.py) this happens once in the master, and the
+forked workers share the imported modules.
+"""
+
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.urls import get_resolver
+
+# Code run by the profiled interpreter per target.
+STARTUP_TARGETS = {
+    "setup": "import django; django.setup()",
+    "web": "import core.wsgi",
+    "worker": "import django; django.setup(); import auth_app.tasks, content_app.tasks",
+}
+
+# "import time: self [us] | cumulative | imported package", nested imports are indented.
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def warm_up():
+    """ Import the URLconf and all views it references. """
+    get_resolver().url_patterns
+
+
+def parse_importtime(output: str):
+    """
+    Parse the stderr of `python -X importtime`.
+
+    Returns:
+        list[tuple]: (module, self microseconds, cumulative microseconds, depth)
+        per imported module, in import order.
+    """
+    imports = []
+    for line in output.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            imports.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return imports
+
+
+def group_by_package(imports):
+    """ Return the summed self time in microseconds per top-level package, largest first. """
+    packages = defaultdict(int)
+    for module, self_us, _, _ in imports:
+        packages[module.split(".")[0]] += self_us
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+def profile_imports(target: str):
+    """
+    Run a STARTUP_TARGETS entry in a new interpreter with import time tracing.
+
+    Returns:
+        tuple: The parsed imports (see parse_importtime()) and the wall-clock
+        seconds of the whole process.
+
+    Raises:
+        subprocess.CalledProcessError: If the target fails to start.
+    """
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "core.settings")}
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_TARGETS[target]],
+        check=True, capture_output=True, text=True, env=env, cwd=settings.BASE_DIR,
+    )
+    return parse_importtime(result.stderr), time.perf_counter() - start
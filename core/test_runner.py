@@ -0,0 +1,27 @@
+"""
+Test runner of the project.
+
+The token buckets of auth_app.api.throttles live in the real Redis and
+survive a test and the whole run, so logins and registrations of earlier
+tests (or runs) would throttle the following ones. Tests therefore run
+without throttle rates; tests of the throttles set the rates they need
+with override_settings().
+"""
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.throttle_rates = override_settings(
+            REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}}
+        )
+        self.throttle_rates.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.throttle_rates.disable()
+        super().teardown_test_environment(**kwargs)
@@ -20,12 +20,14 @@ from django.urls import path, include
 from django.conf.urls.static import static
 
 from auth_app.api.views import csrf
+from core.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('auth_app.api.urls')),
     path('api/', include('content_app.api.urls')),
-    path('csrf/', csrf)
+    path('csrf/', csrf),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
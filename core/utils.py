@@ -0,0 +1,12 @@
+"""
+Helpers shared by the apps.
+"""
+
+from itertools import islice
+
+
+def batched(iterable, size: int):
+    """ Yield lists of `size` items of `iterable`, the last one possibly shorter (itertools.batched from 3.12). """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
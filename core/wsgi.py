@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+# Import all views now instead of in the first request (see core.startup)
+from core.startup import warm_up  # noqa: E402
+
+warm_up()
@@ -0,0 +1,22 @@
+"""
+Gunicorn settings, loaded automatically from the working directory.
+
+Outside of development the application is loaded once in the master before
+the workers are forked (preload_app), so a new worker starts with Django set
+up and all views imported (see core.startup.warm_up). Code reloading needs
+every worker to import the application itself and is only enabled with DEBUG.
+
+In Prometheus multiprocess mode the metric files of an exited worker have to
+be marked dead so its gauges are not reported any more.
+"""
+
+import os
+
+reload = os.environ.get("DEBUG", "True") == "True"
+preload_app = not reload
+
+
+def child_exit(server, worker):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)